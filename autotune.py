@@ -0,0 +1,297 @@
+import argparse
+import json
+import re
+import sqlite3
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+import faiss
+import numpy as np
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from config import Config
+from models.chat_history import ChatHistory
+from models.index_builder import to_hnsw
+from models.llm_scheduler import estimate_tokens
+from models.llm_stub import StubChatModel
+from models.prompts import PromptManager
+from models.reranker import LexicalScorer, Reranker
+from utils import fold_vietnamese, load_table_data
+
+# Named entities a question can mention, used to label the documents it should retrieve
+ENTITY_QUERIES = {
+    "Product": "SELECT Id, TRIM(Name) FROM Product",
+    "Store": "SELECT Id, TRIM(Name) FROM Store",
+    "Categories": "SELECT Id, TRIM(Name) FROM Categories",
+}
+
+# Searched parameters; reranking replaces top_k_results with retrieval_candidates/rerank_top_n
+INDEX_TYPES = ["flat", "hnsw"]
+TOP_K = [3, 5, 8]
+RETRIEVAL_CANDIDATES = [10, 20]
+RERANK_TOP_N = [2, 3]
+HISTORY_TURNS = [0, 3, 5]
+
+
+def load_queries(paths: List[str], field: str = "query") -> List[str]:
+    """Questions from JSONL files (``field`` per line) or chat_history.json
+
+    "question" is also accepted for the default field. Entries that are not
+    JSON or have no question are skipped and counted per file.
+    """
+    queries = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                entries = []
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        entries.append(None)
+            else:
+                entries = json.load(f)
+
+        found = []
+        for entry in entries:
+            query = entry.get(field) if isinstance(entry, dict) else None
+            if query is None and field == "query" and isinstance(entry, dict):
+                query = entry.get("question")
+            if isinstance(query, str) and query.strip():
+                found.append(query)
+        skipped = len(entries) - len(found)
+        print(f"{path}: {len(found)} queries" + (f", {skipped} entries skipped (not JSON or no '{field}')"
+                                                 if skipped else ""))
+        queries.extend(found)
+    # Keep the first occurrence of each question, in order
+    return list(dict.fromkeys(query for query in queries if query))
+
+
+def label_queries(db_path: str, queries: List[str]) -> List[Dict[str, Any]]:
+    """Label each question with the rows of the products, stores and categories it names"""
+    conn = sqlite3.connect(db_path)
+    entities = []
+    for table, sql in ENTITY_QUERIES.items():
+        for row_id, name in conn.execute(sql).fetchall():
+            folded = fold_vietnamese(name or "")
+            if len(folded) >= 3:
+                entities.append((table, row_id, re.compile(rf"\b{re.escape(folded)}\b")))
+    conn.close()
+
+    labelled = []
+    for query in queries:
+        folded_query = fold_vietnamese(query)
+        expected = [[table, row_id] for table, row_id, pattern in entities if pattern.search(folded_query)]
+        labelled.append({"query": query, "expected": expected})
+    return labelled
+
+
+class Corpus:
+    """Documents, their vectors and the candidate indexes for one embedding model"""
+
+    def __init__(self, embedding_model: str, documents: List[Dict[str, Any]], queries: List[str]):
+        self.embedding_model = embedding_model
+        self.texts = [doc["content"] for doc in documents]
+        self.keys = [(doc["metadata"]["table"], doc["metadata"]["id"]) for doc in documents]
+
+        embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
+        vectors = np.array(embeddings.embed_documents(self.texts), dtype="float32")
+
+        # Same metric as the LangChain FAISS store: exact L2
+        flat = faiss.IndexFlatL2(vectors.shape[1])
+        flat.add(vectors)
+        self.indexes = {"flat": flat, "hnsw": to_hnsw(flat)}
+
+        # Query embedding cost does not depend on the other parameters, so measure it once
+        self.query_vectors, self.embed_ms = [], []
+        for query in queries:
+            start = time.perf_counter()
+            self.query_vectors.append(np.array([embeddings.embed_query(query)], dtype="float32"))
+            self.embed_ms.append((time.perf_counter() - start) * 1000)
+
+
+class _Doc:
+    """Retrieved document in the shape the reranker expects"""
+
+    def __init__(self, text: str, key: Tuple[str, Any]):
+        self.page_content = text
+        self.metadata = {"table": key[0], "id": key[1]}
+
+
+def candidate_settings(embedding_models: List[str]) -> List[Dict[str, Any]]:
+    settings = []
+    for model in embedding_models:
+        for index_type in INDEX_TYPES:
+            for turns in HISTORY_TURNS:
+                base = {"embedding_model": model, "vector_index_type": index_type, "chat_history_turns": turns}
+                for top_k in TOP_K:
+                    settings.append(dict(base, reranker="none", top_k_results=top_k))
+                for candidates in RETRIEVAL_CANDIDATES:
+                    for top_n in RERANK_TOP_N:
+                        settings.append(dict(base, reranker="lexical", retrieval_candidates=candidates,
+                                             rerank_top_n=top_n))
+    return settings
+
+
+def evaluate(corpus: Corpus, labelled: List[Dict[str, Any]], setting: Dict[str, Any]) -> Dict[str, Any]:
+    """Replay the query set through retrieval, prompt building and the stub LLM"""
+    index = corpus.indexes[setting["vector_index_type"]]
+    reranker = None
+    if setting["reranker"] == "lexical":
+        reranker = Reranker(LexicalScorer(), top_n=setting["rerank_top_n"], min_score=Config.rerank_min_score,
+                            time_budget_ms=Config.rerank_time_budget_ms, rank_weight=0.3)
+    k = setting["retrieval_candidates"] if reranker else setting["top_k_results"]
+
+    # The stub "answers" with the top document, so history grows like a grounded reply
+    reply = {"text": ""}
+    llm = StubChatModel(responder=lambda prompt: reply["text"])
+
+    history = ChatHistory(history_file="", max_history=setting["chat_history_turns"])
+    stages = {"embed": [], "search": [], "rerank": [], "prompt": [], "llm": []}
+    tokens, hits, labelled_count = [], 0, 0
+
+    for i, entry in enumerate(labelled):
+        stages["embed"].append(corpus.embed_ms[i])
+
+        start = time.perf_counter()
+        _, ids = index.search(corpus.query_vectors[i], k)
+        docs = [_Doc(corpus.texts[j], corpus.keys[j]) for j in ids[0] if j >= 0]
+        stages["search"].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        if reranker is not None:
+            docs = reranker.rerank(entry["query"], docs)
+        stages["rerank"].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        prompt = PromptManager.get_vector_prompt(
+            [doc.page_content for doc in docs], entry["query"], history.get_recent_history()
+        )
+        stages["prompt"].append((time.perf_counter() - start) * 1000)
+        tokens.append(estimate_tokens(prompt))
+
+        reply["text"] = docs[0].page_content if docs else ""
+        start = time.perf_counter()
+        answer = llm.invoke(prompt).content
+        stages["llm"].append((time.perf_counter() - start) * 1000)
+        if setting["chat_history_turns"]:
+            history.history = (history.history + [{"query": entry["query"], "response": answer}])[
+                -setting["chat_history_turns"]:]
+
+        if entry["expected"]:
+            labelled_count += 1
+            retrieved = {(doc.metadata["table"], doc.metadata["id"]) for doc in docs}
+            hits += int(any(tuple(key) in retrieved for key in entry["expected"]))
+
+    latency = {stage: statistics.mean(values) for stage, values in stages.items()}
+    return {
+        "setting": setting,
+        "hit_rate": hits / labelled_count if labelled_count else 0.0,
+        "prompt_tokens": statistics.mean(tokens),
+        "latency_ms": latency,
+        "total_ms": sum(latency.values()),
+    }
+
+
+def objectives(result: Dict[str, Any]) -> Tuple[float, float, float]:
+    """Values to minimise; latency is rounded to 0.1 ms so timing noise does not decide"""
+    return -result["hit_rate"], result["prompt_tokens"], round(result["total_ms"], 1)
+
+
+def dominates(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """a is at least as good as b on every objective and better on one"""
+    a_values, b_values = objectives(a), objectives(b)
+    return all(x <= y for x, y in zip(a_values, b_values)) and a_values != b_values
+
+
+def pareto_front(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    front = [r for r in results if not any(dominates(other, r) for other in results)]
+    return sorted(front, key=objectives)
+
+
+def recommend(front: List[Dict[str, Any]], tolerance: float) -> Dict[str, Any]:
+    """Cheapest prompt within ``tolerance`` of the best hit rate, then the fastest"""
+    best = max(r["hit_rate"] for r in front)
+    eligible = [r for r in front if r["hit_rate"] >= best - tolerance]
+    return min(eligible, key=lambda r: (r["prompt_tokens"], r["total_ms"]))
+
+
+def describe(setting: Dict[str, Any]) -> str:
+    if setting["reranker"] == "none":
+        retrieval = f"top_k={setting['top_k_results']}"
+    else:
+        retrieval = f"rerank {setting['retrieval_candidates']}->{setting['rerank_top_n']}"
+    return (f"{setting['embedding_model'].split('/')[-1][:28]:28} {setting['vector_index_type']:5} "
+            f"{retrieval:16} history={setting['chat_history_turns']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep retrieval settings offline and recommend a Config")
+    parser.add_argument("--queries", default="autotune_queries.jsonl",
+                        help="Labelled query set ({'query', 'expected': [[table, id], ...]} per line)")
+    parser.add_argument("--seed", nargs="*",
+                        help="Create the labelled query set from these files (JSONL with 'query', or chat_history.json)")
+    parser.add_argument("--field", default="query",
+                        help="JSON field holding the question in --seed files (e.g. 'title')")
+    parser.add_argument("--embedding-models", nargs="*", default=[Config.embedding_model],
+                        help="Embedding models to compare")
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="Hit rate the recommendation may give up for shorter prompts")
+    parser.add_argument("--output", help="Write every result as JSON to this file")
+    args = parser.parse_args()
+
+    if args.seed:
+        seeds = load_queries(args.seed, field=args.field)
+        if not seeds:
+            raise SystemExit(f"No queries found in {', '.join(args.seed)}: check --field")
+        labelled = label_queries(Config.db_path, seeds)
+        with open(args.queries, "w", encoding="utf-8") as f:
+            for entry in labelled:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"Wrote {len(labelled)} queries ({sum(bool(e['expected']) for e in labelled)} labelled) "
+              f"to {args.queries}; review the labels before tuning")
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        labelled = [json.loads(line) for line in f if line.strip()]
+    if not any(entry["expected"] for entry in labelled):
+        raise SystemExit("No labelled queries: add expected [table, id] pairs to the query set")
+
+    documents = load_table_data(Config.db_path, Config.document_templates)
+    queries = [entry["query"] for entry in labelled]
+    corpora = {model: Corpus(model, documents, queries) for model in args.embedding_models}
+
+    results = [
+        evaluate(corpora[setting["embedding_model"]], labelled, setting)
+        for setting in candidate_settings(args.embedding_models)
+    ]
+    front = pareto_front(results)
+
+    print(f"\n=== Pareto front ({len(front)} of {len(results)} settings) ===")
+    print(f"{'setting':70} {'hit rate':>8} {'tokens':>7} {'ms':>7}  stages (ms)")
+    for result in front:
+        stages = " ".join(f"{stage}={ms:.1f}" for stage, ms in result["latency_ms"].items())
+        print(f"{describe(result['setting']):70} {result['hit_rate']:8.2f} {result['prompt_tokens']:7.0f} "
+              f"{result['total_ms']:7.1f}  {stages}")
+
+    best = recommend(front, args.tolerance)
+    print("\n=== Recommended Config ===")
+    print(f"hit rate {best['hit_rate']:.2f}, {best['prompt_tokens']:.0f} prompt tokens, {best['total_ms']:.1f} ms")
+    print("Config(")
+    for field, value in best["setting"].items():
+        print(f"    {field}={value!r},")
+    print(")")
+    if best["setting"]["chat_history_turns"] < Config.chat_history_turns:
+        print("Note: the replay only measures the prompt cost of history, not its value for follow-up "
+              "questions; keep more turns if conversations rely on them")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "pareto_front": front, "recommended": best}, f,
+                      ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import json
+import statistics
+import time
+from dataclasses import replace
+
+from config import Config
+from models.rag_system import OptimizedRAGSystem
+from utils import execute_sql_query
+
+DEFAULT_QUESTIONS = [
+    "Sản phẩm nào bán chạy nhất?",
+    "Cửa hàng nào có doanh thu cao nhất?",
+    "Danh mục nào có đánh giá trung bình cao nhất?",
+    "Khách hàng nào chi tiêu nhiều nhất?",
+    "Có bao nhiêu cửa hàng?",
+    "Liệt kê 5 đồ uống có nhiều caffeine nhất",
+    "Tôi buồn ngủ thì nên uống gì?",
+    "Giới thiệu về Caramel Macchiato",
+    "Đồ uống nào ít đường phù hợp cho người ăn kiêng?",
+    "Cửa hàng mở cửa lúc mấy giờ?",
+]
+
+
+def load_questions(path: str) -> list:
+    """Questions from a JSONL file ({"query": ...} per line) or chat_history.json"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line)["query"] for line in f if line.strip()]
+        return [entry["query"] for entry in json.load(f)]
+
+
+def run_two_call(rag: OptimizedRAGSystem, question: str, schema: str):
+    needs_sql = rag._needs_calculation(question)
+    sql_query = None
+    if needs_sql:
+        try:
+            sql_query = rag._generate_sql(question, schema=schema)
+        except ValueError as e:
+            print(f"Two-call flow produced invalid SQL: {e}")
+    return needs_sql, sql_query
+
+
+def run_combined(rag: OptimizedRAGSystem, question: str, schema: str):
+    decision = rag._route_and_generate_sql(question, schema=schema)
+    return decision if decision is not None else (None, None)
+
+
+def same_results(config: Config, first: str, second: str) -> bool:
+    """Compare result sets of two SQL queries, ignoring row order and column names"""
+    rows = []
+    for sql_query in (first, second):
+        results = execute_sql_query(config.db_path, sql_query, config.db_timeout)
+        rows.append(sorted(tuple(str(v) for v in result.values()) for result in results))
+    return rows[0] == rows[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two-call routing + SQL generation with the combined call")
+    parser.add_argument("--questions", help="JSONL file with a 'query' field, or chat_history.json")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per question")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions) if args.questions else DEFAULT_QUESTIONS
+    config = replace(Config(), speculative_retrieval=False)
+    rag = OptimizedRAGSystem(config)
+    schema = rag._get_database_schema()
+
+    timings = {"two_call": [], "combined": []}
+    route_agreement, sql_checked, sql_agreement, invalid = 0, 0, 0, 0
+
+    for question in questions:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            two_call = run_two_call(rag, question, schema)
+            timings["two_call"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            combined = run_combined(rag, question, schema)
+            timings["combined"].append(time.perf_counter() - start)
+
+            if combined[0] is None:
+                invalid += 1
+                continue
+            if combined[0] == two_call[0]:
+                route_agreement += 1
+                if two_call[0] and two_call[1] and combined[1]:
+                    sql_checked += 1
+                    sql_agreement += int(same_results(config, two_call[1], combined[1]))
+
+            print(f"{question[:50]:50} two-call={two_call[0]!s:5} combined={combined[0]!s:5}")
+
+    runs = len(questions) * args.repeat
+    print("\n=== Routing benchmark ===")
+    for mode, values in timings.items():
+        print(f"{mode:9} mean {statistics.mean(values):.3f}s  median {statistics.median(values):.3f}s  "
+              f"max {max(values):.3f}s")
+    print(f"Route agreement: {route_agreement}/{runs - invalid} ({invalid} invalid combined responses)")
+    if sql_checked:
+        print(f"Same SQL results on agreed SQL routes: {sql_agreement}/{sql_checked}")
+    for model, scheduler in rag.schedulers.items():
+        print(f"LLM scheduler stats ({model}): {scheduler.stats}")
+
+
+if __name__ == "__main__":
+    main()
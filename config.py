@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, Dict, Optional
 
 # Load environment variables
 load_dotenv()
@@ -16,18 +17,94 @@ class Config:
     db_path: str = str(base_dir / "Database.db")
     db_timeout: int = 30
     
+    # Analytics layer (summary tables + indexes maintained by triggers)
+    enable_analytics: bool = True
+    
+    # Name search layer (accent-insensitive FTS5 tables fts_* maintained by triggers)
+    enable_search_index: bool = True
+    
     # Vector store configuration
     vector_store_path: str = str(base_dir / "vector_store")
     top_k_results: int = 5
+    expand_documents: int = 1           # Top retrieved documents given their full source row in the prompt
+    vector_index_type: str = "flat"     # "flat" (exact) or "hnsw" (approximate), applied by the index builder
+    chat_history_turns: int = 5         # Previous turns included in response prompts
+    chat_history_file: str = "chat_history.json"  # Empty keeps the history in memory only
+    
+    # Reranking: retrieve many candidates, keep the best few for the prompt
+    reranker: str = "lexical"           # "lexical", "cross_encoder" or "none"
+    cross_encoder_model: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    retrieval_candidates: int = 20
+    rerank_top_n: int = 3
+    rerank_min_score: float = 0.15
+    rerank_time_budget_ms: float = 50.0
+    document_templates: Optional[Dict[str, Any]] = None  # Per-table overrides of DOCUMENT_TEMPLATES
+    index_watch_interval: float = 10.0  # Seconds between checks for a new index version (0 disables)
+    index_keep_versions: int = 5        # Published index versions kept for rollback
+    build_missing_index: bool = False   # Build the first index in-process if none is published (single process only)
+    vector_store_mmap: bool = True      # Memory-map the FAISS vectors (shared between processes)
+    speculative_retrieval: bool = True  # Retrieve and prepare schema while routing
+    combined_routing: bool = False      # One JSON call returns both the route and the SQL
+    
+    # Local answers for simple store/product lookups, without LLM calls
+    enable_fast_path: bool = True
+    fast_path_min_confidence: float = 0.8
+    
+    # Product recommendations added to the customer context
+    enable_recommendations: bool = True
+    recommendation_count: int = 5
     
     # Model configuration
     embedding_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-    llm_model: str = "gemini-1.5-pro"
+    llm_model: str = "gemini-1.5-pro"   # Larger model, used when the responder's output fails validation
     llm_temperature: float = 0.7
     
+    # Per-task models: routing and SQL need no reasoning power and must be deterministic
+    router_model: str = "gemini-1.5-flash"
+    router_temperature: float = 0.0
+    sql_model: str = "gemini-1.5-flash"
+    sql_temperature: float = 0.0
+    responder_model: str = "gemini-1.5-flash"
+    responder_temperature: float = 0.7
+    
+    # LLM quota, applied per model: each model in task_models() has its own LLMScheduler
+    llm_requests_per_minute: int = 15
+    llm_tokens_per_minute: int = 1_000_000
+    llm_max_concurrency: int = 4
+    llm_max_retries: int = 4
+    
+    # Face login configuration
+    face_threshold: float = 0.5       # Max cosine distance for a match
+    face_margin: float = 0.05         # Min distance gap between best match and runner-up
+    face_min_samples: int = 3         # Face crops averaged before a match is accepted
+    face_detect_every_n: int = 2      # Run YOLO on every Nth frame
+    face_detect_scale: float = 0.5    # Down-scale factor for the detection frame
+    face_batch_size: int = 4          # Face crops embedded per FaceNet call
+    face_max_seconds: float = 10.0    # Give up after this long without a stable match
+    face_capture_source: str = os.getenv("FACE_CAPTURE_SOURCE", "0")  # Camera index, video file or image directory
+    face_index_type: str = "exact"    # "exact", or "hnsw"/"ivf" for the FAISS face index
+    face_index_path: str = str(base_dir / "face_index")
+    
+    # HTTP serving (server.py); Streamlit becomes a thin client when rag_server_url is set
+    server_host: str = os.getenv("RAG_SERVER_HOST", "0.0.0.0")
+    server_port: int = int(os.getenv("RAG_SERVER_PORT", "8000"))
+    server_workers: int = int(os.getenv("RAG_SERVER_WORKERS", "2"))
+    rag_server_url: Optional[str] = os.getenv("RAG_SERVER_URL")
+    session_history_db: str = str(base_dir / "chat_sessions.db")  # Per-session history shared by all workers
+    session_history_ttl_hours: float = 24.0                          # Sessions idle this long are dropped
+    
     # API Keys
     google_api_key: str = os.getenv("GOOGLE_API_KEY")
     
+    def task_models(self) -> dict:
+        """(model, temperature) for each LLM task"""
+        return {
+            "router": (self.router_model, self.router_temperature),
+            "sql_generator": (self.sql_model, self.sql_temperature),
+            "responder": (self.responder_model, self.responder_temperature),
+            "responder_escalation": (self.llm_model, self.llm_temperature),
+        }
+    
     def __post_init__(self):
         """Ensure paths exist"""
         os.makedirs(self.vector_store_path, exist_ok=True)
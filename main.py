@@ -1,24 +1,29 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import replace
+from typing import Any, Dict, Iterator, Optional, Set
+
 from config import Config
+from models.chat_history import ChatHistory
 from models.rag_system import OptimizedRAGSystem
 
 
-def main():
-    # Initialize configuration
-    config = Config()
-    
-    # Create RAG system
-    rag = OptimizedRAGSystem(config)
-    
+def interactive(rag: OptimizedRAGSystem):
     # Interactive loop
     print("Enhanced RAG System Ready!")
     print("Enter your questions (type 'quit' to exit)")
     print("Type 'history' to view chat history")
     print("Type 'clear' to clear chat history")
     print("="*50)
-    
+
     while True:
         query = input("\nYour question: ").strip()
-        
+
         if query.lower() == 'quit':
             break
         elif query.lower() == 'history':
@@ -36,12 +41,158 @@ def main():
             rag.chat_history.clear_history()
             print("\nChat history cleared.")
             continue
-            
+
         print("\nProcessing...")
         response = rag.answer_query(query)
         print("\nAnswer:", response)
         print("\n" + "="*50)
 
+
+def read_queries(path: str, field: str = "query", id_field: str = "id",
+                 counts: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+    """Stream {"id", "query", "customer_id"} records from a JSONL file
+
+    The question is read from ``field`` ("question" is also accepted for the
+    default field) and the id from ``id_field``, defaulting to the line
+    number so an unchanged input file resumes correctly. Lines that are not
+    JSON or have no question are skipped and counted in ``counts["invalid"]``.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                entry = None
+            if not isinstance(entry, dict):
+                entry = {}
+            query = entry.get(field)
+            if query is None and field == "query":
+                query = entry.get("question")
+            if not isinstance(query, str) or not query.strip():
+                if counts is not None:
+                    counts["invalid"] += 1
+                    if counts["invalid"] <= 5:
+                        print(f"Skipping line {line_number}: not JSON or no '{field}' field")
+                continue
+            yield {
+                "id": entry.get(id_field, line_number),
+                "query": query,
+                "customer_id": entry.get("customer_id"),
+            }
+
+
+def completed_ids(path: str, retry_errors: bool) -> Set[Any]:
+    """Ids already in the results file; a torn last line from an interruption is ignored"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not (retry_errors and result.get("error")):
+                done.add(result["id"])
+    return done
+
+
+def run_batch(rag: OptimizedRAGSystem, input_path: str, output_path: str, workers: int,
+              retry_errors: bool = False, field: str = "query", id_field: str = "id") -> Dict[str, int]:
+    """Answer every query in input_path concurrently, appending results as they finish"""
+    done = completed_ids(output_path, retry_errors)
+    if done:
+        print(f"Resuming: {len(done)} queries already answered")
+
+    # Make sure an interrupted final line does not glue onto the next result
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+        if needs_newline:
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    counts = {"answered": 0, "errors": 0, "skipped": 0, "invalid": 0}
+    write_lock = threading.Lock()
+    start_time = time.time()
+
+    def answer(entry: Dict[str, Any]):
+        profile = rag.profiles.get_profile(entry["customer_id"]) if entry["customer_id"] is not None else None
+        details = rag.answer_query_details(entry["query"], customer_profile=profile, save_history=False)
+        result = {**entry, **details}
+        with write_lock:
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            counts["answered"] += 1
+            counts["errors"] += int(details["error"] is not None)
+            if counts["answered"] % 10 == 0:
+                rate = counts["answered"] / (time.time() - start_time)
+                print(f"Answered {counts['answered']} queries ({rate:.2f}/s, {counts['errors']} errors)")
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as executor:
+        # Bounded number of queries in flight, so the input is streamed rather than loaded
+        pending = set()
+        try:
+            for entry in read_queries(input_path, field, id_field, counts):
+                if entry["id"] in done:
+                    counts["skipped"] += 1
+                    continue
+                if len(pending) >= workers * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+                pending.add(executor.submit(answer, entry))
+            for future in pending:
+                future.result()
+        except KeyboardInterrupt:
+            print("Interrupted; finished results are saved, run the same command again to resume")
+            for future in pending:
+                future.cancel()
+            raise
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enhanced RAG System")
+    subparsers = parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser("batch", help="Answer a JSONL file of queries")
+    batch_parser.add_argument("input", help="JSONL file with a 'query' field (optional 'id', 'customer_id')")
+    batch_parser.add_argument("--output", default="batch_results.jsonl", help="JSONL results file (appended)")
+    batch_parser.add_argument("--workers", type=int, default=8, help="Queries processed concurrently")
+    batch_parser.add_argument("--llm-concurrency", type=int, default=Config.llm_max_concurrency,
+                              help="Maximum LLM calls in flight per model; each model has its own quota "
+                                   "and scheduler, so the total can reach this times the number of models")
+    batch_parser.add_argument("--retry-errors", action="store_true", help="Re-run queries whose result was an error")
+    batch_parser.add_argument("--field", default="query", help="JSON field holding the question (e.g. body)")
+    batch_parser.add_argument("--id-field", default="id", help="JSON field holding the record id (e.g. request_id)")
+    args = parser.parse_args()
+
+    # Initialize configuration
+    config = Config()
+
+    if args.command != "batch":
+        # Create RAG system; a single process may build the first index itself
+        interactive(OptimizedRAGSystem(replace(config, build_missing_index=True)))
+        return
+
+    # Batch queries are independent: no chat history in the prompts, none written
+    rag = OptimizedRAGSystem(replace(config, llm_max_concurrency=args.llm_concurrency, index_watch_interval=0))
+    rag.chat_history = ChatHistory(history_file="", max_history=0)
+
+    start_time = time.time()
+    counts = run_batch(rag, args.input, args.output, args.workers, args.retry_errors, args.field, args.id_field)
+    print(f"Answered {counts['answered']} queries ({counts['errors']} errors, {counts['skipped']} already done, "
+          f"{counts['invalid']} lines without '{args.field}') in {time.time() - start_time:.1f}s; "
+          f"results in {args.output}")
+    for model, scheduler in rag.schedulers.items():
+        print(f"LLM scheduler stats ({model}): {scheduler.stats}")
+    if counts["answered"] + counts["skipped"] == 0:
+        print(f"No queries found in {args.input}: use --field to name the JSON field holding the question")
+        sys.exit(1)
+
 if __name__ == "__main__":
-    main() 
-    
\ No newline at end of file
+    main()
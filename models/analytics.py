@@ -0,0 +1,314 @@
+import sqlite3
+from pathlib import Path
+from typing import Dict, List
+
+# Get base directory
+BASE_DIR = Path(__file__).parent.parent
+
+SUMMARY_PREFIX = "summary_"
+
+# Supporting indexes for the joins used by the summaries and by generated SQL
+INDEXES = {
+    "idx_orders_customer_id": "Orders(Customer_id)",
+    "idx_orders_store_id": "Orders(Store_id)",
+    "idx_order_detail_product_id": "Order_detail(Product_id)",
+    "idx_product_categories_id": "Product(Categories_id)",
+}
+
+# Matches a category id inside the comma separated Customer_preferences list
+_PREFERS_CATEGORY = "(',' || replace(cp.Preferred_categories, ' ', '') || ',') LIKE '%,' || c.Id || ',%'"
+
+# Each summary is a materialised GROUP BY keyed by one column.
+# "select" must contain a {filter} placeholder on "filter_column" so that a
+# single key (or set of keys) can be recomputed without touching the rest.
+SUMMARIES = {
+    "summary_product_sales": {
+        "key": "Product_id",
+        "filter_column": "p.Id",
+        "ddl": """
+            Product_id INTEGER PRIMARY KEY,
+            Product_name TEXT,
+            Product_prep TEXT,
+            Categories_id INTEGER,
+            Units_sold INTEGER,
+            Order_count INTEGER,
+            Revenue REAL,
+            Avg_price REAL,
+            Avg_rate REAL
+        """,
+        "select": """
+            SELECT p.Id, p.Name, p.Product_Prep, p.Categories_id,
+                   COALESCE(SUM(od.Quantity), 0),
+                   COUNT(od.Order_id),
+                   COALESCE(SUM(od.Quantity * od.Price), 0),
+                   AVG(od.Price),
+                   AVG(od.Rate)
+            FROM Product p
+            LEFT JOIN Order_detail od ON od.Product_id = p.Id
+            WHERE {filter}
+            GROUP BY p.Id
+        """,
+        "description": "Doanh số theo sản phẩm: số lượng bán (Units_sold), số đơn (Order_count), "
+                       "doanh thu (Revenue), giá bán trung bình (Avg_price), đánh giá trung bình của đơn hàng (Avg_rate)",
+    },
+    "summary_store_revenue": {
+        "key": "Store_id",
+        "filter_column": "s.Id",
+        "ddl": """
+            Store_id INTEGER PRIMARY KEY,
+            Store_name TEXT,
+            Order_count INTEGER,
+            Customer_count INTEGER,
+            Units_sold INTEGER,
+            Revenue REAL
+        """,
+        "select": """
+            SELECT s.Id, s.Name,
+                   (SELECT COUNT(*) FROM Orders o WHERE o.Store_id = s.Id),
+                   (SELECT COUNT(DISTINCT o.Customer_id) FROM Orders o WHERE o.Store_id = s.Id),
+                   (SELECT COALESCE(SUM(od.Quantity), 0)
+                    FROM Orders o JOIN Order_detail od ON od.Order_id = o.Id
+                    WHERE o.Store_id = s.Id),
+                   (SELECT COALESCE(SUM(od.Quantity * od.Price), 0)
+                    FROM Orders o JOIN Order_detail od ON od.Order_id = o.Id
+                    WHERE o.Store_id = s.Id)
+            FROM Store s
+            WHERE {filter}
+        """,
+        "description": "Doanh thu theo cửa hàng: số đơn (Order_count), số khách (Customer_count), "
+                       "số lượng bán (Units_sold), doanh thu (Revenue)",
+    },
+    "summary_category_stats": {
+        "key": "Category_id",
+        "filter_column": "c.Id",
+        "ddl": """
+            Category_id INTEGER PRIMARY KEY,
+            Category_name TEXT,
+            Product_count INTEGER,
+            Avg_product_rating REAL,
+            Units_sold INTEGER,
+            Revenue REAL,
+            Avg_rate REAL,
+            Preferred_by_customers INTEGER,
+            Avg_max_price REAL
+        """,
+        "select": f"""
+            SELECT c.Id, c.Name,
+                   (SELECT COUNT(*) FROM Product p WHERE p.Categories_id = c.Id),
+                   (SELECT AVG(p.Rating) FROM Product p WHERE p.Categories_id = c.Id),
+                   (SELECT COALESCE(SUM(od.Quantity), 0)
+                    FROM Product p JOIN Order_detail od ON od.Product_id = p.Id
+                    WHERE p.Categories_id = c.Id),
+                   (SELECT COALESCE(SUM(od.Quantity * od.Price), 0)
+                    FROM Product p JOIN Order_detail od ON od.Product_id = p.Id
+                    WHERE p.Categories_id = c.Id),
+                   (SELECT AVG(od.Rate)
+                    FROM Product p JOIN Order_detail od ON od.Product_id = p.Id
+                    WHERE p.Categories_id = c.Id),
+                   (SELECT COUNT(DISTINCT cp.Customer_id) FROM Customer_preferences cp
+                    WHERE {_PREFERS_CATEGORY}),
+                   (SELECT AVG(cp.Max_price) FROM Customer_preferences cp
+                    WHERE {_PREFERS_CATEGORY})
+            FROM Categories c
+            WHERE {{filter}}
+        """,
+        "description": "Thống kê theo danh mục: số sản phẩm (Product_count), điểm Rating trung bình của sản phẩm "
+                       "(Avg_product_rating), số lượng bán, doanh thu, đánh giá trung bình của đơn hàng (Avg_rate), "
+                       "số khách yêu thích danh mục (Preferred_by_customers), mức giá tối đa trung bình (Avg_max_price)",
+    },
+    "summary_customer_spending": {
+        "key": "Customer_id",
+        "filter_column": "cu.id",
+        "ddl": """
+            Customer_id INTEGER PRIMARY KEY,
+            Customer_name TEXT,
+            Order_count INTEGER,
+            Units_bought INTEGER,
+            Total_spent REAL,
+            Avg_order_value REAL
+        """,
+        "select": """
+            SELECT cu.id, cu.name,
+                   (SELECT COUNT(*) FROM Orders o WHERE o.Customer_id = cu.id),
+                   (SELECT COALESCE(SUM(od.Quantity), 0)
+                    FROM Orders o JOIN Order_detail od ON od.Order_id = o.Id
+                    WHERE o.Customer_id = cu.id),
+                   (SELECT COALESCE(SUM(od.Quantity * od.Price), 0)
+                    FROM Orders o JOIN Order_detail od ON od.Order_id = o.Id
+                    WHERE o.Customer_id = cu.id),
+                   (SELECT SUM(od.Quantity * od.Price) / COUNT(DISTINCT o.Id)
+                    FROM Orders o JOIN Order_detail od ON od.Order_id = o.Id
+                    WHERE o.Customer_id = cu.id)
+            FROM customers cu
+            WHERE {filter}
+        """,
+        "description": "Chi tiêu theo khách hàng: số đơn (Order_count), số lượng mua (Units_bought), "
+                       "tổng chi tiêu (Total_spent), giá trị đơn trung bình (Avg_order_value)",
+    },
+}
+
+# Source table -> events -> (summary, key subquery) pairs to recompute.
+# Key subqueries may reference NEW/OLD and return one or more keys.
+_ORDER_DETAIL_KEYS = [
+    ("summary_product_sales", "SELECT {row}.Product_id"),
+    ("summary_store_revenue", "SELECT Store_id FROM Orders WHERE Id = {row}.Order_id"),
+    ("summary_category_stats", "SELECT Categories_id FROM Product WHERE Id = {row}.Product_id"),
+    ("summary_customer_spending", "SELECT Customer_id FROM Orders WHERE Id = {row}.Order_id"),
+]
+_ORDERS_KEYS = [
+    ("summary_store_revenue", "SELECT {row}.Store_id"),
+    ("summary_customer_spending", "SELECT {row}.Customer_id"),
+]
+_PRODUCT_KEYS = [
+    ("summary_product_sales", "SELECT {row}.Id"),
+    ("summary_category_stats", "SELECT {row}.Categories_id"),
+]
+_PREFERENCE_KEYS = [
+    ("summary_category_stats",
+     "SELECT Id FROM Categories WHERE (',' || replace({row}.Preferred_categories, ' ', '') || ',') "
+     "LIKE '%,' || Id || ',%'"),
+]
+
+TRIGGERS = {
+    "Order_detail": {"INSERT": _ORDER_DETAIL_KEYS, "UPDATE": _ORDER_DETAIL_KEYS, "DELETE": _ORDER_DETAIL_KEYS},
+    "Orders": {"INSERT": _ORDERS_KEYS, "UPDATE OF Customer_id, Store_id": _ORDERS_KEYS, "DELETE": _ORDERS_KEYS},
+    "Product": {"INSERT": _PRODUCT_KEYS, "UPDATE": _PRODUCT_KEYS, "DELETE": _PRODUCT_KEYS},
+    "Categories": {
+        "INSERT": [("summary_category_stats", "SELECT {row}.Id")],
+        "UPDATE": [("summary_category_stats", "SELECT {row}.Id")],
+        "DELETE": [("summary_category_stats", "SELECT {row}.Id")],
+    },
+    "Store": {
+        "INSERT": [("summary_store_revenue", "SELECT {row}.Id")],
+        "UPDATE": [("summary_store_revenue", "SELECT {row}.Id")],
+        "DELETE": [("summary_store_revenue", "SELECT {row}.Id")],
+    },
+    "customers": {
+        "INSERT": [("summary_customer_spending", "SELECT {row}.id")],
+        "UPDATE OF id, name": [("summary_customer_spending", "SELECT {row}.id")],
+        "DELETE": [("summary_customer_spending", "SELECT {row}.id")],
+    },
+    "Customer_preferences": {"INSERT": _PREFERENCE_KEYS, "UPDATE": _PREFERENCE_KEYS, "DELETE": _PREFERENCE_KEYS},
+}
+
+
+def is_summary_table(table_name: str) -> bool:
+    """Check whether a table belongs to the derived analytics layer"""
+    return table_name.startswith(SUMMARY_PREFIX)
+
+
+def describe_summaries() -> str:
+    """Describe the summary tables for the SQL generation prompt"""
+    lines = ["Bảng tổng hợp (đã tính sẵn, ưu tiên dùng cho câu hỏi thống kê thay vì JOIN nhiều bảng):"]
+    for name, summary in SUMMARIES.items():
+        lines.append(f"- {name} (khóa {summary['key']}): {summary['description']}")
+    return "\n".join(lines)
+
+
+class AnalyticsStore:
+    """Materialised summary tables kept in sync with the source tables by triggers"""
+
+    def __init__(self, db_path: str = str(BASE_DIR / "Database.db"), timeout: int = 30):
+        self.db_path = db_path
+        self.timeout = timeout
+
+    def _refresh_statements(self, summary_name: str, keys_sql: str) -> List[str]:
+        """Statements recomputing the summary rows for the given key subquery"""
+        summary = SUMMARIES[summary_name]
+        select = summary["select"].format(filter=f"{summary['filter_column']} IN ({keys_sql})")
+        return [
+            f"DELETE FROM {summary_name} WHERE {summary['key']} IN ({keys_sql});",
+            f"INSERT INTO {summary_name} {select};",
+        ]
+
+    def _trigger_sql(self, table: str, event: str, targets: List) -> str:
+        """Build the AFTER trigger that refreshes affected summary keys"""
+        action = event.split()[0]
+        rows = {"INSERT": ["NEW"], "DELETE": ["OLD"], "UPDATE": ["OLD", "NEW"]}[action]
+
+        body = []
+        for summary_name, keys_template in targets:
+            for row in rows:
+                body.extend(self._refresh_statements(summary_name, keys_template.format(row=row)))
+
+        trigger_name = f"trg_{SUMMARY_PREFIX}{table.lower()}_{action.lower()}"
+        statements = "\n    ".join(body)
+        return (
+            f"CREATE TRIGGER {trigger_name} AFTER {event} ON {table}\n"
+            f"BEGIN\n    {statements}\nEND"
+        )
+
+    def ensure(self) -> bool:
+        """Create indexes, summary tables and triggers; populate new summaries"""
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            cursor = conn.cursor()
+
+            for index_name, target in INDEXES.items():
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {target}")
+
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            existing = {row[0] for row in cursor.fetchall()}
+
+            created = []
+            for summary_name, summary in SUMMARIES.items():
+                if summary_name not in existing:
+                    cursor.execute(f"CREATE TABLE {summary_name} ({summary['ddl']})")
+                    created.append(summary_name)
+
+            # Triggers are cheap to recreate, so definitions never go stale
+            for table, events in TRIGGERS.items():
+                for event, targets in events.items():
+                    action = event.split()[0]
+                    cursor.execute(f"DROP TRIGGER IF EXISTS trg_{SUMMARY_PREFIX}{table.lower()}_{action.lower()}")
+                    cursor.execute(self._trigger_sql(table, event, targets))
+
+            for summary_name in created:
+                self._rebuild(cursor, summary_name)
+
+            conn.commit()
+            conn.close()
+            if created:
+                print(f"Created analytics tables: {created}")
+            return True
+
+        except Exception as e:
+            print(f"Error ensuring analytics tables: {e}")
+            return False
+
+    def _rebuild(self, cursor: sqlite3.Cursor, summary_name: str):
+        """Recompute a whole summary table"""
+        summary = SUMMARIES[summary_name]
+        cursor.execute(f"DELETE FROM {summary_name}")
+        cursor.execute(f"INSERT INTO {summary_name} {summary['select'].format(filter='1 = 1')}")
+
+    def refresh(self) -> Dict[str, int]:
+        """Fully recompute every summary table and return their row counts"""
+        counts = {}
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            cursor = conn.cursor()
+            for summary_name in SUMMARIES:
+                self._rebuild(cursor, summary_name)
+                cursor.execute(f"SELECT COUNT(*) FROM {summary_name}")
+                counts[summary_name] = cursor.fetchone()[0]
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"Error refreshing analytics tables: {e}")
+        return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create or rebuild the analytics summary tables")
+    parser.add_argument("--db", default=str(BASE_DIR / "Database.db"), help="Path to the SQLite database")
+    parser.add_argument("--refresh", action="store_true", help="Recompute every summary from scratch")
+    args = parser.parse_args()
+
+    store = AnalyticsStore(args.db)
+    store.ensure()
+    if args.refresh:
+        for name, count in store.refresh().items():
+            print(f"{name}: {count} rows")
@@ -1,13 +1,29 @@
 from typing import List, Dict, Any
 import os
 import json
-from datetime import datetime
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+
+def format_history(entries: List[Dict[str, Any]]) -> str:
+    """Format chat entries as the history block of a prompt"""
+    if not entries:
+        return ""
+
+    history_text = "Lịch sử trò chuyện gần đây:\n"
+    for entry in entries:
+        history_text += f"Q: {entry['query']}\n"
+        history_text += f"A: {entry['response']}\n"
+    return history_text
+
 
 class ChatHistory:
     def __init__(self, history_file: str = "chat_history.json", max_history: int = 5):
         self.history_file = history_file
         self.max_history = max_history
         self.history = self._load_history()
+        self._lock = threading.Lock()
     
     def _load_history(self) -> List[Dict[str, Any]]:
         """Load chat history from file"""
@@ -21,10 +37,15 @@ class ChatHistory:
         return []
     
     def _save_history(self):
-        """Save chat history to file"""
+        """Save chat history to file; an empty history_file keeps it in memory only"""
+        if not self.history_file:
+            return
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
+            # Write to a temp file and swap it in, so concurrent writers never leave a torn file
+            tmp_file = f"{self.history_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(self.history, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.history_file)
         except Exception as e:
             print(f"Error saving chat history: {e}")
     
@@ -35,13 +56,14 @@ class ChatHistory:
             "query": query,
             "response": response
         }
-        self.history.append(chat_entry)
-        
-        # Keep only the last max_history entries
-        if len(self.history) > self.max_history:
-            self.history = self.history[-self.max_history:]
+        with self._lock:
+            self.history.append(chat_entry)
             
-        self._save_history()
+            # Keep only the last max_history entries
+            if len(self.history) > self.max_history:
+                self.history = self.history[len(self.history) - self.max_history:]
+                
+            self._save_history()
     
     def get_history(self) -> List[Dict[str, Any]]:
         """Get all chat history"""
@@ -49,16 +71,113 @@ class ChatHistory:
     
     def get_recent_history(self) -> str:
         """Get recent chat history as formatted string"""
-        if not self.history:
-            return ""
-            
-        history_text = "Lịch sử trò chuyện gần đây:\n"
-        for entry in self.history:
-            history_text += f"Q: {entry['query']}\n"
-            history_text += f"A: {entry['response']}\n"
-        return history_text
+        return format_history(self.history)
     
     def clear_history(self):
         """Clear all chat history"""
-        self.history = []
-        self._save_history() 
\ No newline at end of file
+        with self._lock:
+            self.history = []
+            self._save_history()
+
+
+class SessionHistoryStore:
+    """Chat histories keyed by session, in SQLite so every server worker sees the same turns"""
+
+    def __init__(self, db_path: str, max_history: int = 5, ttl_hours: float = 24, timeout: int = 30):
+        self.db_path = db_path
+        self.max_history = max_history
+        self.ttl_hours = ttl_hours
+        self.timeout = timeout
+        self.ensure()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=self.timeout)
+
+    def ensure(self):
+        """Create the turns table; WAL lets workers read while another one writes"""
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_turns (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_key TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    response TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_turns_session ON chat_turns (session_key, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_turns_timestamp ON chat_turns (timestamp)")
+        conn.close()
+
+    def get(self, session_key: str) -> "SessionHistory":
+        return SessionHistory(self, session_key)
+
+    def turns(self, session_key: str) -> List[Dict[str, Any]]:
+        """Last max_history turns of a session, oldest first"""
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT timestamp, query, response FROM chat_turns WHERE session_key = ? ORDER BY id DESC LIMIT ?",
+            (session_key, self.max_history)
+        ).fetchall()
+        conn.close()
+        return [{"timestamp": ts, "query": query, "response": response} for ts, query, response in reversed(rows)]
+
+    def add(self, session_key: str, query: str, response: str):
+        """Append a turn, trim the session to max_history and drop sessions idle past the TTL"""
+        now = datetime.now()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO chat_turns (session_key, timestamp, query, response) VALUES (?, ?, ?, ?)",
+                (session_key, now.isoformat(), query, response)
+            )
+            conn.execute(
+                """
+                DELETE FROM chat_turns WHERE session_key = ? AND id NOT IN (
+                    SELECT id FROM chat_turns WHERE session_key = ? ORDER BY id DESC LIMIT ?
+                )
+                """,
+                (session_key, session_key, self.max_history)
+            )
+            conn.execute(
+                "DELETE FROM chat_turns WHERE timestamp < ?",
+                ((now - timedelta(hours=self.ttl_hours)).isoformat(),)
+            )
+        conn.close()
+
+    def clear(self, session_key: str):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM chat_turns WHERE session_key = ?", (session_key,))
+        conn.close()
+
+
+class SessionHistory:
+    """One session's conversation, with the ChatHistory methods the RAG system uses"""
+
+    def __init__(self, store: SessionHistoryStore, session_key: str):
+        self.store = store
+        self.session_key = session_key
+
+    def add_chat(self, query: str, response: str):
+        try:
+            self.store.add(self.session_key, query, response)
+        except Exception as e:
+            print(f"Error saving session history: {e}")
+
+    def get_history(self) -> List[Dict[str, Any]]:
+        try:
+            return self.store.turns(self.session_key)
+        except Exception as e:
+            print(f"Error loading session history: {e}")
+            return []
+
+    def get_recent_history(self) -> str:
+        return format_history(self.get_history())
+
+    def clear_history(self):
+        self.store.clear(self.session_key)
@@ -0,0 +1,211 @@
+import sqlite3
+import threading
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def parse_order_date(value: str) -> datetime:
+    """Parse Orders.Order_date, stored as M/D/YYYY text (ISO dates also accepted)"""
+    for fmt in ("%m/%d/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(value).strip(), fmt)
+        except ValueError:
+            continue
+    return datetime.min
+
+
+def parse_category_ids(value) -> List[int]:
+    """Parse Customer_preferences.Preferred_categories, stored as text like "3,5  " """
+    category_ids = []
+    for part in str(value or "").replace(" ", "").split(","):
+        if part.isdigit() and int(part) not in category_ids:
+            category_ids.append(int(part))
+    return category_ids
+
+
+@dataclass
+class CustomerProfile:
+    """Structured per-customer context used to personalise responses"""
+    customer_id: int
+    name: str
+    recent_orders: List[Dict[str, Any]] = field(default_factory=list)
+    favourite_categories: List[str] = field(default_factory=list)
+    max_price: Optional[float] = None
+    price_range: Optional[Tuple[float, float]] = None
+    recommendations: List[Dict[str, Any]] = field(default_factory=list)
+    version: Tuple[int, int, int] = (0, 0, 0)
+
+    def identity(self) -> str:
+        """Short identity line for prompts that need to filter by customer"""
+        return f"Khách hàng hiện tại: {self.name} (customers.id = {self.customer_id})"
+
+    def to_context(self) -> str:
+        """Format the profile as prompt context for the responder"""
+        lines = [f"Bạn đang trò chuyện với khách hàng {self.name} (ID: {self.customer_id})."]
+
+        if self.favourite_categories:
+            lines.append(f"Danh mục yêu thích: {', '.join(self.favourite_categories)}")
+
+        if self.price_range or self.max_price is not None:
+            band = []
+            if self.price_range:
+                band.append(f"thường mua trong khoảng {self.price_range[0]:g}đ - {self.price_range[1]:g}đ")
+            if self.max_price is not None:
+                band.append(f"mức giá tối đa mong muốn {self.max_price:g}đ")
+            lines.append(f"Mức giá: {', '.join(band)}")
+
+        if self.recent_orders:
+            lines.append("Lịch sử mua hàng gần đây:")
+            for order in self.recent_orders:
+                lines.append(
+                    f"- {order['date']}: {order['product']} (SL: {order['quantity']}, "
+                    f"Giá: {order['price']}đ, Đánh giá: {order['rate']}⭐)"
+                )
+
+        if self.recommendations:
+            lines.append("Sản phẩm gợi ý cho khách hàng (đã xếp hạng, phù hợp nhất trước):")
+            for rank, item in enumerate(self.recommendations, 1):
+                price = f", giá khoảng {item['price']:g}đ" if item["price"] is not None else ""
+                lines.append(f"{rank}. {item['product']} ({item['prep']}){price}")
+        return "\n".join(lines)
+
+
+class CustomerProfileService:
+    """Builds customer profiles once and caches them until the customer's orders change"""
+
+    def __init__(self, db_path: str, timeout: int = 30, recent_limit: int = 5,
+                 recommender=None, recommendation_count: int = 5):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.recent_limit = recent_limit
+        self.recommender = recommender
+        self.recommendation_count = recommendation_count
+        self._cache: Dict[int, CustomerProfile] = {}
+        self._lock = threading.Lock()
+        self._recommender_version = None
+
+    def _order_version(self, cursor: sqlite3.Cursor, customer_id: int) -> Tuple[int, int, int]:
+        """Cheap fingerprint of a customer's orders, used for cache invalidation"""
+        cursor.execute(
+            """
+            SELECT COUNT(DISTINCT o.Id), COALESCE(MAX(o.Id), 0), COUNT(od.Order_id)
+            FROM Orders o
+            LEFT JOIN Order_detail od ON od.Order_id = o.Id
+            WHERE o.Customer_id = ?
+            """,
+            (customer_id,)
+        )
+        return tuple(cursor.fetchone())
+
+    def _build_profile(self, cursor: sqlite3.Cursor, customer_id: int,
+                       version: Tuple[int, int, int]) -> Optional[CustomerProfile]:
+        """Load a customer's profile from the database"""
+        cursor.execute("SELECT name FROM customers WHERE id = ?", (customer_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        # Order_date is M/D/YYYY text, so sort by the parsed date rather than in SQL
+        cursor.execute(
+            """
+            SELECT o.Order_date, p.Name, od.Quantity, od.Price, od.Rate
+            FROM Orders o
+            JOIN Order_detail od ON o.Id = od.Order_id
+            JOIN Product p ON od.Product_id = p.Id
+            WHERE o.Customer_id = ?
+            """,
+            (customer_id,)
+        )
+        lines = sorted(cursor.fetchall(), key=lambda line: parse_order_date(line[0]), reverse=True)
+        recent_orders = [
+            {"date": date, "product": product.strip(), "quantity": quantity, "price": price, "rate": rate}
+            for date, product, quantity, price, rate in lines[:self.recent_limit]
+        ]
+        prices = [line[3] for line in lines if line[3] is not None]
+
+        cursor.execute(
+            "SELECT Preferred_categories, Max_price FROM Customer_preferences WHERE Customer_id = ?",
+            (customer_id,)
+        )
+        preferences = cursor.fetchall()
+        category_ids = []
+        for categories, _ in preferences:
+            category_ids.extend(cid for cid in parse_category_ids(categories) if cid not in category_ids)
+        max_prices = [max_price for _, max_price in preferences if max_price is not None]
+
+        favourite_categories = []
+        if category_ids:
+            cursor.execute(
+                f"SELECT Id, Name FROM Categories WHERE Id IN ({','.join('?' * len(category_ids))})",
+                category_ids
+            )
+            names = dict(cursor.fetchall())
+            favourite_categories = [names[cid] for cid in category_ids if cid in names]
+
+        return CustomerProfile(
+            customer_id=customer_id,
+            name=row[0],
+            recent_orders=recent_orders,
+            favourite_categories=favourite_categories,
+            max_price=max(max_prices) if max_prices else None,
+            price_range=(min(prices), max(prices)) if prices else None,
+            version=version
+        )
+
+    def _refresh_recommender(self, cursor: sqlite3.Cursor):
+        """Let the recommender pick up changes, only when one of its data versions moved"""
+        if self.recommender is None:
+            return
+        version = self.recommender.data_version(cursor)
+        with self._lock:
+            if version == self._recommender_version:
+                return
+        # refresh() applies changes under the recommender's own lock, so a concurrent duplicate call is harmless
+        self.recommender.refresh()
+        with self._lock:
+            self._recommender_version = version
+
+    def _with_recommendations(self, profile: Optional[CustomerProfile]) -> Optional[CustomerProfile]:
+        """Copy of the profile with the current ranked suggestions; the cached profile is shared between requests"""
+        if profile is None or self.recommender is None:
+            return profile
+        return replace(profile, recommendations=self.recommender.recommend(profile.customer_id,
+                                                                           self.recommendation_count))
+
+    def get_profile(self, customer_id: int) -> Optional[CustomerProfile]:
+        """Return the cached profile, rebuilding it only if the customer's orders changed"""
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            cursor = conn.cursor()
+            version = self._order_version(cursor, customer_id)
+            self._refresh_recommender(cursor)
+
+            with self._lock:
+                cached = self._cache.get(customer_id)
+            if cached is not None and cached.version == version:
+                conn.close()
+                return self._with_recommendations(cached)
+
+            profile = self._build_profile(cursor, customer_id, version)
+            conn.close()
+
+            with self._lock:
+                if profile is None:
+                    self._cache.pop(customer_id, None)
+                else:
+                    self._cache[customer_id] = profile
+            return self._with_recommendations(profile)
+
+        except Exception as e:
+            print(f"Error loading customer profile: {e}")
+            with self._lock:
+                return self._cache.get(customer_id)
+
+    def invalidate(self, customer_id: Optional[int] = None):
+        """Drop one cached profile, or all of them"""
+        with self._lock:
+            if customer_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(customer_id, None)
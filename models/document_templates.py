@@ -0,0 +1,82 @@
+from typing import Any, Dict
+
+# How each table becomes vector store documents.
+#   sql:       query producing one row per document; must return an "Id" column
+#              and may join other tables to denormalise names
+#   template:  str.format template over the query's columns (None renders as "-")
+#   source:    table and key column used to fetch the full row on demand
+# Tables mapped to None are not embedded (their content is folded into another
+# table's documents). Tables without an entry use the generic key: value format.
+DOCUMENT_TEMPLATES: Dict[str, Any] = {
+    "Product": {
+        "sql": """
+            SELECT p.Id, p.Name, p.Product_Prep, c.Name AS Category, p.Calories, p.Sugars_g,
+                   p.Protein_g, p.Caffeine_mg, p.Rating, p.Descriptions
+            FROM Product p
+            LEFT JOIN Categories c ON c.Id = p.Categories_id
+        """,
+        "template": "Đồ uống {Name} ({Product_Prep}), danh mục {Category}. {Descriptions} "
+                    "Calo: {Calories}, đường: {Sugars_g}g, protein: {Protein_g}g, "
+                    "caffeine: {Caffeine_mg}mg, đánh giá: {Rating}/5",
+        "source": ("Product", "Id"),
+    },
+    "Categories": {
+        "sql": "SELECT Id, Name, Description FROM Categories",
+        "template": "Danh mục {Name}: {Description}",
+        "source": ("Categories", "Id"),
+    },
+    "Store": {
+        "sql": "SELECT Id, Name, Address, Phone, Open_Close FROM Store",
+        "template": "Cửa hàng {Name}, địa chỉ {Address}, điện thoại {Phone}, giờ mở cửa {Open_Close}",
+        "source": ("Store", "Id"),
+    },
+    "Orders": {
+        "sql": """
+            SELECT o.Id, o.Order_date, cu.name AS Customer, s.Name AS Store,
+                   (SELECT GROUP_CONCAT(TRIM(p.Name) || ' ' || p.Product_Prep || ' x' || od.Quantity, ', ')
+                    FROM Order_detail od JOIN Product p ON p.Id = od.Product_id
+                    WHERE od.Order_id = o.Id) AS Items
+            FROM Orders o
+            LEFT JOIN customers cu ON cu.id = o.Customer_id
+            LEFT JOIN Store s ON s.Id = o.Store_id
+        """,
+        "template": "Đơn hàng ngày {Order_date} của khách hàng {Customer} tại {Store}: {Items}",
+        "source": ("Orders", "Id"),
+    },
+    # Order lines are embedded as part of their order
+    "Order_detail": None,
+    "Customer_preferences": {
+        "sql": """
+            SELECT cp.rowid AS Id, cu.name AS Customer, cp.Max_price,
+                   (SELECT GROUP_CONCAT(c.Name, ', ') FROM Categories c
+                    WHERE (',' || replace(cp.Preferred_categories, ' ', '') || ',') LIKE '%,' || c.Id || ',%')
+                   AS Categories
+            FROM Customer_preferences cp
+            LEFT JOIN customers cu ON cu.id = cp.Customer_id
+        """,
+        "template": "Khách hàng {Customer} yêu thích danh mục {Categories}, giá tối đa {Max_price}",
+        "source": ("Customer_preferences", "rowid"),
+    },
+    "customers": {
+        "sql": "SELECT id AS Id, name, sex, age, location FROM customers",
+        "template": "Khách hàng {name}, giới tính {sex}, {age} tuổi, đến từ {location}",
+        "source": ("customers", "id"),
+    },
+}
+
+
+class _Values(dict):
+    """Format mapping that renders missing or NULL values as '-'"""
+
+    def __missing__(self, key):
+        return "-"
+
+    def __getitem__(self, key):
+        value = dict.get(self, key)
+        if value is None:
+            return "-"
+        return str(value).strip()
+
+
+def render_document(template: str, row: Dict[str, Any]) -> str:
+    return template.format_map(_Values(row))
@@ -2,16 +2,20 @@ import cv2
 import numpy as np
 from ultralytics import YOLO
 import tensorflow as tf
-import sqlite3
-from scipy.spatial.distance import cosine
 import time
-import json
 import streamlit as st
 import os
+import threading
+from functools import lru_cache
 from pathlib import Path
 
+from config import Config
+from .face_capture import FaceCapturePipeline
+from .face_index import FaceIndex, embedding_version, load_enrolled_embeddings
+
 # Get base directory
 BASE_DIR = Path(__file__).parent.parent
+DB_PATH = str(BASE_DIR / "Database.db")
 
 def load_facenet_pb(model_path):
     # Use absolute path
@@ -24,136 +28,169 @@ def load_facenet_pb(model_path):
         tf.import_graph_def(graph_def, name="")
     return graph
 
-def get_face_embedding(face_img, sess, input_tensor, embedding_tensor, phase_train_tensor):
-    # Preprocess image
+@lru_cache(maxsize=1)
+def get_facenet_session():
+    """Load the FaceNet graph once and keep its session for the process lifetime"""
+    facenet_graph = load_facenet_pb("20180402-114759.pb")
+    sess = tf.compat.v1.Session(graph=facenet_graph)
+    input_tensor = facenet_graph.get_tensor_by_name("input:0")
+    embedding_tensor = facenet_graph.get_tensor_by_name("embeddings:0")
+    phase_train_tensor = facenet_graph.get_tensor_by_name("phase_train:0")
+    return sess, input_tensor, embedding_tensor, phase_train_tensor
+
+@lru_cache(maxsize=1)
+def get_yolo_model():
+    """Load the YOLO face detector once"""
+    return YOLO(os.path.join(BASE_DIR, "models", "best.pt"))
+
+def preprocess_face(face_img):
     face_img = cv2.resize(face_img, (160, 160))
     face_img = face_img.astype('float32')
-    face_img = (face_img - 127.5) / 128.0
-    face_img = np.expand_dims(face_img, axis=0)
-    
-    # Get embedding
-    embedding = sess.run(embedding_tensor, 
-                        feed_dict={input_tensor: face_img, 
-                                 phase_train_tensor: False})[0]
-    return embedding
+    return (face_img - 127.5) / 128.0
 
-def find_matching_face(embedding, threshold=0.5):
-    conn = sqlite3.connect('Database.db')
-    cursor = conn.cursor()
-    
-    # Get all embeddings from database
-    cursor.execute("SELECT embedding, name, id FROM customers")
-    results = cursor.fetchall()
-    
-    best_match = None
-    min_distance = float('inf')
-    
-    for db_embedding, name, id in results:
+def get_face_embeddings(face_imgs, sess, input_tensor, embedding_tensor, phase_train_tensor):
+    """Embed a batch of face crops in a single FaceNet call"""
+    batch = np.stack([preprocess_face(face_img) for face_img in face_imgs])
+    return sess.run(embedding_tensor,
+                    feed_dict={input_tensor: batch,
+                               phase_train_tensor: False})
+
+def get_face_embedding(face_img, sess, input_tensor, embedding_tensor, phase_train_tensor):
+    return get_face_embeddings([face_img], sess, input_tensor,
+                               embedding_tensor, phase_train_tensor)[0]
+
+def embed_faces(face_imgs):
+    """Embed face crops with the shared FaceNet session"""
+    return get_face_embeddings(face_imgs, *get_facenet_session())
+
+def detect_faces(frame, model=None):
+    """Return face boxes (x1, y1, x2, y2) detected by YOLO"""
+    model = model or get_yolo_model()
+    boxes = []
+    for result in model(frame, verbose=False):
+        for box in result.boxes:
+            x1, y1, x2, y2 = box.xyxy[0]
+            boxes.append((int(x1), int(y1), int(x2), int(y2)))
+    return boxes
+
+class FaceGallery:
+    """Enrolled customer embeddings held as one normalised matrix for vectorised search"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.ids = []
+        self.names = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.load()
+
+    def load(self):
+        self.ids, self.names, self.matrix = load_enrolled_embeddings(self.db_path)
+
+    def search(self, embedding, k=2):
+        """Top-k customers by ascending cosine distance"""
+        if not self.ids:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) + 1e-10)
+        distances = 1.0 - self.matrix @ query
+        k = min(k, len(self.ids))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [
+            {'name': self.names[i], 'id': self.ids[i], 'distance': float(distances[i])}
+            for i in top
+        ]
+
+_face_indexes = {}
+_face_indexes_lock = threading.Lock()
+
+def get_face_index(settings):
+    """Load the FAISS face index once per process; reload only when the embedding version moves"""
+    key = (settings.face_index_path, settings.db_path, settings.face_index_type)
+    with _face_indexes_lock:
+        face_index = _face_indexes.get(key)
+        if face_index is None or face_index.version != embedding_version(settings.db_path):
+            face_index = FaceIndex.load_or_build(
+                settings.face_index_path,
+                settings.db_path,
+                index_type=settings.face_index_type
+            )
+            _face_indexes[key] = face_index
+    return face_index
+
+def load_face_matcher(config=None):
+    """Search function over enrolled faces: the FAISS face index if configured, else exact search"""
+    settings = config or Config
+    if settings.face_index_type != "exact":
         try:
-            # Convert string embedding back to numpy array
-            db_embedding = np.array(json.loads(db_embedding), dtype=np.float32)
-            
-            # Calculate cosine distance
-            distance = cosine(embedding, db_embedding)
-            
-            if distance < min_distance:
-                min_distance = distance
-                if distance < threshold:
-                    best_match = {'name': name, 'id': id}
+            return get_face_index(settings).search
         except Exception as e:
-            print(f"Error processing embedding for {name}: {e}")
-            continue
-    
-    conn.close()
-    return best_match
+            print(f"Error loading face index, falling back to exact search: {e}")
+    return FaceGallery(settings.db_path).search
 
-def capture_face():
-    # Load YOLO model with absolute path
-    yolo_model = YOLO(os.path.join(BASE_DIR, "models", "best.pt"))
-    
-    # Initialize webcam
-    cap = cv2.VideoCapture(0)
-    
-    # Biến để lưu kết quả
-    captured_face = None
-    start_time = None
-    CAPTURE_DELAY = 5  # Thời gian chờ (giây)
-    
-    # Tạo placeholder cho camera feed
+def find_face_candidates(embedding, k=2, config=None):
+    return load_face_matcher(config)(embedding, k)
+
+def find_matching_face(embedding, threshold=0.5):
+    candidates = find_face_candidates(embedding, k=1)
+    if candidates and candidates[0]['distance'] < threshold:
+        return {'name': candidates[0]['name'], 'id': candidates[0]['id']}
+    return None
+
+def create_capture_pipeline(config=None, on_frame=None):
+    """Build the capture pipeline from Config settings (class defaults if no config given)"""
+    settings = config or Config
+    return FaceCapturePipeline(
+        detector=detect_faces,
+        embedder=embed_faces,
+        matcher=load_face_matcher(config),
+        threshold=settings.face_threshold,
+        margin=settings.face_margin,
+        min_samples=settings.face_min_samples,
+        detect_every_n=settings.face_detect_every_n,
+        detect_scale=settings.face_detect_scale,
+        batch_size=settings.face_batch_size,
+        max_seconds=settings.face_max_seconds,
+        on_frame=on_frame
+    )
+
+def capture_and_recognize(config=None):
+    """Run the capture pipeline with a live preview in Streamlit"""
+    settings = config or Config
     camera_placeholder = st.empty()
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-            
-        current_time = time.time()
-        
-        # YOLO detection
-        results = yolo_model(frame)
-        
-        # Process each detected face
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                # Get face coordinates
-                x1, y1, x2, y2 = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                
-                # Draw bounding box
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                
-                # Bắt đầu đếm thời gian khi phát hiện khuôn mặt
-                if start_time is None:
-                    start_time = current_time
-                
-                # Xử lý khuôn mặt sau 5 giây
-                if start_time is not None and current_time - start_time >= CAPTURE_DELAY:
-                    try:
-                        captured_face = frame[y1:y2, x1:x2].copy()
-                        cap.release()
-                        return captured_face
-                        
-                    except Exception as e:
-                        print(f"Error capturing face: {e}")
-                        cap.release()
-                        return None
-                
-                # Hiển thị thời gian còn lại
-                if start_time is not None:
-                    remaining_time = CAPTURE_DELAY - (current_time - start_time)
-                    label = f"Capturing in: {remaining_time:.1f}s"
-                    cv2.putText(frame, label, (x1, y1-10), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-        
-        # Convert frame to RGB for Streamlit
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Update camera feed in Streamlit
-        camera_placeholder.image(frame_rgb, channels="RGB")
-        
-        # Add a small delay to prevent overwhelming the UI
-        time.sleep(0.1)
-    
-    # Release resources
-    cap.release()
+    last_preview = [0.0]
+
+    def show_frame(frame, boxes, best_match):
+        # Limit preview refreshes so the UI does not slow down detection
+        now = time.time()
+        if now - last_preview[0] < 0.1:
+            return
+        last_preview[0] = now
+        for x1, y1, x2, y2 in boxes:
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        if best_match is not None:
+            cv2.putText(frame, f"Matching... ({best_match['samples']} samples)", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        camera_placeholder.image(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), channels="RGB")
+
+    pipeline = create_capture_pipeline(config, on_frame=show_frame)
+    try:
+        match = pipeline.run(settings.face_capture_source)
+    except Exception as e:
+        print(f"Error capturing face: {e}")
+        match = None
+    camera_placeholder.empty()
+
+    if match is not None:
+        print(f"Face matched in {match['elapsed']:.2f}s "
+              f"(distance {match['distance']:.3f}, margin {match['margin']:.3f}, {match['samples']} samples)")
+        return {'name': match['name'], 'id': match['id']}
     return None
 
 def process_face_recognition(face_img):
-    # Use absolute path for FaceNet model
-    model_path = os.path.join(BASE_DIR, "models", "20180402-114759.pb")
-    facenet_graph = load_facenet_pb(model_path)
-    
-    # Get input and output tensors
-    sess = tf.compat.v1.Session(graph=facenet_graph)
-    input_tensor = facenet_graph.get_tensor_by_name("input:0")
-    embedding_tensor = facenet_graph.get_tensor_by_name("embeddings:0")
-    phase_train_tensor = facenet_graph.get_tensor_by_name("phase_train:0")
-    
     try:
         # Get face embedding
-        face_embedding = get_face_embedding(face_img, sess, input_tensor, 
-                                         embedding_tensor, phase_train_tensor)
+        face_embedding = embed_faces([face_img])[0]
         
         # Find matching face in database
         match = find_matching_face(face_embedding)
@@ -162,40 +199,30 @@ def process_face_recognition(face_img):
     except Exception as e:
         print(f"Error processing face recognition: {e}")
         return None
-    
-    finally:
-        sess.close()
 
-def authenticate_user():
+def authenticate_user(config=None):
     st.markdown("### 👤 Vui lòng nhìn vào camera để xác thực")
     
     # Create a container for the camera
     camera_container = st.container()
     
     with camera_container:
-        # Capture face
-        face_img = capture_face()
+        # Capture frames until the averaged face embedding matches confidently
+        user_info = capture_and_recognize(config)
     
-    if face_img is not None:
-        # Process face recognition
-        user_info = process_face_recognition(face_img)
+    if user_info:
+        # Clear the camera container
+        camera_container.empty()
         
-        if user_info:
-            # Clear the camera container
-            camera_container.empty()
-            
-            # Add a personalized greeting with animation
-            st.markdown(f"""
-            <div style='text-align: center; padding: 20px;'>
-                <h2>👋 Xin chào {user_info['name']}!</h2>
-                <p style='font-size: 1.2em;'>Rất vui được gặp lại bạn.</p>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            return user_info
-        else:
-            st.error("Không tìm thấy thông tin người dùng trong hệ thống")
-            return None
+        # Add a personalized greeting with animation
+        st.markdown(f"""
+        <div style='text-align: center; padding: 20px;'>
+            <h2>👋 Xin chào {user_info['name']}!</h2>
+            <p style='font-size: 1.2em;'>Rất vui được gặp lại bạn.</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        return user_info
     else:
-        st.error("Không thể chụp ảnh khuôn mặt")
-        return None 
\ No newline at end of file
+        st.error("Không tìm thấy thông tin người dùng trong hệ thống")
+        return None
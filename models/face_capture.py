@@ -0,0 +1,279 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+class FrameSource:
+    """Decode frames on a background thread from a camera, video file or image directory"""
+
+    def __init__(self, source: Union[int, str], queue_size: int = 4):
+        self.source = source
+        self.is_live = isinstance(source, int) or (isinstance(source, str) and source.isdigit())
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self.exhausted = False  # set once the reader thread has finished and its frames are consumed
+
+    def _frames(self):
+        """Yield decoded frames from the configured source"""
+        if isinstance(self.source, str) and os.path.isdir(self.source):
+            for file_name in sorted(os.listdir(self.source)):
+                if self._stop.is_set():
+                    return
+                if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                    frame = cv2.imread(os.path.join(self.source, file_name))
+                    if frame is not None:
+                        yield frame
+            return
+
+        cap = cv2.VideoCapture(int(self.source) if self.is_live else self.source)
+        try:
+            while not self._stop.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                yield frame
+        finally:
+            cap.release()
+
+    def _run(self):
+        """Reader thread: live sources keep only the freshest frames, files never drop frames"""
+        try:
+            for frame in self._frames():
+                if self.is_live and self._queue.full():
+                    try:
+                        self._queue.get_nowait()
+                    except queue.Empty:
+                        pass
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        except Exception as e:
+            print(f"Error reading frames: {e}")
+        finally:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def start(self) -> "FrameSource":
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def read(self, timeout: float = 1.0) -> Optional[np.ndarray]:
+        """Next frame, or None when the source is exhausted or stalled (``exhausted`` tells them apart)"""
+        try:
+            frame = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            # The end marker can be lost if the queue was full; a dead reader thread means the same
+            if self._thread is not None and not self._thread.is_alive() and self._queue.empty():
+                self.exhausted = True
+            return None
+        if frame is None:
+            self.exhausted = True
+        return frame
+
+    def stop(self):
+        self._stop.set()
+        # Unblock the reader if it is waiting on a full queue
+        while not self._queue.empty():
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+
+def _iou(a: Box, b: Box) -> float:
+    """Intersection over union of two boxes"""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class _FaceTrack:
+    """Running sum of normalised embeddings for one face across frames"""
+
+    def __init__(self, box: Box):
+        self.box = box
+        self.total = None
+        self.samples = 0
+
+    def add(self, embedding: np.ndarray):
+        embedding = embedding / (np.linalg.norm(embedding) + 1e-10)
+        self.total = embedding if self.total is None else self.total + embedding
+        self.samples += 1
+
+    def mean(self) -> np.ndarray:
+        return self.total / self.samples
+
+
+class FaceCapturePipeline:
+    """Detect faces on a subset of frames, embed crops in batches and stop once the match is stable
+
+    detector: callable(frame) -> list of (x1, y1, x2, y2) boxes
+    embedder: callable(list of BGR crops) -> array of shape (n, dim)
+    matcher: callable(embedding, k) -> candidates sorted by ascending cosine distance,
+             each a dict with at least 'id', 'name' and 'distance'
+    """
+
+    def __init__(self, detector: Callable, embedder: Callable, matcher: Callable,
+                 threshold: float = 0.5, margin: float = 0.05, min_samples: int = 3,
+                 detect_every_n: int = 2, detect_scale: float = 0.5, batch_size: int = 4,
+                 max_seconds: float = 10.0, track_iou: float = 0.3,
+                 on_frame: Optional[Callable] = None):
+        self.detector = detector
+        self.embedder = embedder
+        self.matcher = matcher
+        self.threshold = threshold
+        self.margin = margin
+        self.min_samples = min_samples
+        self.detect_every_n = max(1, detect_every_n)
+        self.detect_scale = detect_scale
+        self.batch_size = max(1, batch_size)
+        self.max_seconds = max_seconds
+        self.track_iou = track_iou
+        self.on_frame = on_frame
+
+    def _detect(self, frame: np.ndarray) -> List[Box]:
+        """Run detection on a down-scaled copy and map boxes back to the full frame"""
+        scale = self.detect_scale
+        small = cv2.resize(frame, None, fx=scale, fy=scale) if scale != 1.0 else frame
+        height, width = frame.shape[:2]
+        boxes = []
+        for x1, y1, x2, y2 in self.detector(small):
+            box = (
+                max(0, int(x1 / scale)), max(0, int(y1 / scale)),
+                min(width, int(x2 / scale)), min(height, int(y2 / scale))
+            )
+            if box[2] > box[0] and box[3] > box[1]:
+                boxes.append(box)
+        return boxes
+
+    def _assign(self, tracks: List[_FaceTrack], box: Box) -> _FaceTrack:
+        """Attach a detection to the overlapping track, or start a new one"""
+        best = max(tracks, key=lambda track: _iou(track.box, box), default=None)
+        if best is not None and _iou(best.box, box) >= self.track_iou:
+            best.box = box
+            return best
+        track = _FaceTrack(box)
+        tracks.append(track)
+        return track
+
+    def _evaluate(self, track: _FaceTrack) -> Optional[Dict]:
+        """Match a track's averaged embedding; returns the match with its margin"""
+        candidates = self.matcher(track.mean(), 2)
+        if not candidates:
+            return None
+        best = dict(candidates[0])
+        runner_up = candidates[1]["distance"] if len(candidates) > 1 else float("inf")
+        best["margin"] = runner_up - best["distance"]
+        best["samples"] = track.samples
+        return best
+
+    def _is_confident(self, match: Optional[Dict], min_samples: Optional[int] = None) -> bool:
+        min_samples = self.min_samples if min_samples is None else min_samples
+        return (
+            match is not None
+            and match["samples"] >= min_samples
+            and match["distance"] < self.threshold
+            and match["margin"] >= self.margin
+        )
+
+    def run(self, source: Union[int, str, FrameSource]) -> Optional[Dict]:
+        """Consume frames until a confident match, the time limit, or the end of the source"""
+        frames = source if isinstance(source, FrameSource) else FrameSource(source)
+        frames.start()
+
+        start_time = time.time()
+        tracks: List[_FaceTrack] = []
+        pending: List[Tuple[_FaceTrack, np.ndarray]] = []
+        best_match = None
+        frame_index = 0
+
+        def flush() -> Optional[Dict]:
+            nonlocal best_match
+            if not pending:
+                return None
+            embeddings = self.embedder([crop for _, crop in pending])
+            touched = []
+            for (track, _), embedding in zip(pending, embeddings):
+                track.add(np.asarray(embedding, dtype=np.float32))
+                if track not in touched:
+                    touched.append(track)
+            pending.clear()
+
+            for track in touched:
+                match = self._evaluate(track)
+                if self._is_confident(match):
+                    return match
+                if match is not None and (best_match is None or match["distance"] < best_match["distance"]):
+                    best_match = match
+            return None
+
+        try:
+            while time.time() - start_time < self.max_seconds:
+                remaining = self.max_seconds - (time.time() - start_time)
+                frame = frames.read(timeout=min(1.0, max(remaining, 0.01)))
+                if frame is None:
+                    # Cameras can take seconds to open or stall briefly; only files and directories end on a timeout
+                    if frames.exhausted or not frames.is_live:
+                        break
+                    continue
+
+                boxes = []
+                if frame_index % self.detect_every_n == 0:
+                    boxes = self._detect(frame)
+                    for box in boxes:
+                        x1, y1, x2, y2 = box
+                        pending.append((self._assign(tracks, box), frame[y1:y2, x1:x2].copy()))
+                frame_index += 1
+
+                if self.on_frame is not None:
+                    self.on_frame(frame, boxes, best_match)
+
+                if len(pending) >= self.batch_size:
+                    match = flush()
+                    if match is not None:
+                        match["elapsed"] = time.time() - start_time
+                        return match
+
+            # Use whatever crops are left; short sources may not reach min_samples
+            match = flush()
+            if match is None and self._is_confident(best_match, min_samples=1):
+                match = best_match
+            if match is not None:
+                match["elapsed"] = time.time() - start_time
+            return match
+
+        finally:
+            frames.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .face_auth import create_capture_pipeline
+
+    parser = argparse.ArgumentParser(description="Run face login against a camera, video file or image directory")
+    parser.add_argument("source", help="Camera index, video file or directory of frames")
+    args = parser.parse_args()
+
+    result = create_capture_pipeline().run(args.source)
+    print(result if result else "No confident match")
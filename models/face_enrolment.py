@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config import Config
+from .face_auth import embed_faces, get_yolo_model
+from .face_capture import IMAGE_EXTENSIONS
+from .face_index import FaceIndex, embeddings_checksum, ensure_embedding_version
+
+
+def serialize_embedding(embedding: np.ndarray, decimals: int = 6) -> str:
+    """Compact JSON form of an embedding, readable by the existing json.loads callers"""
+    return json.dumps([round(float(value), decimals) for value in embedding], separators=(",", ":"))
+
+
+def resolve_picture(customer_id: int, picture: Optional[str], image_dir: Optional[str]) -> Optional[str]:
+    """Find the image for a customer: the picture path, or <image_dir>/<basename or id>.<ext>"""
+    if picture and os.path.exists(picture):
+        return picture
+    if not image_dir:
+        return None
+
+    candidates = []
+    if picture:
+        candidates.append(os.path.join(image_dir, os.path.basename(picture)))
+    candidates.extend(os.path.join(image_dir, f"{customer_id}{ext}") for ext in IMAGE_EXTENSIONS)
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def largest_box(boxes) -> Optional[Tuple[int, int, int, int]]:
+    """Enrolment pictures show one customer, so keep the biggest detection"""
+    best = None
+    for box in boxes:
+        x1, y1, x2, y2 = (int(v) for v in box.xyxy[0])
+        if x2 <= x1 or y2 <= y1:
+            continue
+        if best is None or (x2 - x1) * (y2 - y1) > (best[2] - best[0]) * (best[3] - best[1]):
+            best = (x1, y1, x2, y2)
+    return best
+
+
+class FaceEnrolment:
+    """Detect, embed and store face embeddings for many customers at once"""
+
+    def __init__(self, config=None, batch_size: int = 32, workers: int = 4):
+        self.settings = config or Config
+        self.batch_size = batch_size
+        self.workers = workers
+
+    def _pending_customers(self, customer_ids: Optional[List[int]], only_missing: bool) -> List[Tuple]:
+        conn = sqlite3.connect(self.settings.db_path, timeout=self.settings.db_timeout)
+        cursor = conn.cursor()
+        query = "SELECT id, name, picture FROM customers"
+        conditions, params = [], []
+        if only_missing:
+            conditions.append("embedding IS NULL")
+        if customer_ids:
+            conditions.append(f"id IN ({','.join('?' * len(customer_ids))})")
+            params.extend(customer_ids)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def _embed_batch(self, batch: List[Tuple[int, str, np.ndarray]], failures: Dict[int, str]) -> List[Tuple]:
+        """Detect faces in one YOLO call and embed the crops in one FaceNet call"""
+        detections = get_yolo_model()([image for _, _, image in batch], verbose=False)
+
+        crops, owners = [], []
+        for (customer_id, name, image), result in zip(batch, detections):
+            box = largest_box(result.boxes)
+            if box is None:
+                failures[customer_id] = "no face detected"
+                continue
+            x1, y1, x2, y2 = box
+            crops.append(image[y1:y2, x1:x2])
+            owners.append((customer_id, name))
+
+        if not crops:
+            return []
+        embeddings = embed_faces(crops)
+        return [(customer_id, name, embedding) for (customer_id, name), embedding in zip(owners, embeddings)]
+
+    def _load_images(self, rows: List[Tuple], image_dir: Optional[str],
+                     failures: Dict[int, str]) -> Iterable[Tuple[int, str, np.ndarray]]:
+        """Decode pictures on a thread pool, yielding them in input order"""
+        def load(row):
+            customer_id, name, picture = row
+            path = resolve_picture(customer_id, picture, image_dir)
+            image = cv2.imread(path) if path else None
+            return customer_id, name, image
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for customer_id, name, image in executor.map(load, rows):
+                if image is None:
+                    failures[customer_id] = "picture not found"
+                    continue
+                yield customer_id, name, image
+
+    def _update_face_index(self, enrolled: List[Tuple], previous_checksum: Optional[str]):
+        """Apply new embeddings to the persisted face index, if one is configured
+
+        Upserting is only safe if the index matched the database before this
+        run wrote its embeddings; otherwise the index is rebuilt.
+        """
+        if self.settings.face_index_type == "exact":
+            return
+        try:
+            face_index = FaceIndex(self.settings.face_index_path, index_type=self.settings.face_index_type)
+            if face_index.load() and face_index.checksum == previous_checksum:
+                for customer_id, name, embedding in enrolled:
+                    face_index.upsert(customer_id, name, embedding)
+                face_index.mark_current(self.settings.db_path)
+            else:
+                face_index.build_from_db(self.settings.db_path)
+            face_index.save()
+        except Exception as e:
+            print(f"Error updating face index: {e}")
+
+    def run(self, image_dir: Optional[str] = None, customer_ids: Optional[List[int]] = None,
+            only_missing: bool = False) -> Dict:
+        """Enrol customers and write all embeddings in a single transaction"""
+        start_time = time.time()
+        rows = self._pending_customers(customer_ids, only_missing)
+        failures: Dict[int, str] = {}
+        enrolled = []
+
+        batch = []
+        for item in self._load_images(rows, image_dir, failures):
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                enrolled.extend(self._embed_batch(batch, failures))
+                batch = []
+        if batch:
+            enrolled.extend(self._embed_batch(batch, failures))
+
+        if enrolled:
+            previous_checksum = None
+            if self.settings.face_index_type != "exact":
+                ensure_embedding_version(self.settings.db_path)
+                previous_checksum = embeddings_checksum(self.settings.db_path)
+            conn = sqlite3.connect(self.settings.db_path, timeout=self.settings.db_timeout)
+            with conn:
+                conn.executemany(
+                    "UPDATE customers SET embedding = ? WHERE id = ?",
+                    [(serialize_embedding(embedding), customer_id) for customer_id, _, embedding in enrolled]
+                )
+            conn.close()
+            self._update_face_index(enrolled, previous_checksum)
+
+        return {
+            "customers": len(rows),
+            "enrolled": len(enrolled),
+            "failures": failures,
+            "elapsed": time.time() - start_time
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create face embeddings for customers from their pictures")
+    parser.add_argument("--image-dir", help="Directory with customer pictures (<id>.jpg or the picture basename)")
+    parser.add_argument("--ids", type=int, nargs="*", help="Only enrol these customer ids")
+    parser.add_argument("--only-missing", action="store_true", help="Skip customers that already have an embedding")
+    parser.add_argument("--batch-size", type=int, default=32, help="Pictures per YOLO/FaceNet batch")
+    parser.add_argument("--workers", type=int, default=4, help="Threads decoding pictures")
+    args = parser.parse_args()
+
+    report = FaceEnrolment(batch_size=args.batch_size, workers=args.workers).run(
+        image_dir=args.image_dir,
+        customer_ids=args.ids,
+        only_missing=args.only_missing
+    )
+    print(f"Enrolled {report['enrolled']}/{report['customers']} customers in {report['elapsed']:.1f}s")
+    for customer_id, reason in report["failures"].items():
+        print(f"- customer {customer_id}: {reason}")
@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # faiss is optional; callers fall back to exact search
+    faiss = None
+
+# Get base directory
+BASE_DIR = Path(__file__).parent.parent
+
+INDEX_FILE = "face.index"
+META_FILE = "face_meta.json"
+
+# One-row counter bumped by triggers whenever an embedding changes, so staleness is a single lookup
+VERSION_TABLE = "face_embedding_version"
+VERSION_TRIGGERS = {
+    "insert": "AFTER INSERT ON customers WHEN NEW.embedding IS NOT NULL",
+    "update": "AFTER UPDATE OF id, embedding ON customers",
+    "delete": "AFTER DELETE ON customers WHEN OLD.embedding IS NOT NULL",
+}
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalise rows so inner product equals cosine similarity"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        return matrix / (np.linalg.norm(matrix) + 1e-10)
+    return matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-10)
+
+
+def load_enrolled_embeddings(db_path: str):
+    """Read (ids, names, normalised matrix) for every customer with an embedding"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name, embedding FROM customers WHERE embedding IS NOT NULL")
+    rows = cursor.fetchall()
+    conn.close()
+
+    ids, names, vectors = [], [], []
+    for customer_id, name, embedding in rows:
+        try:
+            vectors.append(np.array(json.loads(embedding), dtype=np.float32))
+            ids.append(customer_id)
+            names.append(name)
+        except Exception as e:
+            print(f"Error processing embedding for {name}: {e}")
+
+    matrix = normalize(np.stack(vectors)) if vectors else np.zeros((0, 0), dtype=np.float32)
+    return ids, names, matrix
+
+
+def embeddings_checksum(db_path: str) -> str:
+    """Checksum of every (id, embedding) row, so re-enrolments change it even when the count does not"""
+    digest = hashlib.sha256()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute("SELECT id, embedding FROM customers WHERE embedding IS NOT NULL ORDER BY id")
+    for customer_id, embedding in cursor:
+        digest.update(f"{customer_id}:{embedding}\n".encode("utf-8"))
+    conn.close()
+    return digest.hexdigest()
+
+
+def ensure_embedding_version(db_path: str) -> bool:
+    """Create the embedding version counter and the triggers that bump it"""
+    try:
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} "
+                "(id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)"
+            )
+            conn.execute(f"INSERT OR IGNORE INTO {VERSION_TABLE} (id, version) VALUES (1, 0)")
+            for action, event in VERSION_TRIGGERS.items():
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS trg_{VERSION_TABLE}_{action} {event}\n"
+                    f"BEGIN\n    UPDATE {VERSION_TABLE} SET version = version + 1 WHERE id = 1;\nEND"
+                )
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"Error creating face embedding version triggers: {e}")
+        return False
+
+
+def embedding_version(db_path: str) -> Optional[int]:
+    """Current embedding version, or None if the counter has not been created"""
+    try:
+        conn = sqlite3.connect(db_path)
+        row = conn.execute(f"SELECT version FROM {VERSION_TABLE} WHERE id = 1").fetchone()
+        conn.close()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+
+class FaceIndex:
+    """FAISS (HNSW or IVF) index over customer face embeddings, persisted on disk
+
+    Vectors are stored by position. Re-enrolling a customer appends a new
+    vector and leaves the old position as a tombstone that search skips;
+    the index is rebuilt once tombstones exceed ``max_stale_ratio``.
+    """
+
+    def __init__(self, index_path: str, index_type: str = "hnsw", hnsw_m: int = 32,
+                 ef_search: int = 64, nprobe: int = 8, max_stale_ratio: float = 0.2):
+        if faiss is None:
+            raise ImportError("faiss is required for FaceIndex; install faiss-cpu")
+        if index_type not in ("hnsw", "ivf"):
+            raise ValueError(f"Unsupported face index type: {index_type}")
+        self.index_path = index_path
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.max_stale_ratio = max_stale_ratio
+
+        self.index = None
+        self.positions: List[Optional[int]] = []  # position -> customer id (None if stale)
+        self.names: Dict[int, str] = {}
+        self.current: Dict[int, int] = {}  # customer id -> live position
+        self.checksum: Optional[str] = None  # embeddings_checksum of the rows the index was built from
+        self.version: Optional[int] = None   # embedding_version at that time
+
+    def __len__(self) -> int:
+        return len(self.current)
+
+    def _new_index(self, dim: int, training: np.ndarray):
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = self.ef_search
+            return index
+
+        nlist = max(1, min(int(np.sqrt(len(training))), len(training)))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(training)
+        index.nprobe = min(self.nprobe, nlist)
+        return index
+
+    def build(self, ids: List[int], names: List[str], matrix: np.ndarray):
+        """Build the index from scratch"""
+        matrix = normalize(matrix)
+        self.index = self._new_index(matrix.shape[1], matrix) if len(ids) else None
+        if self.index is not None:
+            self.index.add(matrix)
+        self.positions = list(ids)
+        self.names = dict(zip(ids, names))
+        self.current = {customer_id: position for position, customer_id in enumerate(ids)}
+
+    def build_from_db(self, db_path: str):
+        self.mark_current(db_path)
+        self.build(*load_enrolled_embeddings(db_path))
+
+    def mark_current(self, db_path: str):
+        """Record the database state the index now reflects (version first, so a concurrent write reads as stale)"""
+        self.version = embedding_version(db_path)
+        self.checksum = embeddings_checksum(db_path)
+
+    def upsert(self, customer_id: int, name: str, embedding: np.ndarray):
+        """Add or replace one customer's embedding (called on enrolment)"""
+        vector = normalize(embedding).reshape(1, -1)
+        if self.index is None:
+            self.build([customer_id], [name], vector)
+            return
+
+        old_position = self.current.get(customer_id)
+        if old_position is not None:
+            self.positions[old_position] = None
+
+        self.index.add(vector)
+        self.positions.append(customer_id)
+        self.names[customer_id] = name
+        self.current[customer_id] = len(self.positions) - 1
+
+        if self.stale_ratio() > self.max_stale_ratio:
+            self._compact()
+
+    def stale_ratio(self) -> float:
+        if not self.positions:
+            return 0.0
+        return 1.0 - len(self.current) / len(self.positions)
+
+    def _compact(self):
+        """Rebuild without tombstones"""
+        live = sorted(self.current.items(), key=lambda item: item[1])
+        if self.index_type == "ivf":
+            self.index.make_direct_map()
+        vectors = np.stack([self.index.reconstruct(position) for _, position in live])
+        ids = [customer_id for customer_id, _ in live]
+        self.build(ids, [self.names[customer_id] for customer_id in ids], vectors)
+
+    def search(self, embedding: np.ndarray, k: int = 2) -> List[Dict]:
+        """Top-k candidates by ascending cosine distance, each with its margin to the next one"""
+        if self.index is None or not self.current:
+            return []
+        stale = len(self.positions) - len(self.current)
+        fetch = min(len(self.positions), k + 1 + stale)
+        similarities, positions = self.index.search(normalize(embedding).reshape(1, -1), fetch)
+
+        candidates = []
+        for similarity, position in zip(similarities[0], positions[0]):
+            if position < 0:
+                continue
+            customer_id = self.positions[position]
+            if customer_id is None or self.current.get(customer_id) != position:
+                continue
+            candidates.append({
+                'name': self.names[customer_id],
+                'id': customer_id,
+                'distance': float(1.0 - similarity)
+            })
+            if len(candidates) == k + 1:
+                break
+
+        for current, following in zip(candidates, candidates[1:]):
+            current['margin'] = following['distance'] - current['distance']
+        if candidates:
+            candidates[-1].setdefault('margin', float("inf"))
+        return candidates[:k]
+
+    def save(self):
+        """Persist index and metadata; files are replaced atomically"""
+        os.makedirs(self.index_path, exist_ok=True)
+        if self.stale_ratio() > 0:
+            self._compact()
+
+        meta = {
+            "index_type": self.index_type,
+            "ids": self.positions,
+            "names": {str(customer_id): name for customer_id, name in self.names.items()},
+            "checksum": self.checksum,
+            "version": self.version,
+        }
+        index_file = os.path.join(self.index_path, INDEX_FILE)
+        meta_file = os.path.join(self.index_path, META_FILE)
+        if self.index is not None:
+            faiss.write_index(self.index, index_file + ".tmp")
+            os.replace(index_file + ".tmp", index_file)
+        with open(meta_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_file + ".tmp", meta_file)
+
+    def load(self) -> bool:
+        """Load a persisted index; returns False if none exists or it was built with another type"""
+        index_file = os.path.join(self.index_path, INDEX_FILE)
+        meta_file = os.path.join(self.index_path, META_FILE)
+        if not (os.path.exists(index_file) and os.path.exists(meta_file)):
+            return False
+        try:
+            with open(meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("index_type") != self.index_type:
+                return False
+
+            self.index = faiss.read_index(index_file)
+            if self.index_type == "hnsw":
+                self.index.hnsw.efSearch = self.ef_search
+            else:
+                self.index.nprobe = min(self.nprobe, self.index.nlist)
+            self.positions = meta["ids"]
+            self.names = {int(customer_id): name for customer_id, name in meta["names"].items()}
+            self.current = {customer_id: position for position, customer_id in enumerate(self.positions)}
+            self.checksum = meta.get("checksum")
+            self.version = meta.get("version")
+            return True
+        except Exception as e:
+            print(f"Error loading face index: {e}")
+            return False
+
+    @classmethod
+    def load_or_build(cls, index_path: str, db_path: str, **kwargs) -> "FaceIndex":
+        """Load the persisted index, rebuilding it if missing or out of step with the database
+
+        The version counter is checked first; the full checksum is only read
+        when the versions differ (or the counter is new), e.g. after an
+        upgrade or a write made before the triggers existed.
+        """
+        ensure_embedding_version(db_path)
+        face_index = cls(index_path, **kwargs)
+        if not face_index.load():
+            face_index.build_from_db(db_path)
+            face_index.save()
+            return face_index
+
+        version = embedding_version(db_path)
+        if version is not None and face_index.version == version:
+            return face_index
+        # Compare contents, not counts: a re-enrolled customer keeps the count but changes the embedding
+        if face_index.checksum == embeddings_checksum(db_path):
+            face_index.version = version
+        else:
+            face_index.build_from_db(db_path)
+        face_index.save()
+        return face_index
+
+    def check_recall(self, db_path: str, threshold: float, noise: float = 0.0, seed: int = 0) -> Dict:
+        """Compare top-1 results against exact search for queries that match within threshold
+
+        Queries are the enrolled embeddings, optionally perturbed with
+        Gaussian noise to simulate a fresh capture.
+        """
+        ids, _, matrix = load_enrolled_embeddings(db_path)
+        if not ids:
+            return {"queries": 0, "recall": 1.0, "mismatches": []}
+
+        queries = matrix
+        if noise > 0:
+            rng = np.random.default_rng(seed)
+            queries = normalize(matrix + rng.normal(0, noise, matrix.shape).astype(np.float32))
+
+        exact_distances = 1.0 - queries @ matrix.T
+        evaluated, hits, mismatches = 0, 0, []
+        for row, query in enumerate(queries):
+            best = int(np.argmin(exact_distances[row]))
+            if exact_distances[row, best] >= threshold:
+                continue
+            evaluated += 1
+            approximate = self.search(query, k=1)
+            if approximate and approximate[0]['id'] == ids[best]:
+                hits += 1
+            else:
+                mismatches.append(ids[best])
+
+        return {
+            "queries": evaluated,
+            "recall": hits / evaluated if evaluated else 1.0,
+            "mismatches": mismatches
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build the approximate face index and check it against exact search")
+    parser.add_argument("--db", default=str(BASE_DIR / "Database.db"), help="Path to the SQLite database")
+    parser.add_argument("--path", default=str(BASE_DIR / "face_index"), help="Directory for the persisted index")
+    parser.add_argument("--type", default="hnsw", choices=["hnsw", "ivf"], help="FAISS index type")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Match threshold (cosine distance)")
+    parser.add_argument("--noise", type=float, default=0.01, help="Noise added to recall queries")
+    args = parser.parse_args()
+
+    start = time.time()
+    face_index = FaceIndex(args.path, index_type=args.type)
+    face_index.build_from_db(args.db)
+    face_index.save()
+    print(f"Built {args.type} face index with {len(face_index)} customers in {time.time() - start:.2f}s")
+
+    report = face_index.check_recall(args.db, args.threshold, noise=args.noise)
+    print(f"Recall@1 vs exact search: {report['recall']:.4f} over {report['queries']} queries")
+    if report["mismatches"]:
+        print(f"Mismatched customers: {report['mismatches']}")
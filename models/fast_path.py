@@ -0,0 +1,349 @@
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils import fold_vietnamese
+
+from .search_index import search
+
+# Intent keywords, matched on the accent-folded question
+INTENT_KEYWORDS = {
+    "store_hours": ["gio mo cua", "mo cua", "dong cua", "gio hoat dong", "gio lam viec", "may gio"],
+    "store_address": ["dia chi", "o dau", "nam o"],
+    "store_phone": ["so dien thoai", "dien thoai", "sdt", "hotline"],
+    "product_caffeine": ["caffeine", "caffein", "cafein"],
+    "product_calories": ["calo", "calories", "kcal", "nang luong"],
+    "product_sugar": ["duong", "sugar"],
+    "product_protein": ["protein", "chat dam"],
+}
+
+# Words that make a question more than a single lookup (comparisons, rankings, advice)
+COMPLEX_KEYWORDS = [
+    "so sanh", "nhieu nhat", "it nhat", "cao nhat", "thap nhat", "tong", "trung binh", "thong ke",
+    "liet ke", "danh sach", "nen", "goi y", "tu van", "hon", "khac nhau", "tat ca cac",
+]
+
+# Phrases that make a question something other than a catalogue lookup: health or
+# family advice ("tiểu đường" is not sugar content) or the customer's own orders
+EXCLUDED_PHRASES = [
+    "gia dinh", "tham gia", "tieu duong", "don hang", "giao", "dat hang", "lan truoc", "da mua", "hom qua",
+]
+
+# Words that frame a lookup question without changing what is asked
+FRAME_PHRASES = ["cua hang", "chi nhanh", "co so", "ham luong", "cho toi hoi", "vui long"]
+FRAME_WORDS = {
+    "co", "bao", "nhieu", "la", "gi", "luc", "o", "dau", "cua", "the", "nao", "vay", "a", "khong", "cho",
+    "toi", "minh", "hoi", "ban", "oi", "xin", "nhe", "ly", "mot", "duoc", "hien", "nay", "chua", "trong",
+    "biet", "muon", "thi", "nhi", "so", "store", "size", "loai", "cac",
+}
+
+# Nutrition intents: (Product column, label, unit)
+NUTRITION_FIELDS = {
+    "product_caffeine": ("Caffeine_mg", "caffeine", "mg"),
+    "product_calories": ("Calories", "năng lượng", "calo"),
+    "product_sugar": ("Sugars_g", "đường", "g"),
+    "product_protein": ("Protein_g", "protein", "g"),
+}
+
+PREP_SIZES = ("short", "tall", "grande", "venti")
+
+_STORE_NUMBER = re.compile(r"\b(?:cua hang|store|chi nhanh|co so)\s*(?:so\s*)?(\d+)\b")
+
+
+def _contains(text: str, phrase: str) -> bool:
+    return re.search(rf"\b{re.escape(phrase)}\b", text) is not None
+
+
+def _unexplained(folded: str, phrases: List[str]) -> List[str]:
+    """Words of the question not part of the given phrases or of the question frame"""
+    explained = FRAME_WORDS | {word for phrase in phrases + FRAME_PHRASES for word in phrase.split()}
+    return [word for word in folded.split() if word not in explained]
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def label_preparations(rows: List[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+    """Name each preparation with its size
+
+    Product rows list a size once ("Tall Nonfat Milk") followed by the other
+    milks of that size ("2% Milk", "Soymilk"), so the size is carried forward.
+    """
+    labelled, size = [], None
+    for prep, value in rows:
+        prep = " ".join((prep or "").split())
+        first_word = prep.split()[0] if prep else ""
+        if first_word.lower() in PREP_SIZES:
+            size = first_word
+        elif size:
+            prep = f"{size} {prep}"
+        labelled.append((prep, value))
+    return labelled
+
+
+@dataclass
+class FastAnswer:
+    """A question answered locally, with what was matched"""
+    intent: str
+    entity: str
+    confidence: float
+    answer: str
+    # Phrases of the question the answer accounts for (entity name, preparation words)
+    terms: List[str] = field(default_factory=list, repr=False)
+
+
+class FastPath:
+    """Answers single-entity lookups (store hours/address/phone, drink nutrition) from SQLite
+
+    Questions are matched with keyword intents and product/store name lookup
+    on accent-folded text. Anything ambiguous or more complex than one lookup,
+    including questions with words the intent and entity do not explain, gets
+    a low confidence and goes to the full LLM pipeline.
+    """
+
+    def __init__(self, db_path: str, timeout: int = 30, min_confidence: float = 0.8):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._names_version = None
+        self._product_names: Dict[str, str] = {}   # folded name -> display name
+        self.stats = {"queries": 0, "hits": 0, "fallbacks": 0, "intents": {}}
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=self.timeout)
+
+    def _load_names(self, cursor: sqlite3.Cursor):
+        """Reload product names when the catalogue changes"""
+        cursor.execute("SELECT COUNT(*), COALESCE(MAX(Id), 0) FROM Product")
+        version = cursor.fetchone()
+        with self._lock:
+            if version == self._names_version:
+                return
+        cursor.execute("SELECT DISTINCT TRIM(Name) FROM Product WHERE Name IS NOT NULL")
+        names = {}
+        for (name,) in cursor.fetchall():
+            display = " ".join(name.split())
+            names[fold_vietnamese(display)] = display
+        with self._lock:
+            self._product_names = names
+            self._names_version = version
+
+    def _find_products(self, cursor: sqlite3.Cursor, folded: str) -> List[str]:
+        """Product names mentioned in the question; the longest match wins over names it contains"""
+        try:
+            # Only products sharing a word with the question are checked
+            ids = search(cursor, "fts_product", folded, limit=100, any_word=True, column="name")
+            names = {}
+            if ids:
+                cursor.execute(f"SELECT DISTINCT TRIM(Name) FROM Product WHERE Id IN ({', '.join('?' * len(ids))})",
+                               ids)
+                for (name,) in cursor.fetchall():
+                    display = " ".join((name or "").split())
+                    names[fold_vietnamese(display)] = display
+        except sqlite3.OperationalError:
+            # No search index in this database: check every cached name
+            self._load_names(cursor)
+            with self._lock:
+                names = self._product_names
+        matches = [name for name in names if _contains(folded, name)]
+        matches = [name for name in matches if not any(name != other and name in other for other in matches)]
+        return [names[name] for name in matches]
+
+    def _find_stores(self, cursor: sqlite3.Cursor, folded: str) -> List[Tuple]:
+        """Stores mentioned by number ("cửa hàng 3", "store 3") or by name"""
+        try:
+            ids = search(cursor, "fts_store", folded, limit=50, any_word=True, column="name")
+            cursor.execute(
+                f"SELECT Id, Name, Address, Phone, Open_Close FROM Store WHERE Id IN ({', '.join('?' * len(ids))})",
+                ids
+            )
+        except sqlite3.OperationalError:
+            cursor.execute("SELECT Id, Name, Address, Phone, Open_Close FROM Store")
+        stores = cursor.fetchall()
+        numbers = set(_STORE_NUMBER.findall(folded))
+        found = []
+        for store in stores:
+            name = fold_vietnamese(store[1] or "")
+            number = re.fullmatch(r"store (\d+)", name)
+            if _contains(folded, name) or (number and number.group(1) in numbers):
+                found.append(store)
+        return found
+
+    def _intents(self, folded: str) -> List[str]:
+        return [intent for intent, keywords in INTENT_KEYWORDS.items()
+                if any(_contains(folded, keyword) for keyword in keywords)]
+
+    def _store_answer(self, cursor: sqlite3.Cursor, intent: str, folded: str) -> Optional[FastAnswer]:
+        stores = self._find_stores(cursor, folded)
+        if len(stores) > 1:
+            return None
+        if not stores:
+            # "Cửa hàng mở cửa lúc mấy giờ?" has one answer when every store keeps the same hours;
+            # without "cửa hàng", "mấy giờ" may be about anything (an order, a delivery)
+            if intent != "store_hours" or not _contains(folded, "cua hang"):
+                return None
+            cursor.execute("SELECT DISTINCT Open_Close FROM Store")
+            hours = cursor.fetchall()
+            if len(hours) != 1:
+                return None
+            open_time, _, close_time = str(hours[0][0]).partition("-")
+            cursor.execute("SELECT COUNT(*) FROM Store")
+            count = cursor.fetchone()[0]
+            return FastAnswer(intent, "*", 0.9,
+                              f"Tất cả {count} cửa hàng đều mở cửa từ {open_time} đến {close_time} hằng ngày.")
+
+        _, name, address, phone, open_close = stores[0]
+        terms = [fold_vietnamese(name or "")] + _STORE_NUMBER.findall(folded)
+        if intent == "store_hours":
+            open_time, _, close_time = str(open_close).partition("-")
+            answer = f"{name} mở cửa từ {open_time} đến {close_time}."
+        elif intent == "store_address":
+            answer = f"{name} nằm ở địa chỉ {address}."
+        else:
+            answer = f"Số điện thoại của {name} là {phone}."
+        return FastAnswer(intent, name, 1.0, answer, terms)
+
+    def _product_answer(self, cursor: sqlite3.Cursor, intent: str, folded: str) -> Optional[FastAnswer]:
+        products = self._find_products(cursor, folded)
+        if len(products) != 1:
+            return None
+        name = products[0]
+
+        column, label, unit = NUTRITION_FIELDS[intent]
+        cursor.execute(f"SELECT Product_Prep, {column} FROM Product WHERE TRIM(Name) = ? ORDER BY Id", (name,))
+        preps = label_preparations(cursor.fetchall())
+        terms = [fold_vietnamese(name)] + [fold_vietnamese(prep) for prep, _ in preps]
+
+        # A size or milk named in the question ("grande", "soymilk") narrows the preparations
+        query_words = set(folded.split())
+        mentioned = query_words & {word for prep, _ in preps for word in fold_vietnamese(prep).split()} - {"milk"}
+        if mentioned:
+            preps = [(prep, value) for prep, value in preps
+                     if mentioned <= set(fold_vietnamese(prep).split())] or preps
+
+        values = [(prep, _number(value)) for prep, value in preps if _number(value) is not None]
+        if not values:
+            return None
+        low = min(value for _, value in values)
+        high = max(value for _, value in values)
+        if low == high:
+            answer = f"{name} có {low:g} {unit} {label}."
+        elif len(values) <= 4:
+            details = ", ".join(f"{prep}: {value:g} {unit}" for prep, value in values)
+            answer = f"{name} có từ {low:g} đến {high:g} {unit} {label} ({details})."
+        else:
+            answer = f"{name} có từ {low:g} đến {high:g} {unit} {label} tùy kích cỡ và loại sữa."
+        return FastAnswer(intent, name, 1.0, answer, terms)
+
+    def match(self, query: str) -> Optional[FastAnswer]:
+        """Best local answer for the question with its confidence, or None if it is not a lookup"""
+        folded = " ".join(re.sub(r"[?!.,;:]", " ", fold_vietnamese(query)).split())
+        if any(_contains(folded, phrase) for phrase in COMPLEX_KEYWORDS + EXCLUDED_PHRASES):
+            return None
+
+        intents = self._intents(folded)
+        if not intents:
+            return None
+        # Two lookups in one question ("giá và calo") are left to the LLM
+        confidence = 1.0 if len(intents) == 1 else 0.5
+        intent = intents[0]
+
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            if intent.startswith("store_"):
+                result = self._store_answer(cursor, intent, folded)
+            else:
+                result = self._product_answer(cursor, intent, folded)
+        finally:
+            conn.close()
+        if result is None:
+            return None
+        # Words not explained by the intent, the entity or the question frame
+        # ("có tốt cho ... không") mean the question asks more than the lookup
+        keywords = [keyword for name in intents for keyword in INTENT_KEYWORDS[name]]
+        if _unexplained(folded, keywords + result.terms):
+            confidence *= 0.5
+        result.confidence *= confidence
+        return result
+
+    def answer(self, query: str) -> Optional[FastAnswer]:
+        """Answer locally when confident enough; None hands the question to the full pipeline"""
+        try:
+            result = self.match(query)
+        except Exception as e:
+            print(f"Error in fast path: {e}")
+            result = None
+
+        hit = result is not None and result.confidence >= self.min_confidence
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["hits" if hit else "fallbacks"] += 1
+            if hit:
+                self.stats["intents"][result.intent] = self.stats["intents"].get(result.intent, 0) + 1
+        return result if hit else None
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            return self.stats["hits"] / self.stats["queries"] if self.stats["queries"] else 0.0
+
+
+def evaluate(fast_path: FastPath, labelled: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Hit rate and accuracy on questions labelled {"query", "intent", "entity"}
+
+    intent/entity are null for questions that should go to the LLM; a hit
+    is accurate when both the intent and the entity match the label.
+    """
+    hits, correct, missed, wrong = 0, 0, 0, []
+    for entry in labelled:
+        result = fast_path.answer(entry["query"])
+        expected = entry.get("intent")
+        if result is None:
+            missed += int(expected is not None)
+            continue
+        hits += 1
+        entity_ok = entry.get("entity") is None or fold_vietnamese(entry["entity"]) == fold_vietnamese(result.entity)
+        if result.intent == expected and entity_ok:
+            correct += 1
+        else:
+            wrong.append((entry["query"], result.intent, result.entity))
+    lookups = sum(entry.get("intent") is not None for entry in labelled)
+    return {
+        "questions": len(labelled),
+        "hit_rate": hits / len(labelled) if labelled else 0.0,
+        "accuracy": correct / hits if hits else 0.0,
+        "lookup_coverage": correct / lookups if lookups else 0.0,
+        "missed_lookups": missed,
+        "wrong": wrong,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Try the fast path on questions, or measure it on a labelled set")
+    parser.add_argument("questions", nargs="*", help="Questions to answer")
+    parser.add_argument("--eval", help='JSONL with {"query", "intent", "entity"} (null intent = needs the LLM)')
+    args = parser.parse_args()
+
+    fast_path = FastPath(Config.db_path, Config.db_timeout, Config.fast_path_min_confidence)
+    for question in args.questions:
+        result = fast_path.match(question)
+        print(f"{question}\n  -> {result}")
+    if args.eval:
+        with open(args.eval, "r", encoding="utf-8") as f:
+            report = evaluate(fast_path, [json.loads(line) for line in f if line.strip()])
+        print(f"Hit rate {report['hit_rate']:.2f}, accuracy {report['accuracy']:.2f}, "
+              f"lookup coverage {report['lookup_coverage']:.2f} ({report['missed_lookups']} lookups missed)")
+        for query, intent, entity in report["wrong"]:
+            print(f"- wrong: {query} -> {intent} / {entity}")
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from config import Config
+
+# Layout under Config.vector_store_path:
+#   versions/<version>/index.faiss, index.pkl, manifest.json   immutable once published
+#   CURRENT                                                     name of the live version
+# A vector_store_path holding index.faiss directly is the legacy single-index layout.
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".build.lock"
+LEGACY_VERSION = "legacy"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def version_path(store_path: str, version: str) -> str:
+    if version == LEGACY_VERSION:
+        return store_path
+    return os.path.join(store_path, VERSIONS_DIR, version)
+
+
+def list_versions(store_path: str) -> List[str]:
+    """Published versions, oldest first (names sort by build time)"""
+    versions_dir = os.path.join(store_path, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(versions_dir)
+        if os.path.exists(os.path.join(versions_dir, name, MANIFEST_FILE))
+    )
+
+
+def current_version(store_path: str) -> Optional[str]:
+    """Live version: the CURRENT pointer, else the legacy index if one exists"""
+    try:
+        with open(os.path.join(store_path, CURRENT_FILE), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        if version:
+            return version
+    except FileNotFoundError:
+        pass
+    if os.path.exists(os.path.join(store_path, "index.faiss")):
+        return LEGACY_VERSION
+    return None
+
+
+def read_manifest(store_path: str, version: str) -> Dict[str, Any]:
+    if version == LEGACY_VERSION:
+        return {"version": LEGACY_VERSION}
+    with open(os.path.join(version_path(store_path, version), MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def set_current(store_path: str, version: str):
+    """Point CURRENT at a published version; readers see the old or the new name, never a partial one"""
+    if version != LEGACY_VERSION and version not in list_versions(store_path):
+        raise ValueError(f"Unknown index version: {version}")
+    tmp_file = os.path.join(store_path, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, os.path.join(store_path, CURRENT_FILE))
+
+
+def prune_versions(store_path: str, keep: int):
+    """Delete the oldest versions beyond ``keep``, never the live one"""
+    live = current_version(store_path)
+    versions = list_versions(store_path)
+    for version in versions[:max(0, len(versions) - keep)]:
+        if version != live:
+            shutil.rmtree(version_path(store_path, version), ignore_errors=True)
+
+
+def to_hnsw(flat_index, neighbours: int = 32):
+    """Copy the vectors of an exact L2 index into an HNSW index (same metric, same ids)"""
+    import faiss
+
+    hnsw = faiss.IndexHNSWFlat(flat_index.d, neighbours)
+    hnsw.hnsw.efSearch = 64
+    hnsw.add(flat_index.reconstruct_n(0, flat_index.ntotal))
+    return hnsw
+
+
+@contextmanager
+def build_lock(store_path: str):
+    """Hold an exclusive lock so only one process builds at a time (no-op without fcntl)"""
+    os.makedirs(store_path, exist_ok=True)
+    with open(os.path.join(store_path, LOCK_FILE), "w") as lock:
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def build_index(config=None, activate: bool = True, keep: int = 5, if_missing: bool = False) -> str:
+    """Build a new index version from the database and optionally make it live
+
+    The index is written to a private staging directory and renamed into
+    versions/ only when complete, so readers never see a partial build.
+    Builds are serialised by a lock file; with ``if_missing`` a version
+    published by another process while waiting is returned instead.
+    """
+    settings = config or Config
+    with build_lock(settings.vector_store_path):
+        live = current_version(settings.vector_store_path)
+        if if_missing and live is not None:
+            return live
+        return _build_index(settings, activate, keep)
+
+
+def _build_index(settings, activate: bool, keep: int) -> str:
+    from langchain_community.vectorstores import FAISS
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from utils import load_table_data
+
+    store_path = settings.vector_store_path
+    start_time = time.time()
+
+    # Load data from database
+    db_checksum = file_sha256(settings.db_path)
+    documents = load_table_data(settings.db_path, settings.document_templates)
+    if not documents:
+        raise ValueError("No documents loaded from database")
+
+    texts = [doc["content"] for doc in documents]
+    metadatas = [doc["metadata"] for doc in documents]
+    print(f"Creating vector store with {len(texts)} documents")
+
+    embeddings = HuggingFaceEmbeddings(model_name=settings.embedding_model)
+    vector_store = FAISS.from_texts(texts=texts, embedding=embeddings, metadatas=metadatas)
+    if settings.vector_index_type == "hnsw":
+        vector_store.index = to_hnsw(vector_store.index)
+
+    # The suffix keeps names unique when two builds finish in the same second
+    version = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    staging = os.path.join(store_path, VERSIONS_DIR, f".staging-{version}-{os.getpid()}")
+    os.makedirs(staging)
+    try:
+        vector_store.save_local(staging)
+        manifest = {
+            "version": version,
+            "embedding_model": settings.embedding_model,
+            "index_type": settings.vector_index_type,
+            "documents": len(texts),
+            "db_sha256": db_checksum,
+            "built_at": datetime.now().isoformat(timespec="seconds"),
+            "build_seconds": round(time.time() - start_time, 1),
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.rename(staging, version_path(store_path, version))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    print(f"Built index version {version} in {manifest['build_seconds']}s")
+    if activate:
+        set_current(store_path, version)
+        prune_versions(store_path, keep)
+    return version
+
+
+def rollback(store_path: str, version: Optional[str] = None) -> str:
+    """Make ``version`` live, or the newest version older than the live one"""
+    if version is None:
+        live = current_version(store_path)
+        older = [v for v in list_versions(store_path) if live not in (None, LEGACY_VERSION) and v < live]
+        if not older:
+            raise ValueError("No earlier index version to roll back to")
+        version = older[-1]
+    set_current(store_path, version)
+    return version
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build, list and roll back versioned vector store indexes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build a new version from the database")
+    build_parser.add_argument("--no-activate", action="store_true", help="Publish without making it live")
+    build_parser.add_argument("--keep", type=int, default=Config.index_keep_versions, help="Versions to keep")
+    rollback_parser = subparsers.add_parser("rollback", help="Make an earlier version live")
+    rollback_parser.add_argument("--version", help="Version to activate (default: the previous one)")
+    subparsers.add_parser("list", help="Show published versions")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index(activate=not args.no_activate, keep=args.keep)
+    elif args.command == "rollback":
+        print(f"Live index version is now {rollback(Config.vector_store_path, args.version)}")
+    else:
+        live = current_version(Config.vector_store_path)
+        for name in list_versions(Config.vector_store_path):
+            manifest = read_manifest(Config.vector_store_path, name)
+            marker = "*" if name == live else " "
+            print(f"{marker} {name}  {manifest['documents']} docs  {manifest['embedding_model']}  "
+                  f"db {manifest['db_sha256'][:12]}  built {manifest['built_at']}")
+        if live == LEGACY_VERSION:
+            print("* legacy index at the top of the vector store directory")
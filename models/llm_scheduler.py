@@ -0,0 +1,243 @@
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Lower value is served first: final answers outrank SQL generation and routing
+PRIORITY_ANSWER = 0
+PRIORITY_SQL = 1
+PRIORITY_ROUTING = 2
+
+_RETRY_PATTERNS = [
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+(?:\.\d+)?)", re.IGNORECASE),
+    re.compile(r"retry[-_ ]after\D{0,5}(\d+(?:\.\d+)?)", re.IGNORECASE),
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) for quota accounting"""
+    return max(1, len(text) // 4)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return (
+        "429" in message
+        or "quota" in message
+        or "rate limit" in message
+        or "resourceexhausted" in type(error).__name__.lower()
+    )
+
+
+def parse_retry_delay(error: Exception) -> Optional[float]:
+    """Server-requested delay from a 429 error, if it advertises one"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            pass
+    message = str(error)
+    for pattern in _RETRY_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """Continuous-refill token bucket; capacity is the per-minute budget"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` tokens are available"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class LLMScheduler:
+    """Shared gate in front of the chat model
+
+    - token buckets for requests/min and tokens/min
+    - priority ordering: waiting calls are released strictly by priority, then arrival
+    - concurrency limit on in-flight calls
+    - retries 429s after the server's retry delay (or exponential backoff), with jitter;
+      a 429 pauses every caller since the quota is shared
+    - identical prompts already in flight share one call
+    """
+
+    def __init__(self, llm, requests_per_minute: int = 15, tokens_per_minute: int = 1_000_000,
+                 max_concurrency: int = 4, max_retries: int = 4, base_backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._paused_until = 0.0
+        self._in_flight: Dict[Tuple[int, str], Future] = {}
+
+        self.stats = {"calls": 0, "coalesced": 0, "retries": 0, "rate_limited": 0, "wait_seconds": 0.0}
+
+    def _acquire(self, tokens: int, priority: int):
+        """Block until this call is first in line and the budgets allow it"""
+        ticket = (priority, next(self._sequence))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                now = time.monotonic()
+                if self._waiting[0] == ticket and self._active < self.max_concurrency:
+                    wait = max(
+                        self._paused_until - now,
+                        self._requests.wait_time(1, now),
+                        self._tokens.wait_time(tokens, now)
+                    )
+                    if wait <= 0:
+                        heapq.heappop(self._waiting)
+                        self._requests.consume(1)
+                        self._tokens.consume(tokens)
+                        self._active += 1
+                        self.stats["calls"] += 1
+                        self.stats["wait_seconds"] += now - start
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _pause(self, delay: float):
+        with self._cond:
+            self.stats["rate_limited"] += 1
+            self.stats["retries"] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._cond.notify_all()
+
+    def _backoff(self, error: Exception, attempt: int) -> float:
+        delay = parse_retry_delay(error)
+        if delay is None:
+            delay = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        # Jitter so that callers paused together do not retry together
+        return delay + random.uniform(0, min(1.0, delay * 0.25))
+
+    def _call(self, prompt: str, priority: int, llm) -> Any:
+        tokens = estimate_tokens(prompt)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(tokens, priority)
+            try:
+                return llm.invoke(prompt)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(e, attempt)
+                print(f"LLM rate limited, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                self._pause(delay)
+            finally:
+                self._release()
+
+    def invoke(self, prompt: str, priority: int = PRIORITY_ANSWER, llm=None) -> Any:
+        """Invoke the wrapped model through the limiter
+
+        ``llm`` overrides the wrapped model for this call, so chat models that
+        share one quota (same model name, different temperature) share one
+        scheduler.
+        """
+        llm = llm or self.llm
+        key = (id(llm), prompt)
+        with self._cond:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.stats["coalesced"] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            future.set_result(self._call(prompt, priority, llm))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._cond:
+                self._in_flight.pop(key, None)
+        return future.result()
+
+    def stream(self, prompt: str, priority: int = PRIORITY_ANSWER, llm=None) -> Iterator[str]:
+        """Stream the reply text through the limiter
+        
+        The call holds its concurrency slot until the stream ends. A 429 is
+        only retried before the first chunk; streams are never coalesced.
+        """
+        llm = llm or self.llm
+        tokens = estimate_tokens(prompt)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(tokens, priority)
+            started = False
+            try:
+                for chunk in llm.stream(prompt):
+                    text = getattr(chunk, "content", chunk)
+                    if text:
+                        started = True
+                        yield text
+                return
+            except Exception as e:
+                if started or not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(e, attempt)
+                print(f"LLM rate limited, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                self._pause(delay)
+            finally:
+                self._release()
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    from .llm_stub import StubChatModel
+
+    # Exercise the scheduler against a local stub that answers the first calls with 429s
+    stub = StubChatModel(responder=lambda prompt: f"answer to {prompt}", fail_first=3, retry_delay=2, latency=0.05)
+    scheduler = LLMScheduler(stub, requests_per_minute=120, max_concurrency=2)
+
+    prompts = [("route", PRIORITY_ROUTING)] * 3 + [(f"question {i}", PRIORITY_ANSWER) for i in range(4)]
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+        futures = [executor.submit(scheduler.invoke, prompt, priority) for prompt, priority in prompts]
+        for future in futures:
+            print(future.result().content)
+
+    print(f"Finished in {time.time() - start:.1f}s; model calls: {stub.calls}; stats: {scheduler.stats}")
@@ -0,0 +1,52 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+
+@dataclass
+class StubMessage:
+    """Minimal stand-in for a LangChain AIMessage"""
+    content: str
+
+
+class QuotaExceededError(Exception):
+    """Error shaped like the Gemini 429 response, including its retry_delay block"""
+
+
+class StubChatModel:
+    """Local chat model for tests and offline tuning; no network or quota
+
+    responder: maps a prompt to the reply text (defaults to echoing "ok")
+    fail_first: number of initial calls that raise a 429 quota error
+    retry_delay: seconds advertised in the 429 message
+    latency: simulated seconds per call
+    """
+
+    def __init__(self, responder: Optional[Callable[[str], str]] = None, fail_first: int = 0,
+                 retry_delay: int = 1, latency: float = 0.0):
+        self.responder = responder or (lambda prompt: "ok")
+        self.fail_first = fail_first
+        self.retry_delay = retry_delay
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt: str) -> StubMessage:
+        with self._lock:
+            self.calls += 1
+            should_fail = self.calls <= self.fail_first
+        if self.latency:
+            time.sleep(self.latency)
+        if should_fail:
+            raise QuotaExceededError(
+                "429 You exceeded your current quota, please check your plan and billing details. "
+                f"[violations {{\n}}\n, retry_delay {{\n  seconds: {self.retry_delay}\n}}\n]"
+            )
+        return StubMessage(self.responder(prompt))
+
+    def stream(self, prompt: str) -> Iterator[StubMessage]:
+        """Yield the reply word by word, like a streaming chat model"""
+        words = self.invoke(prompt).content.split(" ")
+        for i, word in enumerate(words):
+            yield StubMessage(word if i == 0 else " " + word)
@@ -1,14 +1,81 @@
 from typing import List
 
+ROUTING_METHODS = """
+        Hệ thống có 2 phương pháp để trả lời:
+        1. Database (SQL) - Sử dụng khi cần:
+           - Tính toán số liệu (tổng, trung bình, đếm, v.v.)
+           - So sánh dữ liệu
+           - Thống kê
+           - Liệt kê danh sách
+           - Sắp xếp dữ liệu
+           - Lọc dữ liệu theo điều kiện
+           - Truy vấn dữ liệu có cấu trúc rõ ràng
+
+        2. Vector Store - Sử dụng khi cần:
+           - Tìm kiếm thông tin theo ngữ nghĩa
+           - Trả lời câu hỏi về nội dung chi tiết
+           - Tìm kiếm thông tin không có cấu trúc rõ ràng
+           - Trả lời câu hỏi mô tả, giải thích
+           - Tìm kiếm thông tin liên quan đến từ khóa
+"""
+
 class PromptManager:
     @staticmethod
-    def get_sql_generation_prompt(query: str, schema_info: str) -> str:
+    def get_routing_prompt(query: str) -> str:
+        """Decide between SQL and vector search"""
+        return f"""
+        Bạn là một chuyên gia trong việc lựa chọn phương pháp để trả lời người dùng.Phân tích câu hỏi sau và quyết định xem nên sử dụng phương pháp nào để trả lời:
+
+        Câu hỏi: {query}
+        {ROUTING_METHODS}
+        Yêu cầu:
+        1. Phân tích câu hỏi và quyết định phương pháp phù hợp nhất
+        2. Chỉ trả về "true" nếu nên dùng Database (SQL)
+        3. Chỉ trả về "false" nếu nên dùng Vector Store
+        4. Không giải thích thêm
+        """
+    
+    @staticmethod
+    def get_route_and_sql_prompt(query: str, schema_info: str, customer_identity: str = "",
+                                 previous_error: str = "") -> str:
+        """Decide the route and, for SQL, write the query in the same call"""
+        retry_note = ""
+        if previous_error:
+            retry_note = f"""
+        **Lưu ý:** Phản hồi trước không hợp lệ ({previous_error}). Chỉ trả về đúng một đối tượng JSON theo mẫu.
+        """
+        return f"""
+        Bạn là một chuyên gia trong việc lựa chọn phương pháp trả lời và là chuyên gia SQL.
+
+        Câu hỏi từ người dùng:
+        "{query}"
+        {customer_identity}
+        {ROUTING_METHODS}
+        **Cấu trúc database hiện có:**
+        {schema_info}
+
+        **Yêu cầu:**
+        1. Chọn phương pháp phù hợp nhất: "sql" (Database) hoặc "vector" (Vector Store)
+        2. Nếu chọn "sql", viết một truy vấn SELECT chạy được trên SQLite, chỉ dùng bảng và cột có trong cấu trúc trên
+        3. Với câu hỏi thống kê, ưu tiên các bảng tổng hợp summary_*
+        4. Khi tìm theo tên, mô tả hoặc địa chỉ, dùng các bảng tìm kiếm fts_* với MATCH (nếu có) thay vì LIKE '%...%'
+        5. Không sử dụng các từ khóa nguy hiểm (DROP, DELETE, UPDATE, INSERT, ALTER, TRUNCATE)
+        6. Nếu chọn "vector", để "sql" là null
+
+        **Định dạng trả về (chỉ JSON, không Markdown, không giải thích):**
+        {{"route": "sql" | "vector", "sql": "<truy vấn SQL>" | null}}
+        {retry_note}"""
+    
+
+    @staticmethod
+    def get_sql_generation_prompt(query: str, schema_info: str, customer_identity: str = "") -> str:
         """Generate SQL query based on database schema"""
         return f"""
         Bạn là một chuyên gia SQL. Hãy tạo một truy vấn SQL chính xác để trả lời câu hỏi của người dùng.
 
         Câu hỏi từ người dùng:
         "{query}"
+        {customer_identity}
 
         **Cấu trúc database hiện có:**
         {schema_info}
@@ -22,6 +89,8 @@ class PromptManager:
         6. Nếu cần sắp xếp, sử dụng `ORDER BY`
         7. Nếu cần nối bảng, sử dụng `JOIN` hợp lý
         8. Không giả định bất kỳ giá trị nào không có trong bảng
+        9. Với câu hỏi thống kê (bán chạy, doanh thu, đánh giá trung bình, chi tiêu), ưu tiên các bảng tổng hợp summary_* thay vì JOIN nhiều bảng
+        10. Khi tìm theo tên, mô tả hoặc địa chỉ (ví dụ "có ai tên Dũng"), dùng các bảng tìm kiếm fts_* với MATCH (nếu có) thay vì LIKE '%...%'
 
         **Quy tắc:**
         1. Chỉ trả về mã SQL, không có giải thích
@@ -31,11 +100,12 @@ class PromptManager:
         """
     
     @staticmethod
-    def get_vector_prompt(context: list, query: str, history: str) -> str:
+    def get_vector_prompt(context: list, query: str, history: str, customer_context: str = "") -> str:
         """Generate vector search prompt"""
         return f"""
         {history}
         
+        {customer_context}
         
         Bạn là một trợ lí AI thông minh của hệ thống cửa hàng đồ uống. Bạn có thể:
         - Tư vấn về các loại đồ uống
@@ -50,7 +120,7 @@ class PromptManager:
 
         Yêu cầu:
         1. Dựa vào lịch sử mua hàng để tư vấn sản phẩm phù hợp(nếu có)
-        2. Đề xuất các sản phẩm tương tự với những gì khách hàng đã mua (nếu có)
+        2. Khi gợi ý sản phẩm, dùng danh sách sản phẩm gợi ý đã xếp hạng theo đúng thứ tự (nếu có)
         3. Trả lời ngắn gọn, tự nhiên và thân thiện
         4. Chỉ sử dụng thông tin từ kết quả tính toán
         5. Duy trì tính nhất quán với các câu trả lời trước
@@ -71,11 +141,13 @@ class PromptManager:
         """
     
     @staticmethod
-    def get_sql_response_prompt(query: str, results: str, history: str) -> str:
+    def get_sql_response_prompt(query: str, results: str, history: str, customer_context: str = "") -> str:
         """Generate SQL response prompt"""
         return f"""
         {history}
 
+        {customer_context}
+
         Bạn là một trợ lí AI thông minh của hệ thống cửa hàng đồ uống. Bạn có thể:
         - Tư vấn về các loại đồ uống
         - Giải đáp thắc mắc về khách hàng về các thông tin liên quan đến cửa hàng
@@ -89,7 +161,7 @@ class PromptManager:
 
         Yêu cầu:
         1. Dựa vào lịch sử mua hàng để tư vấn sản phẩm phù hợp(nếu có)
-        2. Đề xuất các sản phẩm tương tự với những gì khách hàng đã mua (nếu có)
+        2. Khi gợi ý sản phẩm, dùng danh sách sản phẩm gợi ý đã xếp hạng theo đúng thứ tự (nếu có)
         3. Trả lời ngắn gọn, tự nhiên và thân thiện
         4. Chỉ sử dụng thông tin từ kết quả tính toán
         5. Duy trì tính nhất quán với các câu trả lời trước
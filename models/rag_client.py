@@ -0,0 +1,49 @@
+import codecs
+import json
+import urllib.request
+from typing import Any, Dict, Iterator, Optional
+
+
+class RAGClient:
+    """HTTP client for server.py, used by the Streamlit app in thin-client mode"""
+
+    def __init__(self, base_url: str, timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _open(self, path: str, payload: Optional[Dict[str, Any]] = None):
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(
+            f"{self.base_url}{path}",
+            data=data,
+            headers={"Content-Type": "application/json"} if data is not None else {}
+        )
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def answer(self, query: str, customer_id: Optional[int] = None,
+               session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Answer with route, latency and error, as returned by /answer"""
+        payload = {"query": query, "customer_id": customer_id, "session_id": session_id}
+        with self._open("/answer", payload) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def stream(self, query: str, customer_id: Optional[int] = None,
+               session_id: Optional[str] = None) -> Iterator[str]:
+        """Yield the answer text as the server streams it"""
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        payload = {"query": query, "customer_id": customer_id, "session_id": session_id}
+        with self._open("/answer/stream", payload) as response:
+            while True:
+                chunk = response.read1(1024) if hasattr(response, "read1") else response.read(1024)
+                if not chunk:
+                    break
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def health(self) -> Dict[str, Any]:
+        with self._open("/health") as response:
+            return json.loads(response.read().decode("utf-8"))
@@ -1,26 +1,74 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_google_genai import ChatGoogleGenerativeAI
+import faiss
 import os
 import json
+import pickle
 import sqlite3
+import threading
+import time
 
 from config import Config
 from utils import (
-    load_table_data,
     execute_sql_query,
     format_sql_results,
+    clean_sql_query,
+    fetch_document_row,
+    parse_route_decision,
+    validate_response,
     validate_sql_query
 )
+from .analytics import AnalyticsStore, describe_summaries, is_summary_table
 from .chat_history import ChatHistory
+from .customer_profile import CustomerProfile, CustomerProfileService
+from .fast_path import FastPath
+from .index_builder import build_index, current_version, list_versions, read_manifest, version_path
+from .llm_scheduler import LLMScheduler, estimate_tokens, PRIORITY_ANSWER, PRIORITY_ROUTING, PRIORITY_SQL
 from .prompts import PromptManager
+from .recommender import Recommender
+from .reranker import build_reranker
+from .search_index import SearchIndex, describe_search_index, is_search_table
+
+TASK_PRIORITIES = {
+    "router": PRIORITY_ROUTING,
+    "sql_generator": PRIORITY_SQL,
+    "responder": PRIORITY_ANSWER,
+    "responder_escalation": PRIORITY_ANSWER,
+}
 
 class OptimizedRAGSystem:
     def __init__(self, config: Config):
         self.config = config
-        self.chat_history = ChatHistory()
+        self.chat_history = ChatHistory(history_file=config.chat_history_file, max_history=config.chat_history_turns)
+        self.recommender = None
+        self.fast_path = None
+        self.profiles = CustomerProfileService(
+            config.db_path, config.db_timeout, recommendation_count=config.recommendation_count
+        )
+        self._schema_cache = (None, "")
+        self._stats_lock = threading.Lock()
+        self.speculation_stats = {
+            "requests": 0,
+            "vector_routes": 0,
+            "sql_routes": 0,
+            "paid_off": 0,        # winning branch was already finished when the route was known
+            "saved_seconds": 0.0,  # winner's work that overlapped the routing call
+            "wasted": 0,          # losing branch had already started and could not be cancelled
+        }
+        self.escalations = 0
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculation")
+        self.index_version = None
+        self._failed_version = None
+        self._index_lock = threading.Lock()
+        self._stop_watching = threading.Event()
         self._initialize_components()
+        
+        # Pick up index versions published by `python -m models.index_builder build`
+        if self.config.index_watch_interval > 0:
+            threading.Thread(target=self._watch_index, name="index-watcher", daemon=True).start()
     
     def _initialize_components(self):
         """Initialize all necessary components"""
@@ -29,108 +77,187 @@ class OptimizedRAGSystem:
             model_name=self.config.embedding_model
         )
         
-        # Initialize LLM
-        self.llm = ChatGoogleGenerativeAI(
-            model=self.config.llm_model,
-            temperature=self.config.llm_temperature,
-            google_api_key=self.config.google_api_key
-        )
+        # Initialize per-task LLMs; tasks on the same model share its rate limiter
+        self.schedulers = {}
+        self.task_llms = {}
+        chat_models = {}
+        for task, (model, temperature) in self.config.task_models().items():
+            if model not in self.schedulers:
+                self.schedulers[model] = LLMScheduler(
+                    None,
+                    requests_per_minute=self.config.llm_requests_per_minute,
+                    tokens_per_minute=self.config.llm_tokens_per_minute,
+                    max_concurrency=self.config.llm_max_concurrency,
+                    max_retries=self.config.llm_max_retries
+                )
+            if (model, temperature) not in chat_models:
+                chat_models[(model, temperature)] = ChatGoogleGenerativeAI(
+                    model=model,
+                    temperature=temperature,
+                    google_api_key=self.config.google_api_key
+                )
+            self.task_llms[task] = (model, chat_models[(model, temperature)])
+        
+        # Initialize analytics summary tables and supporting indexes
+        if self.config.enable_analytics:
+            AnalyticsStore(self.config.db_path, self.config.db_timeout).ensure()
+        
+        # Initialize the accent-insensitive name search tables used by SQL and the fast path
+        if self.config.enable_search_index:
+            SearchIndex(self.config.db_path, self.config.db_timeout).ensure()
         
-        # Initialize vector store
+        # Initialize the recommender; product text is embedded with the same model as the index
+        if self.config.enable_recommendations:
+            self.recommender = Recommender(
+                self.config.db_path, self.config.db_timeout,
+                embed_documents=self.embeddings.embed_documents
+            )
+            self.recommender.refresh()
+            self.profiles.recommender = self.recommender
+        
+        # Simple store/product lookups are answered from the database without the LLM
+        if self.config.enable_fast_path:
+            self.fast_path = FastPath(
+                self.config.db_path, self.config.db_timeout, self.config.fast_path_min_confidence
+            )
+        
+        # Initialize vector store and the reranking stage behind it
         self.vector_store = self._initialize_vector_store()
+        self.reranker = build_reranker(self.config)
     
-    def _initialize_vector_store(self) -> FAISS:
-        """Initialize FAISS vector store"""
-        # Check if vector store exists
-        if os.path.exists(self.config.vector_store_path):
+    def _initialize_vector_store(self) -> Optional[FAISS]:
+        """Load the live index version, falling back to earlier versions if it cannot be loaded"""
+        store_path = self.config.vector_store_path
+        version = current_version(store_path)
+        if version is None:
+            if not self.config.build_missing_index:
+                # Server workers wait for an out-of-process build; the watcher loads it when published
+                print("No index version published yet: run `python -m models.index_builder build`")
+                return None
+            print("No vector store found, building the first index version")
             try:
-                return FAISS.load_local(
-                    self.config.vector_store_path,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
+                version = build_index(self.config, keep=self.config.index_keep_versions, if_missing=True)
+            except Exception as e:
+                print(f"Error creating vector store: {e}")
+                return None
+        
+        fallbacks = [v for v in reversed(list_versions(store_path)) if v != version]
+        for candidate in [version] + fallbacks:
+            try:
+                vector_store = self._load_version(candidate)
+                self.index_version = candidate
+                print(f"Loaded index version {candidate}")
+                return vector_store
+            except Exception as e:
+                print(f"Error loading vector store version {candidate}: {e}")
+                self._failed_version = candidate
+        return None
+    
+    def _load_version(self, version: str) -> FAISS:
+        """Load one published index version, checking it was built with our embedding model"""
+        store_path = self.config.vector_store_path
+        manifest = read_manifest(store_path, version)
+        model = manifest.get("embedding_model")
+        if model and model != self.config.embedding_model:
+            raise ValueError(f"Index was built with {model}, not {self.config.embedding_model}")
+        return self._load_vector_store(version_path(store_path, version))
+    
+    def _load_vector_store(self, path: str) -> FAISS:
+        """Load a saved vector store, memory-mapping the index when configured
+        
+        IO_FLAG_MMAP_IFC maps the vectors (and the HNSW graph) of the index
+        file, so server workers on one host share those pages through the OS
+        page cache. IO_FLAG_MMAP alone still copies flat and HNSW indexes into
+        private memory. The docstore in index.pkl is unpickled by every worker.
+        Older faiss releases lack the flag and load the index normally.
+        """
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+        if self.config.vector_store_mmap and mmap_flag is None:
+            print("This faiss release has no IO_FLAG_MMAP_IFC; loading the index without memory-mapping")
+        if not self.config.vector_store_mmap or mmap_flag is None:
+            return FAISS.load_local(path, self.embeddings, allow_dangerous_deserialization=True)
+        
+        index = faiss.read_index(os.path.join(path, "index.faiss"), mmap_flag)
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(self.embeddings, index, docstore, index_to_docstore_id)
+    
+    def reload_vector_store(self) -> bool:
+        """Swap in the live index version if it changed
+        
+        The new version is fully loaded before the reference is replaced, so
+        queries already running finish on the old index.
+        """
+        with self._index_lock:
+            version = current_version(self.config.vector_store_path)
+            if version is None or version in (self.index_version, self._failed_version):
+                return False
+            try:
+                vector_store = self._load_version(version)
             except Exception as e:
-                print(f"Error loading vector store: {e}")
-                # Nếu load thất bại, tạo mới
-                return self._create_new_vector_store()
+                print(f"Error loading vector store version {version}: {e}")
+                self._failed_version = version
+                return False
+            self.vector_store = vector_store
+            self.index_version = version
+            if self.reranker is not None:
+                # Cached scores may belong to documents whose text changed
+                self.reranker.clear()
+        print(f"Switched to index version {version}")
+        return True
+    
+    def _watch_index(self):
+        """Poll the CURRENT pointer and hot-swap new index versions"""
+        while not self._stop_watching.wait(self.config.index_watch_interval):
+            try:
+                self.reload_vector_store()
+            except Exception as e:
+                print(f"Error checking index version: {e}")
+    
+    def close(self):
+        """Stop the index watcher and the speculation threads"""
+        self._stop_watching.set()
+        self._executor.shutdown(wait=False)
+    
+    def _invoke(self, task: str, prompt: str) -> str:
+        """Call the model configured for a task and return the reply text"""
+        model, llm = self.task_llms[task]
+        response = self.schedulers[model].invoke(prompt, priority=TASK_PRIORITIES[task], llm=llm)
+        
+        # Truncated or blocked generations are treated as failures
+        metadata = getattr(response, 'response_metadata', None) or {}
+        finish_reason = str(metadata.get('finish_reason', '')).upper()
+        if finish_reason in ("MAX_TOKENS", "SAFETY", "RECITATION"):
+            raise ValueError(f"Generation stopped early: {finish_reason}")
         
-        # Create new vector store
-        return self._create_new_vector_store()
+        # Extract only the content from the response
+        if hasattr(response, 'content'):
+            return response.content.strip()
+        return str(response).strip()
     
-    def _create_new_vector_store(self) -> FAISS:
-        """Create new vector store from database"""
+    def _respond(self, prompt: str) -> str:
+        """Generate the final answer, escalating to the larger model if it fails validation"""
         try:
-            # Create vector store directory if it doesn't exist
-            os.makedirs(self.config.vector_store_path, exist_ok=True)
-            
-            # Load data from database
-            documents = load_table_data(self.config.db_path)
-            
-            if not documents:
-                print("No documents loaded from database")
-                return None
-            
-            # Create vector store
-            texts = [doc["content"] for doc in documents]
-            metadatas = [doc["metadata"] for doc in documents]
-            
-            print(f"Creating vector store with {len(texts)} documents")
-            
-            vector_store = FAISS.from_texts(
-                texts=texts,
-                embedding=self.embeddings,
-                metadatas=metadatas
-            )
-            
-            # Save vector store
-            vector_store.save_local(self.config.vector_store_path)
-            print("Vector store created and saved successfully")
-            
-            return vector_store
-            
+            answer = self._invoke("responder", prompt)
+            if validate_response(answer):
+                return answer
+            print("Responder output failed validation, escalating")
         except Exception as e:
-            print(f"Error creating vector store: {e}")
-            return None
+            print(f"Responder failed, escalating: {e}")
+        
+        task_models = self.config.task_models()
+        if task_models["responder_escalation"] == task_models["responder"]:
+            raise ValueError("Responder produced no valid answer")
+        with self._stats_lock:
+            self.escalations += 1
+        return self._invoke("responder_escalation", prompt)
     
     def _needs_calculation(self, query: str) -> bool:
         """Check if query requires calculation using LLM"""
-        prompt = f"""
-        Bạn là một chuyên gia trong việc lựa chọn phương pháp để trả lời người dùng.Phân tích câu hỏi sau và quyết định xem nên sử dụng phương pháp nào để trả lời:
-
-        Câu hỏi: {query}
-
-        Hệ thống có 2 phương pháp để trả lời:
-        1. Database (SQL) - Sử dụng khi cần:
-           - Tính toán số liệu (tổng, trung bình, đếm, v.v.)
-           - So sánh dữ liệu
-           - Thống kê
-           - Liệt kê danh sách
-           - Sắp xếp dữ liệu
-           - Lọc dữ liệu theo điều kiện
-           - Truy vấn dữ liệu có cấu trúc rõ ràng
-
-        2. Vector Store - Sử dụng khi cần:
-           - Tìm kiếm thông tin theo ngữ nghĩa
-           - Trả lời câu hỏi về nội dung chi tiết
-           - Tìm kiếm thông tin không có cấu trúc rõ ràng
-           - Trả lời câu hỏi mô tả, giải thích
-           - Tìm kiếm thông tin liên quan đến từ khóa
-
-        Yêu cầu:
-        1. Phân tích câu hỏi và quyết định phương pháp phù hợp nhất
-        2. Chỉ trả về "true" nếu nên dùng Database (SQL)
-        3. Chỉ trả về "false" nếu nên dùng Vector Store
-        4. Không giải thích thêm
-        """
+        prompt = PromptManager.get_routing_prompt(query)
         
         try:
-            response = self.llm.invoke(prompt)
-            # Extract only the content from the response
-            if hasattr(response, 'content'):
-                result = response.content.strip().lower()
-            else:
-                result = str(response).strip().lower()
-            
+            result = self._invoke("router", prompt).lower()
             return result == "true"
             
         except Exception as e:
@@ -143,8 +270,59 @@ class OptimizedRAGSystem:
             ]
             return any(keyword in query.lower() for keyword in calculation_keywords)
     
+    def _route_and_generate_sql(self, query: str, profile: Optional[CustomerProfile] = None,
+                                schema: Optional[str] = None) -> Optional[Tuple[bool, Optional[str]]]:
+        """Decide the route and write the SQL in one structured LLM call
+        
+        Returns (needs_sql, sql_query), or None if the model did not return a
+        valid decision after one retry.
+        """
+        schema = schema if schema is not None else self._get_database_schema()
+        identity = profile.identity() if profile else ""
+        error = ""
+        for attempt in range(2):
+            prompt = PromptManager.get_route_and_sql_prompt(query, schema, identity, previous_error=error)
+            try:
+                decision = parse_route_decision(self._invoke("sql_generator", prompt))
+                return decision["route"] == "sql", decision.get("sql")
+            except ValueError as e:
+                error = str(e)
+                print(f"Invalid routing decision (attempt {attempt + 1}/2): {error}")
+            except Exception as e:
+                print(f"Error in _route_and_generate_sql: {e}")
+                return None
+        return None
+    
+    def _decide_route(self, query: str, profile: Optional[CustomerProfile] = None,
+                      schema: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+        """Return (needs_sql, sql_query); sql_query is only set in combined routing mode"""
+        if self.config.combined_routing:
+            decision = self._route_and_generate_sql(query, profile, schema)
+            if decision is not None:
+                return decision
+        return self._needs_calculation(query), None
+    
     def _get_database_schema(self) -> str:
-        """Get database schema information"""
+        """Get database schema information, cached until the schema changes"""
+        try:
+            conn = sqlite3.connect(self.config.db_path)
+            schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+            conn.close()
+        except Exception as e:
+            print(f"Error reading schema version: {e}")
+            schema_version = None
+        
+        cached_version, cached_schema = self._schema_cache
+        if schema_version is not None and schema_version == cached_version:
+            return cached_schema
+        
+        schema = self._build_database_schema()
+        if schema:
+            self._schema_cache = (schema_version, schema)
+        return schema
+    
+    def _build_database_schema(self) -> str:
+        """Build database schema description"""
         try:
             conn = sqlite3.connect(self.config.db_path)
             cursor = conn.cursor()
@@ -154,8 +332,17 @@ class OptimizedRAGSystem:
             tables = cursor.fetchall()
             
             schema_info = []
+            has_summaries = False
+            has_search_index = False
             for table in tables:
                 table_name = table[0]
+                if table_name.startswith("sqlite_"):
+                    continue
+                # Search tables are described once below instead of with their FTS5 internals
+                if is_search_table(table_name):
+                    has_search_index = True
+                    continue
+                has_summaries = has_summaries or is_summary_table(table_name)
                 
                 # Get table schema
                 cursor.execute(f"PRAGMA table_info({table_name})")
@@ -207,6 +394,12 @@ class OptimizedRAGSystem:
                 schema_info.append("\n".join(table_info))
             
             conn.close()
+            
+            # Advertise the precomputed summaries ahead of the raw tables
+            if has_summaries:
+                schema_info.insert(0, describe_summaries())
+            if has_search_index:
+                schema_info.append(describe_search_index())
             return "\n\n".join(schema_info)
             
         except Exception as e:
@@ -214,83 +407,242 @@ class OptimizedRAGSystem:
             return ""
 
     
-    def _answer_with_vector(self, query: str) -> str:
-        """Answer query using only vector search"""
-        try:
-            # Get relevant documents
-            docs = self.vector_store.similarity_search(
+    def _retrieve(self, query: str) -> list:
+        """Get relevant documents from the vector store, reranked when enabled"""
+        # One reference for the whole call, in case the index is swapped meanwhile
+        vector_store = self.vector_store
+        if vector_store is None:
+            raise RuntimeError("Vector store is not ready: no index version could be loaded")
+        if self.reranker is None:
+            return vector_store.similarity_search(
                 query,
                 k=self.config.top_k_results
             )
-            
-            # Extract context
-            context = [doc.page_content for doc in docs]
-            
-            # Get recent chat history
-            recent_history = self.chat_history.get_recent_history()
-            
-            # Generate natural language response
-            prompt = PromptManager.get_vector_prompt(context, query, recent_history)
-            
-            response = self.llm.invoke(prompt)
-            # Extract only the content from the response
-            if hasattr(response, 'content'):
-                return response.content.strip()
-            return str(response).strip()
-            
+        
+        candidates = vector_store.similarity_search(
+            query,
+            k=max(self.config.retrieval_candidates, self.config.rerank_top_n)
+        )
+        return self.reranker.rerank(query, candidates)
+    
+    def _build_vector_prompt(self, query: str, profile: Optional[CustomerProfile] = None,
+                             docs: Optional[list] = None, history: Optional[ChatHistory] = None) -> str:
+        """Build the response prompt from vector search results"""
+        # Get relevant documents (may already be retrieved speculatively)
+        if docs is None:
+            docs = self._retrieve(query)
+        
+        # Extract context
+        context = self._document_context(docs)
+        
+        # Get recent chat history
+        recent_history = (history or self.chat_history).get_recent_history()
+        
+        return PromptManager.get_vector_prompt(
+            context, query, recent_history,
+            customer_context=profile.to_context() if profile else ""
+        )
+    
+    def _document_context(self, docs: list) -> List[str]:
+        """Document texts; the top few also carry the source-row columns their compact text leaves out"""
+        context = []
+        for i, doc in enumerate(docs):
+            text = doc.page_content
+            if i < self.config.expand_documents:
+                row = fetch_document_row(self.config.db_path, doc.metadata, self.config.document_templates)
+                extra = [f"{column}: {value}" for column, value in (row or {}).items()
+                         if column.lower() != "id" and value not in (None, "") and str(value).strip() not in text]
+                if extra:
+                    text += "\nChi tiết: " + ", ".join(extra)
+            context.append(text)
+        return context
+    
+    def _generate_sql(self, query: str, profile: Optional[CustomerProfile] = None,
+                      schema: Optional[str] = None) -> str:
+        """Generate a validated SQL query for the question using LLM"""
+        prompt = PromptManager.get_sql_generation_prompt(
+            query, schema if schema is not None else self._get_database_schema(),
+            customer_identity=profile.identity() if profile else ""
+        )
+        sql_query = clean_sql_query(self._invoke("sql_generator", prompt))
+        
+        if not validate_sql_query(sql_query):
+            raise ValueError(f"Invalid SQL query generated: {sql_query}")
+        return sql_query
+    
+    def _build_sql_prompt(self, query: str, profile: Optional[CustomerProfile] = None,
+                          schema: Optional[str] = None, sql_query: Optional[str] = None,
+                          history: Optional[ChatHistory] = None) -> str:
+        """Run the SQL for the question and build the response prompt from its results"""
+        # Generate SQL query directly from the question, unless routing already did
+        if sql_query is None:
+            sql_query = self._generate_sql(query, profile, schema)
+        print(f"Generated SQL: {sql_query}")
+        
+        # Execute SQL query
+        results = execute_sql_query(
+            self.config.db_path,
+            sql_query,
+            self.config.db_timeout
+        )
+        
+        # Format results
+        formatted_results = format_sql_results(results)
+        
+        # Get recent chat history
+        recent_history = (history or self.chat_history).get_recent_history()
+        
+        return PromptManager.get_sql_response_prompt(
+            query=query,
+            results=formatted_results,
+            history=recent_history,
+            customer_context=profile.to_context() if profile else ""
+        )
+    
+    def _timed(self, func, *args):
+        """Run func and return (result, seconds taken)"""
+        start = time.perf_counter()
+        return func(*args), time.perf_counter() - start
+    
+    def _route_speculatively(self, query: str, profile: Optional[CustomerProfile] = None) -> Tuple[bool, Optional[str], Any]:
+        """Start local retrieval and schema preparation while the LLM decides the route
+        
+        Both branches are local (FAISS search, SQLite schema read), so
+        speculation adds no LLM calls; the losing branch is cancelled.
+        Returns (needs_sql, sql_query, winning branch result or None).
+        """
+        retrieval = self._executor.submit(self._timed, self._retrieve, query)
+        schema = self._executor.submit(self._timed, self._get_database_schema)
+        
+        route_start = time.perf_counter()
+        if self.config.combined_routing:
+            # The combined prompt embeds the schema, so wait for it first
+            try:
+                schema_text = schema.result()[0]
+            except Exception:
+                schema_text = None
+            needs_sql, sql_query = self._decide_route(query, profile, schema_text)
+        else:
+            needs_sql, sql_query = self._needs_calculation(query), None
+        route_seconds = time.perf_counter() - route_start
+        
+        winner, loser = (schema, retrieval) if needs_sql else (retrieval, schema)
+        paid_off = winner.done()
+        wasted = not loser.cancel()
+        
+        try:
+            result, branch_seconds = winner.result()
         except Exception as e:
-            return f"Lỗi khi xử lý câu hỏi: {str(e)}"
+            # Fall back to doing the work inline, where errors are handled
+            print(f"Speculative branch failed: {e}")
+            result, branch_seconds = None, 0.0
+        with self._stats_lock:
+            self.speculation_stats["requests"] += 1
+            self.speculation_stats["sql_routes" if needs_sql else "vector_routes"] += 1
+            self.speculation_stats["paid_off"] += int(paid_off)
+            self.speculation_stats["saved_seconds"] += min(route_seconds, branch_seconds)
+            self.speculation_stats["wasted"] += int(wasted)
+        
+        return needs_sql, sql_query, result
+    
+    def _prepare_response(self, query: str, profile: Optional[CustomerProfile] = None,
+                          history: Optional[ChatHistory] = None) -> Tuple[str, str]:
+        """Route the question and build the final prompt; returns (route, prompt)
+        
+        Routing and retrieval run on the bare question; the customer profile
+        and the conversation history are only used in the response prompts
+        (and the profile by the SQL generator).
+        """
+        if self.config.speculative_retrieval:
+            needs_sql, sql_query, prepared = self._route_speculatively(query, profile)
+        else:
+            needs_sql, sql_query = self._decide_route(query, profile)
+            prepared = None
+        print(f"LLM decision: {'1' if needs_sql else '0'}")  # Print 1 for SQL, 0 for vector search
+        
+        if needs_sql:
+            return "sql", self._build_sql_prompt(query, profile, schema=prepared, sql_query=sql_query,
+                                                 history=history)
+        return "vector", self._build_vector_prompt(query, profile, docs=prepared, history=history)
+    
+    def _stream_response(self, prompt: str) -> Iterator[str]:
+        """Stream the responder's answer through its rate limiter"""
+        model, llm = self.task_llms["responder"]
+        return self.schedulers[model].stream(prompt, priority=TASK_PRIORITIES["responder"], llm=llm)
     
-    def _answer_with_sql(self, query: str) -> str:
-        """Answer query using SQL"""
+    def answer_query_details(self, query: str, customer_profile: Optional[CustomerProfile] = None,
+                             save_history: bool = True, history: Optional[ChatHistory] = None) -> Dict[str, Any]:
+        """Process query and return the answer with its route, latency, estimated tokens and error
+        
+        ``history`` is the conversation to read and extend; it defaults to
+        the system's own chat history.
+        """
+        history = history or self.chat_history
+        start = time.perf_counter()
+        route, prompt, error = None, "", None
         try:
-            # Generate SQL query directly from the question
-            sql_query = PromptManager.get_sql_generation_prompt(query, self._get_database_schema())# Print the SQL query
-            # Execute SQL query
-            results = execute_sql_query(
-                self.config.db_path,
-                sql_query,
-                self.config.db_timeout
-            )
-            
-            # Format results
-            formatted_results = format_sql_results(results)
-            
-            # Get recent chat history
-            recent_history = self.chat_history.get_recent_history()
-            
-            # Generate natural language response using PromptManager
-            prompt = PromptManager.get_sql_response_prompt(
-                query=query,
-                results=formatted_results,
-                history=recent_history
-            )
-            response = self.llm.invoke(prompt)
-            # Extract only the content from the response
-            if hasattr(response, 'content'):
-                return response.content.strip()
-            return str(response).strip()
-            
+            fast_answer = self.fast_path.answer(query) if self.fast_path is not None else None
+            if fast_answer is not None:
+                route, answer = "fast_path", fast_answer.answer
+            else:
+                route, prompt = self._prepare_response(query, customer_profile, history)
+                answer = self._respond(prompt)
         except Exception as e:
-            return f"Lỗi khi xử lý câu hỏi: {str(e)}"
+            error = str(e)
+            answer = f"Lỗi khi xử lý câu hỏi: {error}"
+        
+        # Save to chat history
+        if save_history:
+            history.add_chat(query, answer)
+        
+        return {
+            "answer": answer,
+            "route": route,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "prompt_tokens": estimate_tokens(prompt) if prompt else 0,
+            "answer_tokens": estimate_tokens(answer),
+            "error": error
+        }
     
-    def answer_query(self, query: str) -> str:
+    def answer_query(self, query: str, customer_profile: Optional[CustomerProfile] = None) -> str:
         """Process query and return answer"""
         try:
-            # Determine if calculation is needed
-            needs_sql = self._needs_calculation(query)
-            print(f"LLM decision: {'1' if needs_sql else '0'}")  # Print 1 for SQL, 0 for vector search
-            
-            if needs_sql:
-                response = self._answer_with_sql(query)
-            else:
-                response = self._answer_with_vector(query)
-            # Save to chat history
-            self.chat_history.add_chat(query, response)
-            
-            return response
-                
+            return self.answer_query_details(query, customer_profile)["answer"]
         except Exception as e:
             error_msg = f"Lỗi hệ thống: {str(e)}"
             self.chat_history.add_chat(query, error_msg)
-            return error_msg 
\ No newline at end of file
+            return error_msg
+    
+    def stream_query(self, query: str, customer_profile: Optional[CustomerProfile] = None,
+                     save_history: bool = True, history: Optional[ChatHistory] = None) -> Iterator[str]:
+        """Process query and yield the answer as the model generates it
+        
+        Streamed text cannot be validated before it is sent, so escalation
+        only happens when the responder fails before its first chunk.
+        """
+        history = history or self.chat_history
+        chunks = []
+        try:
+            fast_answer = self.fast_path.answer(query) if self.fast_path is not None else None
+            if fast_answer is not None:
+                chunks.append(fast_answer.answer)
+                yield chunks[-1]
+                return
+            _, prompt = self._prepare_response(query, customer_profile, history)
+            try:
+                for chunk in self._stream_response(prompt):
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                if chunks:
+                    raise
+                print(f"Streaming failed, answering without streaming: {e}")
+                chunks.append(self._respond(prompt))
+                yield chunks[-1]
+        except Exception as e:
+            error_msg = f"Lỗi khi xử lý câu hỏi: {str(e)}"
+            chunks.append(("\n" if chunks else "") + error_msg)
+            yield chunks[-1]
+        finally:
+            if save_history:
+                history.add_chat(query, "".join(chunks))
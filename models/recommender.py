@@ -0,0 +1,298 @@
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .customer_profile import parse_category_ids
+
+# Product columns describing what a drink is like, compared after z-scoring
+NUTRITION_COLUMNS = ["Calories", "Dietary_Fibre_g", "Sugars_g", "Protein_g", "Caffeine_mg", "Rating"]
+
+
+class Recommender:
+    """Ranks products for a customer from co-purchases, product similarity and preferences
+
+    - co-purchase: sparse item-item counts of customers who bought both products,
+      normalised to a cosine score; updated incrementally from new Order_detail rows
+    - content: cosine similarity of z-scored nutrition columns, plus name and
+      description embeddings when an embedding function is given
+    - preferences: boost for the customer's Customer_preferences categories,
+      products above their Max_price are left out
+
+    Results are cached per customer until new orders, products or
+    preferences arrive; preferences are held in memory, so a cached
+    recommendation needs no database access.
+    """
+
+    def __init__(self, db_path: str, timeout: int = 30,
+                 embed_documents: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 co_purchase_weight: float = 0.5, content_weight: float = 0.3,
+                 preference_weight: float = 0.2):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.embed_documents = embed_documents
+        self.co_purchase_weight = co_purchase_weight
+        self.content_weight = content_weight
+        self.preference_weight = preference_weight
+
+        self._lock = threading.RLock()
+        self._products: List[Dict[str, Any]] = []
+        self._index: Dict[int, int] = {}          # product id -> row in the matrices
+        self._content = np.zeros((0, 0), dtype="float32")
+        self._text_vectors: Dict[int, np.ndarray] = {}
+        self._co_counts: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self._buyers: Dict[int, int] = defaultdict(int)             # product id -> customers who bought it
+        self._purchases: Dict[int, Set[int]] = defaultdict(set)     # customer id -> product ids
+        self._order_watermark = (0, 0)   # (max Order_detail rowid, rows processed)
+        self._product_version = None
+        self._preferences_version = None
+        self._preferences_by_customer: Dict[int, Tuple[List[int], Optional[float]]] = {}
+        self._cache: Dict[tuple, List[Dict[str, Any]]] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=self.timeout)
+
+    def _load_products(self, cursor: sqlite3.Cursor):
+        """Reload the catalogue and rebuild the content similarity matrix"""
+        cursor.execute(
+            f"""
+            SELECT p.Id, TRIM(p.Name), p.Product_Prep, p.Categories_id, p.Descriptions,
+                   {', '.join('p.' + column for column in NUTRITION_COLUMNS)},
+                   (SELECT AVG(od.Price) FROM Order_detail od WHERE od.Product_id = p.Id)
+            FROM Product p
+            ORDER BY p.Id
+            """
+        )
+        rows = cursor.fetchall()
+        products = [
+            {
+                "id": row[0],
+                "name": " ".join((row[1] or "").split()),
+                "prep": row[2],
+                "category_id": row[3],
+                "price": row[-1],
+                "text": f"{row[1]} {row[2] or ''}. {row[4] or ''}",
+            }
+            for row in rows
+        ]
+
+        # Some nutrition cells hold text such as "Varies"; they count as the column average
+        nutrition = np.array([[_number(value) for value in row[5:-1]] for row in rows], dtype="float32")
+        column_means = np.nan_to_num(np.nanmean(nutrition, axis=0)) if len(rows) else 0.0
+        nutrition = np.where(np.isnan(nutrition), column_means, nutrition)
+        nutrition = (nutrition - nutrition.mean(axis=0)) / (nutrition.std(axis=0) + 1e-6)
+        content = _cosine_matrix(nutrition)
+
+        if self.embed_documents is not None:
+            # Only products not embedded before cost a model call
+            missing = [p for p in products if p["id"] not in self._text_vectors]
+            if missing:
+                for product, vector in zip(missing, self.embed_documents([p["text"] for p in missing])):
+                    self._text_vectors[product["id"]] = np.asarray(vector, dtype="float32")
+            text = np.stack([self._text_vectors[p["id"]] for p in products])
+            content = (content + _cosine_matrix(text)) / 2
+
+        np.fill_diagonal(content, 0.0)
+        self._products = products
+        self._index = {product["id"]: i for i, product in enumerate(products)}
+        self._content = content
+
+    def _add_purchase(self, customer_id: int, product_id: int):
+        """Count a customer's first purchase of a product against everything they bought before"""
+        bought = self._purchases[customer_id]
+        if product_id in bought:
+            return
+        for other in bought:
+            self._co_counts[product_id][other] += 1
+            self._co_counts[other][product_id] += 1
+        bought.add(product_id)
+        self._buyers[product_id] += 1
+
+    def _reset_purchases(self):
+        self._co_counts = defaultdict(lambda: defaultdict(int))
+        self._buyers = defaultdict(int)
+        self._purchases = defaultdict(set)
+        self._order_watermark = (0, 0)
+
+    @staticmethod
+    def data_version(cursor: sqlite3.Cursor) -> Tuple[tuple, tuple, tuple]:
+        """(Product, Order_detail, Customer_preferences) versions; refresh() only works when one moves"""
+        cursor.execute("SELECT COUNT(*), COALESCE(MAX(Id), 0) FROM Product")
+        product_version = tuple(cursor.fetchone())
+        cursor.execute("SELECT COALESCE(MAX(rowid), 0), COUNT(*) FROM Order_detail")
+        order_version = tuple(cursor.fetchone())
+        # The table is small, so the sums are cheap and also catch edited rows
+        cursor.execute(
+            "SELECT COUNT(*), COALESCE(MAX(rowid), 0), TOTAL(Max_price), TOTAL(LENGTH(Preferred_categories)) "
+            "FROM Customer_preferences"
+        )
+        preferences_version = tuple(cursor.fetchone())
+        return product_version, order_version, preferences_version
+
+    def _load_preferences(self, cursor: sqlite3.Cursor):
+        """Reload every customer's preferred categories and maximum price"""
+        cursor.execute("SELECT Customer_id, Preferred_categories, Max_price FROM Customer_preferences")
+        grouped: Dict[int, Tuple[List[int], List[float]]] = defaultdict(lambda: ([], []))
+        for customer_id, categories, max_price in cursor.fetchall():
+            category_ids, max_prices = grouped[customer_id]
+            category_ids.extend(cid for cid in parse_category_ids(categories) if cid not in category_ids)
+            if max_price is not None:
+                max_prices.append(max_price)
+        self._preferences_by_customer = {
+            customer_id: (category_ids, max(max_prices) if max_prices else None)
+            for customer_id, (category_ids, max_prices) in grouped.items()
+        }
+
+    def refresh(self) -> bool:
+        """Apply new products, order lines and preferences; returns True if anything changed"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            product_version, (max_rowid, line_count), preferences_version = self.data_version(cursor)
+
+            with self._lock:
+                changed = False
+                if product_version != self._product_version:
+                    self._load_products(cursor)
+                    self._product_version = product_version
+                    changed = True
+
+                if preferences_version != self._preferences_version:
+                    self._load_preferences(cursor)
+                    self._preferences_version = preferences_version
+                    changed = True
+
+                last_rowid, processed = self._order_watermark
+                if line_count < processed:
+                    # Lines were deleted: counts cannot be decremented safely, so start over
+                    self._reset_purchases()
+                    last_rowid, processed = self._order_watermark
+                if max_rowid > last_rowid:
+                    cursor.execute(
+                        """
+                        SELECT od.rowid, o.Customer_id, od.Product_id
+                        FROM Order_detail od
+                        JOIN Orders o ON o.Id = od.Order_id
+                        WHERE od.rowid > ?
+                        ORDER BY od.rowid
+                        """,
+                        (last_rowid,)
+                    )
+                    new_lines = cursor.fetchall()
+                    for _, customer_id, product_id in new_lines:
+                        if customer_id is not None:
+                            self._add_purchase(customer_id, product_id)
+                    self._order_watermark = (max_rowid, processed + len(new_lines))
+                    changed = True
+
+                if changed:
+                    self._cache.clear()
+            conn.close()
+            return changed
+
+        except Exception as e:
+            print(f"Error refreshing recommendations: {e}")
+            return False
+
+    def _preferences(self, customer_id: int) -> Tuple[List[int], Optional[float]]:
+        with self._lock:
+            return self._preferences_by_customer.get(customer_id, ([], None))
+
+    def _score(self, customer_id: int, category_ids: List[int], max_price: Optional[float]) -> np.ndarray:
+        """Blended score for every product in the catalogue"""
+        size = len(self._products)
+        bought = [self._index[pid] for pid in self._purchases.get(customer_id, ()) if pid in self._index]
+
+        co_purchase = np.zeros(size, dtype="float32")
+        for product_id in self._purchases.get(customer_id, ()):
+            for other, count in self._co_counts.get(product_id, {}).items():
+                if other in self._index:
+                    co_purchase[self._index[other]] += count / np.sqrt(
+                        self._buyers[product_id] * self._buyers[other]
+                    )
+
+        if bought:
+            content = self._content[bought].mean(axis=0)
+        else:
+            # New customers: popular products stand in for purchase history
+            popularity = np.array([self._buyers.get(p["id"], 0) for p in self._products], dtype="float32")
+            content = popularity / popularity.max() if popularity.max() > 0 else popularity
+
+        preference = np.array(
+            [1.0 if p["category_id"] in category_ids else 0.0 for p in self._products], dtype="float32"
+        )
+        scores = (self.co_purchase_weight * _unit_scale(co_purchase)
+                  + self.content_weight * _unit_scale(content)
+                  + self.preference_weight * preference)
+
+        # Drinks already bought, in any preparation, are not suggested again
+        bought_names = {self._products[i]["name"] for i in bought}
+        scores[[i for i, p in enumerate(self._products) if p["name"] in bought_names]] = -np.inf
+        if max_price is not None:
+            prices = np.array([p["price"] if p["price"] is not None else 0.0 for p in self._products])
+            scores[prices > max_price] = -np.inf
+        return scores
+
+    def recommend(self, customer_id: int, n: int = 5) -> List[Dict[str, Any]]:
+        """Top-n products the customer has not bought yet, one preparation per drink"""
+        try:
+            # Preferences change only through refresh(), which clears the cache
+            key = (customer_id, n)
+            with self._lock:
+                cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+
+            category_ids, max_price = self._preferences(customer_id)
+            with self._lock:
+                if not self._products:
+                    return []
+                scores = self._score(customer_id, category_ids, max_price)
+                products = self._products
+
+            recommendations, names = [], set()
+            for i in np.argsort(-scores):
+                if not np.isfinite(scores[i]) or len(recommendations) >= n:
+                    break
+                product = products[i]
+                if product["name"] in names:
+                    continue
+                names.add(product["name"])
+                recommendations.append({
+                    "id": product["id"],
+                    "product": product["name"],
+                    "prep": product["prep"],
+                    "price": round(product["price"], 2) if product["price"] is not None else None,
+                    "score": round(float(scores[i]), 3),
+                })
+
+            with self._lock:
+                self._cache[key] = recommendations
+            return recommendations
+
+        except Exception as e:
+            print(f"Error computing recommendations: {e}")
+            return []
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _cosine_matrix(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.maximum(norms, 1e-6)
+    return (unit @ unit.T).astype("float32")
+
+
+def _unit_scale(values: np.ndarray) -> np.ndarray:
+    """Rescale to 0..1 so the blend weights are comparable"""
+    low, high = values.min(), values.max()
+    if high - low < 1e-9:
+        return np.zeros_like(values)
+    return (values - low) / (high - low)
@@ -0,0 +1,183 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+from utils import fold_vietnamese
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Diacritic-insensitive word tokens"""
+    return _TOKEN_PATTERN.findall(fold_vietnamese(text))
+
+
+class LexicalScorer:
+    """Overlap of the query's words and word pairs with the document
+
+    Vietnamese words are mostly two syllables ("cà phê", "trà sữa"), so
+    matching syllable pairs counts as much as matching single syllables.
+    Each score depends only on its (query, document) pair, so it can be cached.
+    """
+
+    name = "lexical"
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return [0.0] * len(texts)
+        query_words = set(query_tokens)
+        query_pairs = set(zip(query_tokens, query_tokens[1:]))
+
+        scores = []
+        for text in texts:
+            tokens = tokenize(text)
+            score = len(query_words & set(tokens)) / len(query_words)
+            if query_pairs:
+                pair_score = len(query_pairs & set(zip(tokens, tokens[1:]))) / len(query_pairs)
+                score = (score + pair_score) / 2
+            scores.append(score)
+        return scores
+
+
+class CrossEncoderScorer:
+    """Small sentence-transformers cross-encoder; scores squashed to 0..1"""
+
+    name = "cross_encoder"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        logits = self.model.predict([(query, text) for text in texts])
+        return [1.0 / (1.0 + math.exp(-float(logit))) for logit in logits]
+
+
+def document_key(doc) -> Hashable:
+    """Cache key of a retrieved document: its source row, or its text"""
+    metadata = getattr(doc, "metadata", None) or {}
+    if "table" in metadata and "id" in metadata:
+        return (metadata["table"], metadata["id"])
+    return doc.page_content
+
+
+class Reranker:
+    """Reorder a large candidate set from FAISS and keep the best few
+
+    scorer: LexicalScorer or CrossEncoderScorer
+    top_n: documents kept after reranking
+    min_score: candidates whose scorer score is below this are dropped (the best one is
+               always kept); the FAISS rank never lifts a candidate over the cutoff
+    time_budget_ms: scoring stops once spent; unscored candidates keep their FAISS order
+    rank_weight: share of the ordering score given to the FAISS rank, so ties and near
+                 ties between relevant documents follow semantic similarity
+    """
+
+    def __init__(self, scorer, top_n: int = 3, min_score: float = 0.0, time_budget_ms: float = 50.0,
+                 rank_weight: float = 0.0, batch_size: int = 8, cache_size: int = 10_000):
+        self.scorer = scorer
+        self.top_n = top_n
+        self.min_score = min_score
+        self.time_budget_ms = time_budget_ms
+        self.rank_weight = rank_weight
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "scored": 0, "cache_hits": 0, "dropped": 0, "over_budget": 0}
+
+    def _cached(self, key: tuple) -> Optional[float]:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, key: tuple, score: float):
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        """Forget cached scores, e.g. after the index is rebuilt"""
+        with self._lock:
+            self._cache.clear()
+
+    def _pair_scores(self, query: str, docs: list) -> List[Optional[float]]:
+        """Score (query, doc) pairs from cache first, then in batches until the budget runs out"""
+        keys = [(query, document_key(doc)) for doc in docs]
+        scores = [self._cached(key) for key in keys]
+        hits = sum(score is not None for score in scores)
+
+        pending = [i for i, score in enumerate(scores) if score is None]
+        deadline = time.perf_counter() + self.time_budget_ms / 1000.0
+        over_budget = False
+        for start in range(0, len(pending), self.batch_size):
+            if time.perf_counter() >= deadline:
+                over_budget = True
+                break
+            batch = pending[start:start + self.batch_size]
+            for i, score in zip(batch, self.scorer.score(query, [docs[i].page_content for i in batch])):
+                scores[i] = score
+                self._store(keys[i], score)
+
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["cache_hits"] += hits
+            self.stats["scored"] += sum(score is not None for score in scores) - hits
+            self.stats["over_budget"] += int(over_budget)
+        return scores
+
+    def rerank(self, query: str, docs: list) -> list:
+        """Return at most top_n documents, best first"""
+        if not docs:
+            return docs
+        pair_scores = self._pair_scores(query, docs)
+
+        ranked = []
+        for rank, (doc, score) in enumerate(zip(docs, pair_scores)):
+            if score is None:
+                continue
+            rank_score = 1.0 - rank / len(docs)
+            ranked.append(((1 - self.rank_weight) * score + self.rank_weight * rank_score, score, rank, doc))
+        ranked.sort(key=lambda item: (-item[0], item[2]))
+
+        # The cutoff applies to the scorer's own score; the blend only orders what passes
+        kept = [doc for _, score, _, doc in ranked if score >= self.min_score]
+        if not kept and ranked:
+            kept = [ranked[0][3]]
+        with self._lock:
+            self.stats["dropped"] += len(ranked) - len(kept)
+
+        # Candidates left unscored by the time budget fill any remaining slots in FAISS order
+        kept.extend(doc for doc, score in zip(docs, pair_scores) if score is None)
+        return kept[:self.top_n]
+
+
+def build_reranker(config) -> Optional[Reranker]:
+    """Reranker described by the config, or None when reranking is disabled"""
+    if config.reranker == "none":
+        return None
+
+    scorer, rank_weight = None, 0.0
+    if config.reranker == "cross_encoder":
+        try:
+            scorer = CrossEncoderScorer(config.cross_encoder_model)
+        except Exception as e:
+            print(f"Error loading cross-encoder, using lexical reranking: {e}")
+    if scorer is None:
+        scorer, rank_weight = LexicalScorer(), 0.3
+
+    return Reranker(
+        scorer,
+        top_n=config.rerank_top_n,
+        min_score=config.rerank_min_score,
+        time_budget_ms=config.rerank_time_budget_ms,
+        rank_weight=rank_weight
+    )
@@ -0,0 +1,219 @@
+import re
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils import fold_vietnamese
+
+# Get base directory
+BASE_DIR = Path(__file__).parent.parent
+
+SEARCH_PREFIX = "fts_"
+
+# unicode61 strips accents (remove_diacritics 2 also handles stacked marks such as "ễ");
+# prefix indexes make "dun*" style lookups as fast as whole words
+TOKENIZE = "unicode61 remove_diacritics 2"
+PREFIXES = "2 3"
+
+# One FTS5 table per source table, rowid = the source row id.
+# "columns" maps indexed columns to source columns.
+SEARCH_TABLES = {
+    "fts_customers": {
+        "source": "customers",
+        "key": "id",
+        "columns": {"name": "name"},
+        "description": "tên khách hàng (name)",
+    },
+    "fts_product": {
+        "source": "Product",
+        "key": "Id",
+        "columns": {"name": "Name", "description": "Descriptions"},
+        "description": "tên sản phẩm (name) và mô tả (description)",
+    },
+    "fts_store": {
+        "source": "Store",
+        "key": "Id",
+        "columns": {"name": "Name", "address": "Address"},
+        "description": "tên cửa hàng (name) và địa chỉ (address)",
+    },
+}
+
+
+def normalise_sql(expression: str) -> str:
+    """SQL folding the one Vietnamese letter the tokenizer keeps: đ is a letter, not an accent"""
+    return f"replace(replace({expression}, 'đ', 'd'), 'Đ', 'D')"
+
+
+def match_query(text: str, any_word: bool = False, column: Optional[str] = None, prefix: bool = False) -> str:
+    """FTS5 MATCH expression for free text; words are quoted so user input is never FTS syntax"""
+    words = re.findall(r"\w+", fold_vietnamese(text))
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    if prefix:
+        terms[-1] += "*"
+    expression = (" OR " if any_word else " ").join(terms)
+    return f"{column} : ({expression})" if column else expression
+
+
+def search(cursor: sqlite3.Cursor, table: str, text: str, limit: int = 10, any_word: bool = False,
+           column: Optional[str] = None, prefix: bool = False) -> List[int]:
+    """Source row ids matching the text, best match first"""
+    expression = match_query(text, any_word=any_word, column=column, prefix=prefix)
+    if not expression:
+        return []
+    cursor.execute(f"SELECT rowid FROM {table} WHERE {table} MATCH ? ORDER BY rank LIMIT ?", (expression, limit))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def is_search_table(table_name: str) -> bool:
+    """Check whether a table is a search index (or one of its FTS5 shadow tables)"""
+    return table_name.startswith(SEARCH_PREFIX)
+
+
+def describe_search_index() -> str:
+    """Describe the search tables for the SQL generation prompt"""
+    lines = [
+        "Bảng tìm kiếm toàn văn FTS5 (không phân biệt hoa thường và dấu; dùng MATCH thay cho LIKE '%...%' "
+        "khi tìm theo tên, mô tả hoặc địa chỉ, viết từ khóa không dấu, đ viết thành d):"
+    ]
+    for name, spec in SEARCH_TABLES.items():
+        lines.append(f"- {name}: {spec['description']}; rowid = {spec['source']}.{spec['key']}")
+    lines.append(
+        "Ví dụ \"có ai tên Dũng\": SELECT * FROM customers WHERE id IN "
+        "(SELECT rowid FROM fts_customers WHERE fts_customers MATCH 'name : dung')"
+    )
+    lines.append("Tìm theo tiền tố: MATCH 'name : dun*'; nhiều từ: MATCH 'name : (\"nguyen\" \"dung\")'")
+    return "\n".join(lines)
+
+
+class SearchIndex:
+    """Accent-insensitive FTS5 indexes over names and descriptions, kept in sync by triggers"""
+
+    def __init__(self, db_path: str = str(BASE_DIR / "Database.db"), timeout: int = 30):
+        self.db_path = db_path
+        self.timeout = timeout
+
+    def _values(self, spec: Dict, row: str) -> List[str]:
+        return [normalise_sql(f"{row}.{source_column}") for source_column in spec["columns"].values()]
+
+    def _trigger_sql(self, table_name: str, spec: Dict, action: str) -> str:
+        """Build the AFTER trigger mirroring one kind of change into the search table"""
+        columns = ", ".join(spec["columns"])
+        delete = f"DELETE FROM {table_name} WHERE rowid = OLD.{spec['key']};"
+        insert = (f"INSERT INTO {table_name}(rowid, {columns}) "
+                  f"VALUES (NEW.{spec['key']}, {', '.join(self._values(spec, 'NEW'))});")
+        statements = {"INSERT": [insert], "DELETE": [delete], "UPDATE": [delete, insert]}[action]
+        event = action
+        if action == "UPDATE":
+            event = f"UPDATE OF {', '.join([spec['key'], *spec['columns'].values()])}"
+
+        body = "\n    ".join(statements)
+        return (
+            f"CREATE TRIGGER trg_{table_name}_{action.lower()} AFTER {event} ON {spec['source']}\n"
+            f"BEGIN\n    {body}\nEND"
+        )
+
+    def ensure(self) -> bool:
+        """Create the search tables and triggers; populate new tables"""
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            cursor = conn.cursor()
+
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            existing = {row[0] for row in cursor.fetchall()}
+
+            created = []
+            for table_name, spec in SEARCH_TABLES.items():
+                if spec["source"] not in existing:
+                    continue
+                if table_name not in existing:
+                    cursor.execute(
+                        f"CREATE VIRTUAL TABLE {table_name} USING fts5("
+                        f"{', '.join(spec['columns'])}, tokenize='{TOKENIZE}', prefix='{PREFIXES}')"
+                    )
+                    created.append(table_name)
+
+                # Triggers are cheap to recreate, so definitions never go stale
+                for action in ("INSERT", "UPDATE", "DELETE"):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table_name}_{action.lower()}")
+                    cursor.execute(self._trigger_sql(table_name, spec, action))
+
+            for table_name in created:
+                self._rebuild(cursor, table_name)
+
+            conn.commit()
+            conn.close()
+            if created:
+                print(f"Created search index tables: {created}")
+            return True
+
+        except Exception as e:
+            print(f"Error ensuring search index: {e}")
+            return False
+
+    def _rebuild(self, cursor: sqlite3.Cursor, table_name: str):
+        """Re-index a whole source table"""
+        spec = SEARCH_TABLES[table_name]
+        cursor.execute(f"DELETE FROM {table_name}")
+        cursor.execute(
+            f"INSERT INTO {table_name}(rowid, {', '.join(spec['columns'])}) "
+            f"SELECT {spec['key']}, {', '.join(self._values(spec, spec['source']))} FROM {spec['source']}"
+        )
+        cursor.execute(f"INSERT INTO {table_name}({table_name}) VALUES ('optimize')")
+
+    def refresh(self) -> Dict[str, int]:
+        """Fully re-index every search table and return their row counts"""
+        counts = {}
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            cursor = conn.cursor()
+            for table_name in SEARCH_TABLES:
+                self._rebuild(cursor, table_name)
+                cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+                counts[table_name] = cursor.fetchone()[0]
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"Error refreshing search index: {e}")
+        return counts
+
+    def lookup(self, table_name: str, text: str, limit: int = 10) -> List[Tuple]:
+        """Id and indexed columns of the source rows whose text contains every word of ``text`` (last word as a prefix)"""
+        spec = SEARCH_TABLES[table_name]
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            cursor = conn.cursor()
+            ids = search(cursor, table_name, text, limit=limit, prefix=True)
+            columns = ", ".join([spec["key"], *spec["columns"].values()])
+            rows = {}
+            if ids:
+                cursor.execute(
+                    f"SELECT {columns} FROM {spec['source']} WHERE {spec['key']} IN ({', '.join('?' * len(ids))})",
+                    ids
+                )
+                rows = {row[0]: row for row in cursor.fetchall()}
+            conn.close()
+            return [rows[row_id] for row_id in ids if row_id in rows]
+        except Exception as e:
+            print(f"Error searching {table_name}: {e}")
+            return []
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create, rebuild or query the accent-insensitive search index")
+    parser.add_argument("--db", default=str(BASE_DIR / "Database.db"), help="Path to the SQLite database")
+    parser.add_argument("--refresh", action="store_true", help="Re-index every table from scratch")
+    parser.add_argument("--search", nargs=2, metavar=("TABLE", "TEXT"), help="e.g. --search fts_customers dung")
+    args = parser.parse_args()
+
+    index = SearchIndex(args.db)
+    index.ensure()
+    if args.refresh:
+        for name, count in index.refresh().items():
+            print(f"{name}: {count} rows")
+    if args.search:
+        for row in index.lookup(*args.search):
+            print(row)
@@ -0,0 +1,173 @@
+import argparse
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import replace
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from config import Config
+from models.chat_history import SessionHistoryStore
+from models.rag_system import OptimizedRAGSystem
+
+# Each worker process builds its own system; the FAISS vectors are memory-mapped
+# (Config.vector_store_mmap) so workers on one host share their pages, while
+# the docstore and models are loaded by every worker.
+_system: Optional[OptimizedRAGSystem] = None
+_sessions: Optional[SessionHistoryStore] = None
+_system_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_metrics = {
+    "requests": 0,
+    "streams": 0,
+    "errors": 0,
+    "latency_ms_total": 0.0,
+    "routes": {"fast_path": 0, "sql": 0, "vector": 0},
+}
+_started = time.time()
+
+
+class AnswerRequest(BaseModel):
+    query: str
+    customer_id: Optional[int] = None
+    session_id: Optional[str] = None
+    save_history: bool = True
+
+
+def get_system() -> OptimizedRAGSystem:
+    """Build the RAG system once per worker process"""
+    global _system, _sessions
+    with _system_lock:
+        if _system is None:
+            # Requests without a session get no history at all
+            config = Config()
+            _system = OptimizedRAGSystem(replace(config, chat_history_file="", chat_history_turns=0))
+            _sessions = SessionHistoryStore(config.session_history_db, max_history=config.chat_history_turns,
+                                            ttl_hours=config.session_history_ttl_hours,
+                                            timeout=config.db_timeout)
+        return _system
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load models and the index before the worker accepts requests
+    get_system()
+    yield
+
+
+app = FastAPI(title="RAG Chatbot API", lifespan=lifespan)
+
+
+def _load_profile(rag: OptimizedRAGSystem, customer_id: Optional[int]):
+    if customer_id is None:
+        return None
+    return rag.profiles.get_profile(customer_id)
+
+
+def _history(rag: OptimizedRAGSystem, request: AnswerRequest):
+    """Conversation of the request's session, else of its customer; anonymous requests share none
+
+    Turns are stored in Config.session_history_db rather than in worker
+    memory, because uvicorn spreads one session's requests over all workers.
+    """
+    if request.session_id:
+        key = f"session:{request.session_id}"
+    elif request.customer_id is not None:
+        key = f"customer:{request.customer_id}"
+    else:
+        return rag.chat_history
+    return _sessions.get(key)
+
+
+def _check_query(request: AnswerRequest):
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+
+
+@app.post("/answer")
+def answer(request: AnswerRequest):
+    _check_query(request)
+    rag = get_system()
+    details = rag.answer_query_details(
+        request.query,
+        customer_profile=_load_profile(rag, request.customer_id),
+        save_history=request.save_history,
+        history=_history(rag, request)
+    )
+    with _metrics_lock:
+        _metrics["requests"] += 1
+        _metrics["latency_ms_total"] += details["latency_ms"]
+        _metrics["errors"] += int(details["error"] is not None)
+        if details["route"]:
+            _metrics["routes"][details["route"]] += 1
+    return details
+
+
+@app.post("/answer/stream")
+def answer_stream(request: AnswerRequest):
+    _check_query(request)
+    rag = get_system()
+    profile = _load_profile(rag, request.customer_id)
+    with _metrics_lock:
+        _metrics["streams"] += 1
+    return StreamingResponse(
+        rag.stream_query(request.query, customer_profile=profile, save_history=request.save_history,
+                         history=_history(rag, request)),
+        media_type="text/plain; charset=utf-8"
+    )
+
+
+@app.get("/health")
+def health():
+    if _system is None:
+        raise HTTPException(status_code=503, detail="RAG system is still loading")
+    vector_store = _system.vector_store
+    if vector_store is None:
+        raise HTTPException(status_code=503, detail="No vector store index is loaded yet")
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "index_version": _system.index_version,
+        "documents": vector_store.index.ntotal if vector_store is not None else 0,
+        "uptime_seconds": round(time.time() - _started, 1)
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    """Counters for this worker process; sum them across workers"""
+    rag = get_system()
+    with _metrics_lock:
+        counters = dict(_metrics, routes=dict(_metrics["routes"]))
+    answered = counters["requests"]
+    counters["mean_latency_ms"] = round(counters["latency_ms_total"] / answered, 1) if answered else 0.0
+    with rag._stats_lock:
+        counters["speculation"] = dict(rag.speculation_stats)
+        counters["escalations"] = rag.escalations
+    if rag.fast_path is not None:
+        counters["fast_path"] = dict(rag.fast_path.stats, intents=dict(rag.fast_path.stats["intents"]),
+                                    hit_rate=round(rag.fast_path.hit_rate(), 3))
+    if rag.reranker is not None:
+        counters["reranker"] = dict(rag.reranker.stats)
+    counters["llm"] = {model: dict(scheduler.stats) for model, scheduler in rag.schedulers.items()}
+    counters["pid"] = os.getpid()
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the RAG system over HTTP")
+    parser.add_argument("--host", default=Config.server_host, help="Interface to bind")
+    parser.add_argument("--port", type=int, default=Config.server_port, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=Config.server_workers, help="Worker processes")
+    args = parser.parse_args()
+
+    uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
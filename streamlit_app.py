@@ -1,11 +1,14 @@
 import streamlit as st
 from models.rag_system import OptimizedRAGSystem
+from models.rag_client import RAGClient
+from models.customer_profile import CustomerProfileService
 from models.face_auth import authenticate_user
 from config import Config
 import os
+import uuid
+from dataclasses import replace
+from pathlib import Path
 from dotenv import load_dotenv
-import sqlite3
-from datetime import datetime
 
 # Set page config - must be the first Streamlit command
 st.set_page_config(
@@ -18,13 +21,17 @@ st.set_page_config(
 # Load environment variables
 load_dotenv()
 
-# Load custom CSS
-def load_css():
-    with open('static/style.css') as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+# Chat messages rendered per window; older ones load on demand
+MESSAGE_WINDOW = 20
+
+# Load custom CSS (read from disk once an hour, not on every rerun)
+@st.cache_data(ttl=3600)
+def load_css() -> str:
+    with open(Path(__file__).parent / "static" / "style.css", encoding="utf-8") as f:
+        return f.read()
 
 # Load CSS
-load_css()
+st.markdown(f'<style>{load_css()}</style>', unsafe_allow_html=True)
 
 # Initialize session state
 if "messages" not in st.session_state:
@@ -33,41 +40,23 @@ if "user_info" not in st.session_state:
     st.session_state.user_info = None
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
-if "system_prompt" not in st.session_state:
-    st.session_state.system_prompt = None
-if "purchase_history" not in st.session_state:
-    st.session_state.purchase_history = None
-
-def get_purchase_history(user_id: int) -> list:
-    """Get purchase history for a user"""
-    try:
-        conn = sqlite3.connect("Database.db")
-        cursor = conn.cursor()
-        
-        query = """
-        SELECT o.Order_date, p.Name, od.Quantity, od.Price, od.Rate
-        FROM Orders o
-        JOIN Order_detail od ON o.Id = od.Order_id
-        JOIN Product p ON od.Product_id = p.Id
-        WHERE o.Customer_id = ?
-        ORDER BY o.Order_date DESC
-        LIMIT 5
-        """
-        
-        cursor.execute(query, (user_id,))
-        results = cursor.fetchall()
-        conn.close()
-        
-        return results
-    except Exception as e:
-        print(f"Error getting purchase history: {e}")
-        return []
-
-# Initialize RAG system
+if "customer_profile" not in st.session_state:
+    st.session_state.customer_profile = None
+if "visible_messages" not in st.session_state:
+    st.session_state.visible_messages = MESSAGE_WINDOW
+if "session_id" not in st.session_state:
+    # One conversation per browser session, so two tabs of one customer keep separate histories
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Initialize RAG system, or a client of server.py when RAG_SERVER_URL is set
 @st.cache_resource
 def get_system():
     config = Config()
-    return OptimizedRAGSystem(config)
+    if config.rag_server_url:
+        return config, RAGClient(config.rag_server_url), CustomerProfileService(config.db_path, config.db_timeout)
+    # A single cached process with no shell to run the index builder, so it may build the first index
+    rag = OptimizedRAGSystem(replace(config, build_missing_index=True))
+    return config, rag, rag.profiles
 
 # Add a logo and title
 col1, col2, col3 = st.columns([1,2,1])
@@ -75,90 +64,112 @@ with col2:
     st.markdown("<h1 class='stTitle'>🤖 RAG Chatbot</h1>", unsafe_allow_html=True)
 
 # Initialize system
-rag_system = get_system()
+config, rag_system, profiles = get_system()
 
 # Authentication section
 if not st.session_state.authenticated:
     # Face authentication
-    user_info = authenticate_user()
+    user_info = authenticate_user(config)
     
     if user_info:
         st.session_state.user_info = user_info
         st.session_state.authenticated = True
         
-        # Get purchase history
-        purchase_history = get_purchase_history(user_info['id'])
-        st.session_state.purchase_history = purchase_history
-        
-        # Set up personalized system prompt
-        purchase_history_text = ""
-        if purchase_history:
-            purchase_history_text = "\nLịch sử mua hàng gần đây:\n"
-            for date, product, quantity, price, rate in purchase_history:
-                purchase_history_text += f"- {date}: {product} (SL: {quantity}, Giá: {price}đ, Đánh giá: {rate}⭐)\n"
-        
-        st.session_state.system_prompt = f"""
-        Bạn đang trò chuyện với khách hàng {user_info['name']} (ID: {user_info['id']}).\n
-        Lịch sử mua hàng gần đây của khách: {purchase_history_text}
-       
-        """
-
-# Main chat interface
-if st.session_state.authenticated:
+        # Build the customer profile once; it is cached until new orders arrive
+        st.session_state.customer_profile = profiles.get_profile(user_info['id'])
+
+# Purchase history shown in the sidebar, cached per customer
+@st.cache_data(ttl=60)
+def get_purchase_history(customer_id: int) -> list:
+    profile = profiles.get_profile(customer_id)
+    return profile.recent_orders if profile else []
+
+# Chat reruns on its own, without re-running the page or the sidebar
+@st.fragment
+def chat_section():
+    messages = st.session_state.messages
+    visible = st.session_state.visible_messages
+    
     # Create a container for chat messages
     chat_container = st.container()
 
-    # Display chat messages
+    # Display the latest messages only; older ones are loaded on request
     with chat_container:
-        for message in st.session_state.messages:
+        if len(messages) > visible:
+            if st.button(f"⬆️ Tải thêm tin nhắn cũ ({len(messages) - visible})"):
+                st.session_state.visible_messages += MESSAGE_WINDOW
+                st.rerun(scope="fragment")
+        for message in messages[-visible:]:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
 
     # Chat input
     if prompt := st.chat_input("Bạn cần tôi giúp gì? 🤔"):
         # Add user message and display immediately
-        with st.chat_message("user"):
-            st.markdown(prompt)
+        with chat_container:
+            with st.chat_message("user"):
+                st.markdown(prompt)
         st.session_state.messages.append({"role": "user", "content": prompt})
 
         # Get bot response
-        with st.chat_message("assistant"):
-            with st.spinner("🤔 Đang xử lý..."):
-                enhanced_prompt = f"{st.session_state.system_prompt}\n\nCâu hỏi của khách hàng: {prompt}"
-                response = rag_system.answer_query(enhanced_prompt)
-                st.markdown(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
+        with chat_container, st.chat_message("assistant"):
+            # Cheap version check; only rebuilds if the customer placed new orders
+            profile = profiles.get_profile(st.session_state.user_info['id'])
+            st.session_state.customer_profile = profile
+            if isinstance(rag_system, RAGClient):
+                # The server builds the profile itself from the customer id
+                try:
+                    response = st.write_stream(rag_system.stream(prompt, customer_id=st.session_state.user_info['id'],
+                                                                      session_id=st.session_state.session_id))
+                except Exception as e:
+                    response = f"Lỗi kết nối máy chủ: {str(e)}"
+                    st.markdown(response)
+            else:
+                with st.spinner("🤔 Đang xử lý..."):
+                    response = rag_system.answer_query(prompt, customer_profile=profile)
+                    st.markdown(response)
+            st.session_state.messages.append({"role": "assistant", "content": response})
+
+# User information and purchase history rerun independently of the chat
+@st.fragment
+def user_sidebar():
+    st.markdown("### 👤 Thông tin người dùng")
+    st.markdown(f"""
+    **Tên:** {st.session_state.user_info['name']}
+    **ID:** {st.session_state.user_info['id']}
+    """)
+    
+    # Display purchase history
+    purchase_history = get_purchase_history(st.session_state.user_info['id'])
+    if purchase_history:
+        st.markdown("### 🛍️ Lịch sử mua hàng")
+        for order in purchase_history:
+            st.markdown(f"""
+            <div class="purchase-history-item">
+                <strong>{order['date']}</strong><br>
+                Sản phẩm: {order['product']}<br>
+                Số lượng: {order['quantity']}<br>
+                Giá: {order['price']}đ<br>
+                Đánh giá: {order['rate']}⭐
+            </div>
+            """, unsafe_allow_html=True)
+    
+    # Add a logout button
+    if st.button("🚪 Đăng xuất"):
+        st.session_state.authenticated = False
+        st.session_state.user_info = None
+        st.session_state.customer_profile = None
+        st.session_state.messages = []
+        st.session_state.visible_messages = MESSAGE_WINDOW
+        st.rerun()
+
+# Main chat interface
+if st.session_state.authenticated:
+    chat_section()
 
     # Sidebar with user information
     with st.sidebar:
-        st.markdown("### 👤 Thông tin người dùng")
-        st.markdown(f"""
-        **Tên:** {st.session_state.user_info['name']}
-        **ID:** {st.session_state.user_info['id']}
-        """)
-        
-        # Display purchase history
-        if st.session_state.purchase_history:
-            st.markdown("### 🛍️ Lịch sử mua hàng")
-            for date, product, quantity, price, rate in st.session_state.purchase_history:
-                st.markdown(f"""
-                <div class="purchase-history-item">
-                    <strong>{date}</strong><br>
-                    Sản phẩm: {product}<br>
-                    Số lượng: {quantity}<br>
-                    Giá: {price}đ<br>
-                    Đánh giá: {rate}⭐
-                </div>
-                """, unsafe_allow_html=True)
-        
-        # Add a logout button
-        if st.button("🚪 Đăng xuất"):
-            st.session_state.authenticated = False
-            st.session_state.user_info = None
-            st.session_state.system_prompt = None
-            st.session_state.purchase_history = None
-            st.session_state.messages = []
-            st.rerun()
+        user_sidebar()
 
 # Enhanced sidebar with better styling
 with st.sidebar:
@@ -0,0 +1,21 @@
+from models.chat_history import SessionHistoryStore
+
+
+def test_workers_share_session_turns(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    # Two stores on one file stand in for two server workers
+    first, second = SessionHistoryStore(path), SessionHistoryStore(path)
+    first.get("session:a").add_chat("Xin chào", "Chào bạn")
+    second.get("session:a").add_chat("Giờ mở cửa?", "08:00-22:00")
+
+    history = first.get("session:a").get_history()
+    assert [turn["query"] for turn in history] == ["Xin chào", "Giờ mở cửa?"]
+    assert second.get("session:b").get_recent_history() == ""
+
+
+def test_session_keeps_last_turns(tmp_path):
+    store = SessionHistoryStore(str(tmp_path / "sessions.db"), max_history=2)
+    history = store.get("session:a")
+    for turn in range(4):
+        history.add_chat(f"q{turn}", f"a{turn}")
+    assert [turn["query"] for turn in history.get_history()] == ["q2", "q3"]
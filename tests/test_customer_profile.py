@@ -0,0 +1,89 @@
+import sqlite3
+
+from models.customer_profile import CustomerProfileService
+from models.recommender import Recommender
+
+
+class CountingRecommender:
+    data_version = staticmethod(Recommender.data_version)
+
+    def __init__(self):
+        self.refreshes = 0
+
+    def refresh(self) -> bool:
+        self.refreshes += 1
+        return True
+
+    def recommend(self, customer_id: int, n: int = 5) -> list:
+        return [{"product": f"Gợi ý {self.refreshes}", "prep": "Tall", "price": None}]
+
+
+def make_database(path) -> str:
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE Product (Id INTEGER PRIMARY KEY, Name TEXT, Product_Prep TEXT, Categories_id INTEGER,
+                              Descriptions TEXT, Calories REAL, Dietary_Fibre_g REAL, Sugars_g REAL,
+                              Protein_g REAL, Caffeine_mg REAL, Rating REAL);
+        CREATE TABLE Orders (Id INTEGER PRIMARY KEY, Customer_id INTEGER, Order_date TEXT);
+        CREATE TABLE Order_detail (Order_id INTEGER, Product_id INTEGER, Quantity INTEGER, Price REAL, Rate INTEGER);
+        CREATE TABLE Customer_preferences (Customer_id INTEGER, Preferred_categories TEXT, Max_price REAL);
+        CREATE TABLE Categories (Id INTEGER PRIMARY KEY, Name TEXT);
+        INSERT INTO customers VALUES (1, 'An'), (2, 'Bình');
+        INSERT INTO Product VALUES (1, 'Caffè Latte', 'Tall', 1, '', 190, 0, 17, 12, 150, 4.5),
+                                   (2, 'Caramel Macchiato', 'Tall', 2, '', 240, 0, 32, 10, 150, 4.6);
+        INSERT INTO Customer_preferences VALUES (1, '2', 50000);
+        INSERT INTO Orders VALUES (1, 1, '1/2/2024');
+        INSERT INTO Order_detail VALUES (1, 1, 1, 45000, 5);
+        """
+    )
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def test_cached_profile_is_not_mutated(tmp_path):
+    service = CustomerProfileService(make_database(tmp_path / "db.sqlite"), recommender=CountingRecommender())
+    first = service.get_profile(1)
+    assert first.recommendations
+    assert service._cache[1].recommendations == []
+    assert service.get_profile(1) is not first
+
+
+def test_recommender_refreshed_only_when_orders_change(tmp_path):
+    path = make_database(tmp_path / "db.sqlite")
+    recommender = CountingRecommender()
+    service = CustomerProfileService(path, recommender=recommender)
+    for _ in range(3):
+        service.get_profile(1)
+    assert recommender.refreshes == 1
+
+    # Another customer's order can change customer 1's suggestions
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO Orders VALUES (2, 2, '1/3/2024')")
+    conn.execute("INSERT INTO Order_detail VALUES (2, 1, 2, 45000, 4)")
+    conn.commit()
+    conn.close()
+    service.get_profile(1)
+    assert recommender.refreshes == 2
+
+    # Deleting a line lowers the count without moving the newest rowid
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM Order_detail WHERE Order_id = 1")
+    conn.commit()
+    conn.close()
+    service.get_profile(1)
+    assert recommender.refreshes == 3
+
+
+def test_cached_recommendation_needs_no_database(tmp_path):
+    recommender = Recommender(make_database(tmp_path / "db.sqlite"))
+    recommender.refresh()
+    first = recommender.recommend(1)
+    assert [item["product"] for item in first] == ["Caramel Macchiato"]
+
+    def fail():
+        raise AssertionError("database opened for a cached recommendation")
+    recommender._connect = fail
+    assert recommender.recommend(1) == first
@@ -0,0 +1,49 @@
+import json
+import sqlite3
+
+import pytest
+
+from models import face_index
+from models.face_index import FaceIndex, embedding_version
+
+pytest.importorskip("faiss")
+
+
+def make_database(path) -> str:
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, embedding TEXT)")
+    conn.executemany(
+        "INSERT INTO customers VALUES (?, ?, ?)",
+        [(1, "An", json.dumps([1, 0, 0])), (2, "Bình", json.dumps([0, 1, 0]))]
+    )
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def set_embedding(db_path: str, customer_id: int, vector: list):
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE customers SET embedding = ? WHERE id = ?", (json.dumps(vector), customer_id))
+    conn.commit()
+    conn.close()
+
+
+def test_unchanged_index_loads_without_checksum(tmp_path, monkeypatch):
+    db_path = make_database(tmp_path / "db.sqlite")
+    FaceIndex.load_or_build(str(tmp_path / "index"), db_path)
+
+    def fail(_):
+        raise AssertionError("checksum read on an up-to-date index")
+    monkeypatch.setattr(face_index, "embeddings_checksum", fail)
+    loaded = FaceIndex.load_or_build(str(tmp_path / "index"), db_path)
+    assert loaded.version == embedding_version(db_path)
+
+
+def test_reenrolment_bumps_version_and_rebuilds(tmp_path):
+    db_path = make_database(tmp_path / "db.sqlite")
+    built = FaceIndex.load_or_build(str(tmp_path / "index"), db_path)
+    set_embedding(db_path, 1, [0, 0, 1])
+    assert embedding_version(db_path) != built.version
+
+    reloaded = FaceIndex.load_or_build(str(tmp_path / "index"), db_path)
+    assert reloaded.search([0, 0, 1], k=1)[0]["id"] == 1
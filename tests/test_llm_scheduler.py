@@ -0,0 +1,63 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from models.llm_scheduler import PRIORITY_ANSWER, PRIORITY_ROUTING, LLMScheduler
+from models.llm_stub import StubChatModel
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_retry_delay_from_429_is_honoured():
+    stub = StubChatModel(responder=lambda prompt: "ok", fail_first=1, retry_delay=1)
+    scheduler = LLMScheduler(stub, requests_per_minute=600)
+
+    start = time.monotonic()
+    assert scheduler.invoke("xin chào").content == "ok"
+    elapsed = time.monotonic() - start
+
+    # 1 s advertised by the stub, plus up to 0.25 s of jitter
+    assert 1.0 <= elapsed < 2.0
+    assert stub.calls == 2
+    assert scheduler.stats["rate_limited"] == 1
+
+
+def test_identical_prompts_in_flight_are_coalesced():
+    stub = StubChatModel(responder=lambda prompt: f"answer to {prompt}", latency=0.3)
+    scheduler = LLMScheduler(stub, requests_per_minute=600)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: scheduler.invoke("giờ mở cửa?").content, range(4)))
+
+    assert results == ["answer to giờ mở cửa?"] * 4
+    assert stub.calls == 1
+    assert scheduler.stats["coalesced"] == 3
+
+
+def test_answer_calls_released_before_routing_calls():
+    gate = threading.Event()
+    order = []
+
+    def responder(prompt: str) -> str:
+        if prompt == "blocker":
+            gate.wait(5)
+        order.append(prompt)
+        return prompt
+
+    scheduler = LLMScheduler(StubChatModel(responder=responder), requests_per_minute=600, max_concurrency=1)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        executor.submit(scheduler.invoke, "blocker")
+        wait_until(lambda: scheduler._active == 1)
+        # Routing arrives first, but the answer has the higher priority
+        executor.submit(scheduler.invoke, "route", PRIORITY_ROUTING)
+        wait_until(lambda: len(scheduler._waiting) == 1)
+        executor.submit(scheduler.invoke, "answer", PRIORITY_ANSWER)
+        wait_until(lambda: len(scheduler._waiting) == 2)
+        gate.set()
+
+    assert order == ["blocker", "answer", "route"]
@@ -0,0 +1,38 @@
+from models.reranker import LexicalScorer, Reranker
+
+
+class Doc:
+    def __init__(self, text: str, doc_id: int):
+        self.page_content = text
+        self.metadata = {"table": "Product", "id": doc_id}
+
+
+def candidates(relevant_rank: int, count: int = 20) -> list:
+    """FAISS-ordered candidates with one lexically relevant document at relevant_rank"""
+    docs = [Doc(f"Store {i} giờ mở cửa 08:00-22:00", i) for i in range(count)]
+    docs[relevant_rank] = Doc("Caramel Apple Spice: nước táo nóng với siro caramel", 100)
+    return docs
+
+
+def lexical_reranker(**kwargs) -> Reranker:
+    return Reranker(LexicalScorer(), top_n=3, min_score=0.15, time_budget_ms=1000, rank_weight=0.3, **kwargs)
+
+
+def test_min_score_applies_to_scorer_score_not_rank():
+    # For ranks 0-10 of 20 the FAISS rank term alone reaches min_score, with no shared words
+    kept = lexical_reranker().rerank("caramel macchiato", candidates(relevant_rank=15))
+    texts = [doc.page_content for doc in kept]
+    assert texts == ["Caramel Apple Spice: nước táo nóng với siro caramel"]
+
+
+def test_best_candidate_kept_when_none_pass():
+    kept = lexical_reranker().rerank("trà sữa", candidates(relevant_rank=15))
+    assert len(kept) == 1
+    # Nothing overlaps, so the FAISS order decides which one survives
+    assert kept[0].metadata["id"] == 0
+
+
+def test_rank_orders_documents_that_pass():
+    docs = [Doc("Caramel Macchiato cỡ Tall", 1), Doc("Caramel Macchiato cỡ Grande", 2)]
+    kept = lexical_reranker().rerank("caramel macchiato", docs)
+    assert [doc.metadata["id"] for doc in kept] == [1, 2]
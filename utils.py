@@ -1,14 +1,32 @@
 import json
+import re
 import sqlite3
-from typing import List, Dict, Any, Tuple
+import unicodedata
+from typing import List, Dict, Any, Optional, Tuple
 import base64
 
-def load_table_data(db_path: str) -> List[Dict[str, Any]]:
-    """Load data from all tables in the database"""
+from models.document_templates import DOCUMENT_TEMPLATES, render_document
+
+# Internal and derived tables that are not source data
+SKIPPED_TABLE_PREFIXES = ("sqlite_", "summary_", "fts_")
+
+# Tables without a template are embedded as "column: value" pairs
+GENERIC_TEMPLATE = {"sql": "SELECT rowid AS Id, * FROM {table}"}
+GENERIC_SKIPPED_COLUMNS = ("embedding", "picture", "Link_Image")
+
+def load_table_data(db_path: str, templates: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Load data from all tables in the database as compact documents
+    
+    Each table is rendered with its entry in DOCUMENT_TEMPLATES (or the
+    given overrides); metadata keeps only the table and row id, the full
+    row is fetched on demand with fetch_document_row.
+    """
+    templates = {**DOCUMENT_TEMPLATES, **(templates or {})}
     documents = []
     
     try:
         conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
         # Get all tables in the database
@@ -21,46 +39,36 @@ def load_table_data(db_path: str) -> List[Dict[str, Any]]:
         
         for table in tables:
             table_name = table[0]
+            if table_name.startswith(SKIPPED_TABLE_PREFIXES):
+                continue
             
-            # Get table schema
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = cursor.fetchall()
-            column_names = [col[1] for col in columns]
-            
-            print(f"\nTable: {table_name}")
-            print(f"Columns: {column_names}")
+            spec = templates.get(table_name, GENERIC_TEMPLATE)
+            if spec is None:
+                print(f"\nTable: {table_name} (folded into other documents)")
+                continue
             
-            # Get all data from the table
-            cursor.execute(f"SELECT * FROM {table_name}")
+            # Get the rows to embed, with any joined names
+            sql = spec["sql"].format(table=table_name)
+            cursor.execute(sql)
             rows = cursor.fetchall()
             
+            print(f"\nTable: {table_name}")
             print(f"Number of rows: {len(rows)}")
             
             # Convert each row to a document
             for row in rows:
-                # Create a dictionary of column names and values
-                row_dict = {}
-                for col_name, val in zip(column_names, row):
-                    # Skip specific columns for customers table
-                    if table_name == "customers" and col_name in ["embedding", "picture"]:
-                        continue
-                    row_dict[col_name] = val
-                
-                # Create content string with all information
-                content = f"Bảng {table_name}: " + ", ".join([
-                    f"{k}: {v}" for k, v in row_dict.items()
-                ])
-                
-                # Create metadata
-                metadata = {
-                    "table": table_name,
-                    "columns": list(row_dict.keys()),
-                    "data": row_dict
-                }
+                row_dict = dict(row)
+                if spec is GENERIC_TEMPLATE:
+                    content = f"Bảng {table_name}: " + ", ".join([
+                        f"{k}: {v}" for k, v in row_dict.items()
+                        if k != "Id" and k not in GENERIC_SKIPPED_COLUMNS
+                    ])
+                else:
+                    content = render_document(spec["template"], row_dict)
                 
                 documents.append({
                     "content": content,
-                    "metadata": metadata
+                    "metadata": {"table": table_name, "id": row_dict["Id"]}
                 })
         
         print("\n=== Summary ===")
@@ -74,6 +82,28 @@ def load_table_data(db_path: str) -> List[Dict[str, Any]]:
         print(f"Error loading table data: {e}")
         return []
 
+def fetch_document_row(db_path: str, metadata: Dict[str, Any],
+                       templates: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Fetch the full source row for a vector store document"""
+    templates = {**DOCUMENT_TEMPLATES, **(templates or {})}
+    table_name = metadata.get("table")
+    spec = templates.get(table_name) or GENERIC_TEMPLATE
+    source_table, key_column = spec.get("source", (table_name, "rowid"))
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        row = conn.execute(
+            f"SELECT * FROM {source_table} WHERE {key_column} = ?",
+            (metadata.get("id"),)
+        ).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return {k: v for k, v in dict(row).items() if k not in GENERIC_SKIPPED_COLUMNS}
+    except Exception as e:
+        print(f"Error fetching document row: {e}")
+        return None
+
 def create_document_content(table_name: str, columns: List[str], row: Tuple) -> str:
     """Create a text representation of a database row"""
     content = [f"Table: {table_name}"]
@@ -128,6 +158,72 @@ def format_sql_results(results: List[Dict[str, Any]]) -> str:
     
     return "\n".join(formatted_results)
 
+def clean_sql_query(text: str) -> str:
+    """Strip Markdown code fences and trailing semicolons from LLM generated SQL"""
+    query = text.strip()
+    if query.startswith("```"):
+        query = query.strip("`")
+        if query.lower().startswith("sql"):
+            query = query[3:]
+    return query.strip().rstrip(";").strip()
+
+def parse_route_decision(text: str) -> Dict[str, Any]:
+    """Parse and validate the combined routing JSON: {"route": "sql"|"vector", "sql": str|null}
+    
+    Raises ValueError describing the first problem found.
+    """
+    body = text.strip()
+    if body.startswith("```"):
+        body = body.strip("`")
+        if body.lower().startswith("json"):
+            body = body[4:]
+    # Tolerate prose around the object
+    start, end = body.find("{"), body.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("no JSON object found")
+    try:
+        decision = json.loads(body[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"malformed JSON: {e}")
+    
+    if not isinstance(decision, dict):
+        raise ValueError("decision is not an object")
+    route = str(decision.get("route", "")).strip().lower()
+    if route not in ("sql", "vector"):
+        raise ValueError(f"route must be 'sql' or 'vector', got {decision.get('route')!r}")
+    
+    sql = decision.get("sql")
+    if route == "sql":
+        if not isinstance(sql, str) or not sql.strip():
+            raise ValueError("route 'sql' requires a non-empty 'sql' string")
+        sql = clean_sql_query(sql)
+        if not validate_sql_query(sql):
+            raise ValueError("sql is not a valid SELECT query")
+    else:
+        sql = None
+    return {"route": route, "sql": sql}
+
+def fold_vietnamese(text: str) -> str:
+    """Lowercase and strip Vietnamese diacritics ("Đồ uống" -> "do uong") for lexical matching"""
+    text = unicodedata.normalize("NFD", (text or "").lower()).replace("đ", "d")
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+def validate_response(text: str) -> bool:
+    """Cheap checks that a generated answer is usable before showing it"""
+    answer = (text or "").strip()
+    if not answer:
+        return False
+    # Routing-style or empty-value replies instead of an answer
+    if answer.lower() in ("true", "false", "none", "null"):
+        return False
+    # Leaked SQL instead of a natural language answer
+    if "```sql" in answer.lower() or re.match(r"select\b.+\bfrom\b", answer, re.IGNORECASE | re.DOTALL):
+        return False
+    # Unterminated code block means the output was cut off
+    if answer.count("```") % 2:
+        return False
+    return True
+
 def validate_sql_query(query: str) -> bool:
     """Validate SQL query"""
     try: